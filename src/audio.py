@@ -0,0 +1,295 @@
+import logging
+import os
+import time
+from typing import Any, BinaryIO, Optional, Sequence, Union
+
+AUDIO_BACKEND_ENV: str = "PLAYER_AUDIO_BACKEND"
+BUFFER_CHANNELS: int = 2  # mixer channels reserved for crossfade buffers
+
+Source = Union[str, BinaryIO]
+
+class AudioError(Exception):
+  """Raised when the audio backend fails to load or play a track."""
+
+class AudioBackend:
+  """Interface the player uses to drive a single music stream.
+
+  Backends initialize their device lazily, on the first call that needs it,
+  so constructing a Player never touches the audio hardware.
+  """
+
+  def load(self, source: Source, namehint: str = "") -> None:
+    raise NotImplementedError
+
+  def queue(self, source: Source, namehint: str = "") -> None:
+    raise NotImplementedError
+
+  def play(self, start: float = 0.0) -> None:
+    raise NotImplementedError
+
+  def stop(self) -> None:
+    raise NotImplementedError
+
+  def pause(self) -> None:
+    raise NotImplementedError
+
+  def unpause(self) -> None:
+    raise NotImplementedError
+
+  def set_volume(self, volume: float) -> None:
+    raise NotImplementedError
+
+  def set_pos(self, seconds: float) -> None:
+    raise NotImplementedError
+
+  def get_pos(self) -> int:
+    """Milliseconds played since the last play(), or -1 when idle."""
+    raise NotImplementedError
+
+  def get_busy(self) -> bool:
+    raise NotImplementedError
+
+  def poll_end_events(self) -> int:
+    """Number of end-of-track events since the last poll."""
+    raise NotImplementedError
+
+  def discard_end_events(self) -> None:
+    raise NotImplementedError
+
+  def mix_format(self) -> tuple[int, int]:
+    """(sample rate, channel count) that buffers passed to play_buffers must use."""
+    raise NotImplementedError
+
+  def play_buffers(self, buffers: Sequence[Any]) -> None:
+    """Start float32 sample arrays of shape (frames, channels) together, one per mixer channel."""
+    raise NotImplementedError
+
+  def stop_buffers(self) -> None:
+    raise NotImplementedError
+
+  def close(self) -> None:
+    pass
+
+class PygameBackend(AudioBackend):
+  """pygame.mixer.music backend; pygame is imported and initialized on first use."""
+
+  def __init__(self) -> None:
+    self._pygame = None
+    self._volume: float = 1.0
+    self._end_event: Optional[int] = None
+
+  @property
+  def initialized(self) -> bool:
+    return self._pygame is not None
+
+  def _mixer(self):
+    if self._pygame is None:
+      import pygame
+      try:
+        pygame.mixer.init()
+        logging.info("Pygame mixer initialized successfully.")
+      except pygame.error as e:
+        logging.critical(f"Error initializing pygame mixer: {e}")
+        raise AudioError(f"Failed to initialize pygame mixer: {e}") from e
+      self._end_event = pygame.USEREVENT + 1
+      pygame.mixer.music.set_endevent(self._end_event)
+      pygame.mixer.set_reserved(BUFFER_CHANNELS)
+      pygame.mixer.music.set_volume(self._volume)
+      self._pygame = pygame
+    return self._pygame.mixer
+
+  def _events(self):
+    """pygame's event queue, restricted to our end event."""
+    pygame = self._pygame
+    if not pygame.display.get_init():
+      pygame.display.init()
+      pygame.event.set_blocked(None)
+      pygame.event.set_allowed(self._end_event)
+    return pygame.event
+
+  def _call(self, name: str, *args, **kwargs):
+    mixer = self._mixer()
+    try:
+      return getattr(mixer.music, name)(*args, **kwargs)
+    except self._pygame.error as e:
+      raise AudioError(str(e)) from e
+
+  def load(self, source: Source, namehint: str = "") -> None:
+    self._call("load", source, namehint)
+
+  def queue(self, source: Source, namehint: str = "") -> None:
+    self._call("queue", source, namehint)
+
+  def play(self, start: float = 0.0) -> None:
+    self._call("play", 0, start)
+
+  def stop(self) -> None:
+    if self.initialized:
+      self._call("stop")
+
+  def pause(self) -> None:
+    if self.initialized:
+      self._call("pause")
+
+  def unpause(self) -> None:
+    if self.initialized:
+      self._call("unpause")
+
+  def set_volume(self, volume: float) -> None:
+    self._volume = volume
+    if self.initialized:
+      self._call("set_volume", volume)
+
+  def set_pos(self, seconds: float) -> None:
+    self._call("set_pos", seconds)
+
+  def get_pos(self) -> int:
+    return self._call("get_pos") if self.initialized else -1
+
+  def get_busy(self) -> bool:
+    return bool(self._call("get_busy")) if self.initialized else False
+
+  def poll_end_events(self) -> int:
+    if not self.initialized:
+      return 0
+    try:
+      return len(self._events().get(self._end_event))
+    except self._pygame.error as e:
+      raise AudioError(str(e)) from e
+
+  def discard_end_events(self) -> None:
+    if not self.initialized:
+      return
+    try:
+      self._events().clear(self._end_event)
+    except self._pygame.error:
+      pass
+
+  def mix_format(self) -> tuple[int, int]:
+    frequency, _, channels = self._mixer().get_init()
+    return frequency, channels
+
+  def play_buffers(self, buffers: Sequence[Any]) -> None:
+    import numpy as np
+    mixer = self._mixer()
+    _, size, _ = mixer.get_init()
+    if size == -16:
+      samples = [(np.clip(buffer, -1.0, 1.0) * 32767).astype(np.int16) for buffer in buffers]
+    elif size == 32:
+      samples = [np.ascontiguousarray(buffer, dtype=np.float32) for buffer in buffers]
+    else:
+      raise AudioError(f"Unsupported mixer sample format: {size}")
+    try:
+      sounds = [mixer.Sound(buffer=data.tobytes()) for data in samples]
+      channels = [mixer.Channel(number) for number in range(len(sounds))]
+      for channel, sound in zip(channels, sounds):
+        channel.play(sound)
+    except self._pygame.error as e:
+      raise AudioError(str(e)) from e
+
+  def stop_buffers(self) -> None:
+    if self.initialized:
+      for number in range(BUFFER_CHANNELS):
+        self._pygame.mixer.Channel(number).stop()
+
+  def close(self) -> None:
+    if self.initialized:
+      self._pygame.mixer.quit()
+      self._pygame = None
+
+class NullBackend(AudioBackend):
+  """In-memory backend that plays nothing; for tests, benchmarks and headless use.
+
+  It keeps the same state a real stream would (loaded track, queue, pause,
+  position by wall clock) but tracks never end on their own; call
+  `finish()` to simulate the end of the current track.
+  """
+
+  def __init__(self) -> None:
+    self.loaded: Optional[Source] = None
+    self.queued: Optional[Source] = None
+    self.volume: float = 1.0
+    self._started: Optional[float] = None
+    self._paused_at: Optional[float] = None
+    self._end_events: int = 0
+    self.buffers: list[Any] = []
+
+  def load(self, source: Source, namehint: str = "") -> None:
+    if self._started is not None:
+      self.stop()
+    self.loaded = source
+
+  def queue(self, source: Source, namehint: str = "") -> None:
+    self.queued = source
+
+  def play(self, start: float = 0.0) -> None:
+    if self.loaded is None:
+      raise AudioError("music not loaded")
+    self._started = time.monotonic()
+    self._paused_at = None
+
+  def stop(self) -> None:
+    if self._started is not None:
+      self._end_events += 1
+    self._started = None
+    self._paused_at = None
+    self.queued = None
+
+  def pause(self) -> None:
+    if self._started is not None and self._paused_at is None:
+      self._paused_at = time.monotonic()
+
+  def unpause(self) -> None:
+    if self._paused_at is not None:
+      self._started += time.monotonic() - self._paused_at
+      self._paused_at = None
+
+  def set_volume(self, volume: float) -> None:
+    self.volume = volume
+
+  def set_pos(self, seconds: float) -> None:
+    if self._started is None:
+      raise AudioError("music not playing")
+
+  def get_pos(self) -> int:
+    if self._started is None:
+      return -1
+    now = self._paused_at if self._paused_at is not None else time.monotonic()
+    return int((now - self._started) * 1000)
+
+  def get_busy(self) -> bool:
+    return self._started is not None and self._paused_at is None
+
+  def finish(self) -> None:
+    """Simulate the current track reaching its end."""
+    self._end_events += 1
+    if self.queued is not None:
+      self.loaded, self.queued = self.queued, None
+      self._started = time.monotonic()
+    else:
+      self._started = None
+
+  def poll_end_events(self) -> int:
+    count, self._end_events = self._end_events, 0
+    return count
+
+  def discard_end_events(self) -> None:
+    self._end_events = 0
+
+  def mix_format(self) -> tuple[int, int]:
+    return 44100, 2
+
+  def play_buffers(self, buffers: Sequence[Any]) -> None:
+    self.buffers = list(buffers)
+
+  def stop_buffers(self) -> None:
+    self.buffers = []
+
+def create_backend(name: Optional[str] = None) -> AudioBackend:
+  """Create the backend named by `name` or $PLAYER_AUDIO_BACKEND ('pygame' or 'null')."""
+  name = (name or os.environ.get(AUDIO_BACKEND_ENV, "pygame")).lower()
+  if name == "null":
+    return NullBackend()
+  if name == "pygame":
+    return PygameBackend()
+  raise ValueError(f"Unknown audio backend: {name}")
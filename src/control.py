@@ -0,0 +1,363 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import stat
+import threading
+from collections import deque
+from typing import Any, Callable, Iterator, Optional
+
+from dedup import DUPLICATE_MODES
+from player import Player
+
+CONTROL_SOCKET: str = "player.sock"
+CONTROL_PORT: int = 47800
+DEFAULT_CONTROL_ADDRESS: str = CONTROL_SOCKET if hasattr(socket, "AF_UNIX") else f"127.0.0.1:{CONTROL_PORT}"
+MAX_REQUEST_BYTES: int = 64 * 1024 * 1024  # one line; a batch of 10k paths is about 1 MB
+MAX_PUSH_BACKLOG: int = 1024 * 1024        # events are dropped for a client this far behind
+EVENTS: tuple[str, ...] = ("state", "track_change", "track_end", "position", "error")
+DEFAULT_EVENTS: tuple[str, ...] = ("state", "track_change", "error")
+
+def parse_address(address: str) -> tuple[str, Optional[int]]:
+  """Split "host:port" into a TCP address; anything else is a Unix socket path with no port."""
+  host, _, port = address.rpartition(":")
+  if host and port.isdigit() and "/" not in address:
+    return host, int(port)
+  return address, None
+
+def status(player: Player) -> dict[str, Any]:
+  """What a remote needs to show the player's state."""
+  return {
+    "playing": player.is_playing,
+    "paused": player.is_paused,
+    "index": player.current_track_index,
+    "path": player.current_track_path,
+    "position": player.get_position(),
+    "duration": player.get_duration(),
+    "volume": player.volume,
+    "shuffle": player.shuffle,
+    "repeat": player.repeat,
+    "playlist": player.playlist_name,
+    "length": len(player.playlist),
+    "queued": len(player.play_next)
+  }
+
+def _index(player: Player, command: dict) -> int:
+  index = int(command["index"])
+  if not 0 <= index < len(player.playlist):
+    raise IndexError(f"No track at index {index}")
+  return index
+
+def run_command(player: Player, command: dict) -> Any:
+  """Run one control command on the thread that owns the player; returns a JSON-ready result."""
+  name = command["cmd"]
+  if name == "ping":
+    return "pong"
+  elif name == "status":
+    return status(player)
+  elif name == "play":
+    if "index" in command:
+      player.play_music(_index(player, command))
+    else:
+      player.play()
+  elif name == "pause":
+    player.pause()
+  elif name == "stop":
+    player.stop()
+  elif name == "next":
+    player.skip()
+  elif name == "seek":
+    player.seek(float(command["seconds"]))
+  elif name == "enqueue":
+    if "path" in command:
+      if not player.queue_file(str(command["path"])):
+        raise ValueError(f"Cannot queue '{command['path']}'")
+    else:
+      player.queue_next(_index(player, command))
+  elif name == "add":
+    duplicates = command.get("duplicates")
+    if duplicates is not None and duplicates not in DUPLICATE_MODES:
+      raise ValueError(f"duplicates must be one of {', '.join(DUPLICATE_MODES)}")
+    return player.add_files([str(path) for path in command["paths"]], duplicates)
+  elif name == "volume":
+    player.set_volume(float(command["level"]))
+  elif name == "shuffle":
+    if bool(command.get("on", not player.shuffle)) != player.shuffle:
+      player.toggle_shuffle()
+  elif name == "repeat":
+    if bool(command.get("on", not player.repeat)) != player.repeat:
+      player.toggle_repeat()
+  elif name == "playlists":
+    return player.playlist_names()
+  elif name == "cache":
+    return player.track_cache.stats()
+  elif name == "playlist":
+    if command["name"] not in player.playlist_names():
+      raise KeyError(f"No playlist named '{command['name']}'")
+    player.switch_playlist(command["name"])
+  else:
+    raise ValueError(f"Unknown command: {name}")
+  return None
+
+class _Connection:
+  """One client: its stream and the player events it subscribed to."""
+
+  def __init__(self, loop: asyncio.AbstractEventLoop, writer: asyncio.StreamWriter) -> None:
+    self.loop = loop
+    self.writer = writer
+    self.subscriptions: dict[str, Callable[[], None]] = {}
+
+  def send(self, message: dict) -> None:
+    """Write one message; call on the event loop."""
+    if not self.writer.is_closing():
+      self.writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+
+  def push(self, message: dict) -> None:
+    """Queue an event from any thread, dropping it if the client is not keeping up."""
+    def send() -> None:
+      if self.writer.transport.get_write_buffer_size() < MAX_PUSH_BACKLOG:
+        self.send(message)
+    try:
+      self.loop.call_soon_threadsafe(send)
+    except RuntimeError:
+      pass  # the server has shut down
+
+  def unsubscribe_all(self) -> None:
+    for unsubscribe in self.subscriptions.values():
+      unsubscribe()
+    self.subscriptions.clear()
+
+class ControlServer:
+  """Line-delimited JSON control API for the player on a Unix socket or localhost TCP port.
+
+  Connections are served by asyncio on a thread of their own. Each request
+  line is one command ({"cmd": "play", "index": 3}) or a batch
+  ({"batch": [...]}) and gets one reply line in order; a batch runs in a
+  single pass and costs one round trip however many commands it holds.
+  Commands never touch the player from the server thread: they are
+  submitted to the player's command queue, which its owner thread (the Tk
+  thread) drains, and the reply is handed back to the event loop.
+  Subscribed player events are pushed to the client as {"event": ...} lines.
+  """
+
+  def __init__(self, player: Player, address: str = DEFAULT_CONTROL_ADDRESS) -> None:
+    self.player = player
+    self.address = address
+    self._host, self._port = parse_address(address)
+    self._loop: Optional[asyncio.AbstractEventLoop] = None
+    self._server: Optional[asyncio.AbstractServer] = None
+    self._thread: Optional[threading.Thread] = None
+    self._tasks: set[asyncio.Task] = set()
+
+  @property
+  def unix(self) -> bool:
+    return self._port is None
+
+  def start(self) -> None:
+    """Start listening; raises OSError if the address cannot be bound."""
+    loop = asyncio.new_event_loop()
+    try:
+      self._server = loop.run_until_complete(self._listen())
+    except BaseException:
+      loop.close()
+      raise
+    self._loop = loop
+    self._thread = threading.Thread(target=self._run, name="control-server", daemon=True)
+    self._thread.start()
+    logging.info(f"Control server listening on {self.address}.")
+
+  async def _listen(self) -> asyncio.AbstractServer:
+    if not self.unix:
+      server = await asyncio.start_server(self._serve, self._host, self._port, limit=MAX_REQUEST_BYTES)
+      self._port = server.sockets[0].getsockname()[1]
+      self.address = f"{self._host}:{self._port}"
+      return server
+    self._remove_stale_socket()
+    server = await asyncio.start_unix_server(self._serve, self._host, limit=MAX_REQUEST_BYTES)
+    os.chmod(self._host, 0o600)
+    return server
+
+  def _remove_stale_socket(self) -> None:
+    """Delete a socket file left by a crashed instance; refuse to take over a live one."""
+    if not os.path.exists(self._host):
+      return
+    if not stat.S_ISSOCK(os.stat(self._host).st_mode):
+      raise OSError(f"'{self._host}' exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      probe.connect(self._host)
+    except OSError:
+      os.unlink(self._host)
+    else:
+      raise OSError(f"Another player is listening on '{self._host}'")
+    finally:
+      probe.close()
+
+  def _run(self) -> None:
+    asyncio.set_event_loop(self._loop)
+    try:
+      self._loop.run_forever()
+    finally:
+      self._loop.close()
+
+  def close(self) -> None:
+    """Stop accepting commands and disconnect every client."""
+    if self._loop is None:
+      return
+    asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+    self._thread.join(timeout=2)
+    self._loop = None
+    if self.unix and os.path.exists(self._host):
+      os.unlink(self._host)
+
+  async def _shutdown(self) -> None:
+    self._server.close()
+    for task in self._tasks:
+      task.cancel()
+    await asyncio.gather(*self._tasks, return_exceptions=True)
+    asyncio.get_running_loop().stop()
+
+  async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    loop = asyncio.get_running_loop()
+    connection = _Connection(loop, writer)
+    task = asyncio.current_task()
+    self._tasks.add(task)
+    try:
+      while True:
+        try:
+          line = await reader.readline()
+        except ValueError:
+          connection.send({"ok": False, "error": f"Request longer than {MAX_REQUEST_BYTES} bytes"})
+          break
+        if not line:
+          break
+        try:
+          request = json.loads(line)
+          if not isinstance(request, dict):
+            raise ValueError("a request must be a JSON object")
+        except ValueError as e:
+          connection.send({"ok": False, "error": f"Bad request: {e}"})
+          continue
+        reply = self.player.commands.submit(self._handle, connection, request)
+        try:
+          message = await asyncio.wrap_future(reply)
+        except Exception as e:
+          logging.error(f"Control request {request!r} failed: {e}", exc_info=True)
+          message = {"ok": False, "error": str(e)}
+          if "id" in request:
+            message["id"] = request["id"]
+        connection.send(message)
+        await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+      pass  # the client went away, or the server is shutting down
+    finally:
+      self._tasks.discard(task)
+      self.player.commands.submit(connection.unsubscribe_all)
+      writer.close()
+
+  def _handle(self, connection: _Connection, request: dict) -> dict:
+    if "batch" in request:
+      commands = request["batch"]
+      if not isinstance(commands, list) or not all(isinstance(command, dict) for command in commands):
+        message = {"ok": False, "error": "Bad request: a batch must be a list of JSON objects"}
+      else:
+        message = {"batch": [self._execute(connection, command) for command in commands]}
+    else:
+      message = self._execute(connection, request)
+    if "id" in request:
+      message["id"] = request["id"]
+    return message
+
+  def _execute(self, connection: _Connection, command: Any) -> dict:
+    try:
+      if not isinstance(command, dict):
+        raise ValueError("a command must be a JSON object")
+      if command.get("cmd") == "subscribe":
+        result = self._subscribe(connection, command.get("events", DEFAULT_EVENTS))
+      elif command.get("cmd") == "unsubscribe":
+        connection.unsubscribe_all()
+        result = None
+      else:
+        result = run_command(self.player, command)
+    except (KeyError, ValueError, TypeError, IndexError) as e:
+      return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    except Exception as e:
+      logging.error(f"Control command {command!r} failed: {e}", exc_info=True)
+      return {"ok": False, "error": str(e)}
+    return {"ok": True, "result": result}
+
+  def _subscribe(self, connection: _Connection, events: list[str]) -> list[str]:
+    unknown = [event for event in events if event not in EVENTS]
+    if unknown:
+      raise ValueError(f"Unknown events: {', '.join(unknown)}")
+    for event in events:
+      if event not in connection.subscriptions:
+        connection.subscriptions[event] = self.player.events.subscribe(
+          event, lambda event=event, **payload: connection.push({"event": event, **payload})
+        )
+    return sorted(connection.subscriptions)
+
+class ControlClient:
+  """Blocking client for ControlServer, used by the `remote.py` command line tool."""
+
+  def __init__(self, address: str = DEFAULT_CONTROL_ADDRESS, timeout: Optional[float] = 10.0) -> None:
+    host, port = parse_address(address)
+    if port is None:
+      self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      self._socket.settimeout(timeout)
+      self._socket.connect(host)
+    else:
+      self._socket = socket.create_connection((host, port), timeout=timeout)
+      self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    self._file = self._socket.makefile("rb")
+    self._next_id = 0
+    self.events: deque[dict] = deque()  # events that arrived while waiting for a reply
+
+  def close(self) -> None:
+    self._file.close()
+    self._socket.close()
+
+  def __enter__(self) -> "ControlClient":
+    return self
+
+  def __exit__(self, *exc_info) -> None:
+    self.close()
+
+  def _read(self) -> dict:
+    line = self._file.readline()
+    if not line:
+      raise ConnectionError("The player closed the connection")
+    return json.loads(line)
+
+  def _request(self, request: dict) -> dict:
+    self._next_id += 1
+    request["id"] = self._next_id
+    self._socket.sendall(json.dumps(request, separators=(",", ":")).encode() + b"\n")
+    while True:
+      message = self._read()
+      if "event" in message:
+        self.events.append(message)
+      elif message.get("id", self._next_id) == self._next_id:
+        return message
+
+  def call(self, cmd: str, **arguments: Any) -> Any:
+    """Run one command and return its result; raises RuntimeError if the player rejected it."""
+    reply = self._request({"cmd": cmd, **arguments})
+    if not reply["ok"]:
+      raise RuntimeError(reply["error"])
+    return reply["result"]
+
+  def batch(self, commands: list[dict]) -> list[dict]:
+    """Run several commands in one round trip; returns a reply ({"ok", "result" or "error"}) per command."""
+    return self._request({"batch": commands})["batch"]
+
+  def listen(self) -> Iterator[dict]:
+    """Yield pushed events as they arrive, after any received while waiting for replies."""
+    self._socket.settimeout(None)
+    while True:
+      while self.events:
+        yield self.events.popleft()
+      message = self._read()
+      if "event" in message:
+        yield message
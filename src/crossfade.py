@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import logging
+import os
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from typing import IO, TYPE_CHECKING, Any, Callable, Optional
+
+from audio import AudioBackend, AudioError, Source
+from loudness import ffmpeg_available
+from state import CommandQueue
+
+if TYPE_CHECKING:
+  import numpy as np
+
+POLL_INTERVAL: float = 0.25   # re-read the position this often while the fade point is far away
+SPIN_WINDOW: float = 0.06     # this close to the fade point, sleep until it instead of re-reading
+SPIN_INTERVAL: float = 0.001
+FEED_CHUNK: int = 64 * 1024
+
+def decode_window(source: Source, start: float, seconds: float, sample_rate: int, channels: int) -> np.ndarray:
+  """Decode `seconds` of audio from `start` to float32 frames of shape (n, channels).
+
+  Only the requested window is decoded, so memory is bounded by the fade
+  length rather than the track length. A file-like source is piped to
+  ffmpeg, which stops reading once the window is decoded.
+  """
+  import numpy as np
+  arguments = [
+    "ffmpeg", "-v", "error", "-ss", f"{max(0.0, start):.3f}", "-t", f"{seconds:.3f}", "-i", source if isinstance(source, str) else "pipe:0",
+    "-f", "f32le", "-ac", str(channels), "-ar", str(sample_rate), "-"
+  ]
+  if isinstance(source, str):
+    output = subprocess.run(arguments, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+  else:
+    with subprocess.Popen(arguments, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+      threading.Thread(target=_feed, args=(source, process.stdin), name="crossfade-feed", daemon=True).start()
+      output = process.stdout.read()
+      if process.wait():
+        raise subprocess.CalledProcessError(process.returncode, arguments)
+  usable = len(output) - len(output) % (4 * channels)
+  return np.frombuffer(output[:usable], dtype=np.float32).reshape(-1, channels)
+
+def _feed(source: IO[bytes], pipe: IO[bytes]) -> None:
+  """Copy a file-like source into ffmpeg's stdin until it ends or ffmpeg stops reading."""
+  try:
+    while chunk := source.read(FEED_CHUNK):
+      pipe.write(chunk)
+  except (OSError, ValueError):
+    pass  # ffmpeg has what it needs and closed the pipe
+  finally:
+    try:
+      pipe.close()
+    except OSError:
+      pass
+    source.close()
+
+def fade_curves(frames: int) -> tuple[np.ndarray, np.ndarray]:
+  """Equal-power fade-out and fade-in gains for an overlap of `frames` samples."""
+  import numpy as np
+  phase = np.linspace(0.0, np.pi / 2, frames, dtype=np.float32)
+  return np.cos(phase), np.sin(phase)
+
+@dataclass
+class Crossfade:
+  """One scheduled transition from the playing track into the next."""
+  track_id: int
+  outgoing: str
+  outgoing_duration: float
+  incoming_source: str
+  seconds: float
+  outgoing_volume: float
+  incoming_volume: float
+  offset: float = 0.0  # where the incoming stream picks up once the overlap ends
+
+class CrossfadeEngine:
+  """Mixes the end of one track into the start of the next on two mixer channels.
+
+  For each transition a worker thread decodes only the overlap window of
+  both tracks, the incoming one through the read-ahead cache, and
+  multiplies them by precomputed equal-power gain curves. The worker itself
+  starts the overlap once the outgoing track reaches the fade point and,
+  when the overlap has played, continues the incoming track on the music
+  stream from the matching offset, so the fade timing does not depend on
+  how busy the Tk loop is. Mixer calls and transition state are guarded by
+  `_lock`; the command queue is only used to have the owner thread publish
+  the new state, and the Tk thread picks up the finished transition with
+  `collect()`.
+  """
+
+  def __init__(self, audio: AudioBackend, position: Callable[[], float], commands: CommandQueue, open_track: Callable[[str], Source]) -> None:
+    self.audio = audio
+    self.position = position
+    self.commands = commands
+    self.open_track = open_track
+    self._pending: Optional[Crossfade] = None
+    self._finished: Optional[Crossfade] = None
+    self._cancelled = threading.Event()
+    self._lock = threading.Lock()
+    self._overlap_started: Optional[float] = None
+    self._fade_point: float = 0.0
+
+  @property
+  def available(self) -> bool:
+    return ffmpeg_available()
+
+  @property
+  def overlapping(self) -> bool:
+    """True while both buffers are playing and the music stream is stopped."""
+    with self._lock:
+      return self._overlap_started is not None
+
+  @property
+  def busy(self) -> bool:
+    """True from the fade point until the Tk thread has collected the finished transition."""
+    with self._lock:
+      return self._overlap_started is not None or self._finished is not None
+
+  @property
+  def scheduled(self) -> Optional[Crossfade]:
+    return self._pending
+
+  def schedule(self, crossfade: Crossfade) -> None:
+    """Replace any pending transition with a new one."""
+    self.cancel()
+    try:
+      sample_rate, channels = self.audio.mix_format()
+    except AudioError as e:
+      logging.error(f"Cannot prepare crossfade: {e}")
+      return
+    cancelled = threading.Event()
+    with self._lock:
+      self._pending = crossfade
+      self._cancelled = cancelled
+    threading.Thread(target=self._run, args=(crossfade, cancelled, sample_rate, channels), name="crossfade", daemon=True).start()
+
+  def cancel(self) -> None:
+    """Abandon the pending transition, silencing the overlap if it already started."""
+    with self._lock:
+      self._cancelled.set()
+      self._pending = None
+      self._finished = None
+      if self._overlap_started is not None:
+        self._overlap_started = None
+        self.audio.stop_buffers()
+
+  def complete(self) -> None:
+    """Cut a running overlap short and continue the incoming track from where the overlap was."""
+    with self._lock:
+      crossfade = self._pending
+      if self._overlap_started is None or crossfade is None:
+        return
+      crossfade.offset = time.perf_counter() - self._overlap_started
+      self._cancelled.set()
+      self._switch(crossfade)
+
+  def collect(self) -> tuple[bool, Optional[Crossfade]]:
+    """(busy, finished transition) read atomically; the finished transition is handed over once."""
+    with self._lock:
+      busy = self._overlap_started is not None or self._finished is not None
+      finished, self._finished = self._finished, None
+      return busy, finished
+
+  def overlap_position(self) -> Optional[float]:
+    """Position in the outgoing track while the overlap plays, else None."""
+    with self._lock:
+      if self._overlap_started is None:
+        return None
+      return self._fade_point + time.perf_counter() - self._overlap_started
+
+  def _switch(self, crossfade: Crossfade) -> None:
+    """Hand over from the buffers to the music stream; called with the lock held."""
+    self._overlap_started = None
+    self._pending = None
+    self.audio.stop_buffers()
+    try:
+      self.audio.load(self.open_track(crossfade.incoming_source), namehint=os.path.splitext(crossfade.incoming_source)[1])
+      self.audio.set_volume(crossfade.incoming_volume)
+      self.audio.play(crossfade.offset)
+    except AudioError as e:
+      logging.error(f"Crossfade into '{crossfade.incoming_source}' failed: {e}")
+    self._finished = crossfade
+
+  def _start(self, crossfade: Crossfade, cancelled: threading.Event, fade_point: float, buffers: list[Any]) -> bool:
+    """Stop the outgoing stream and play the overlap; False if the transition was cancelled or could not start."""
+    with self._lock:
+      if cancelled.is_set():
+        return False
+      try:
+        self.audio.stop()
+        self.audio.play_buffers(buffers)
+      except AudioError as e:
+        logging.error(f"Cannot start crossfade: {e}")
+        self._pending = None
+        return False
+      self._fade_point = fade_point
+      self._overlap_started = time.perf_counter()
+    logging.info(f"Crossfading into '{crossfade.incoming_source}' over {crossfade.offset:.2f}s.")
+    return True
+
+  def _end(self, crossfade: Crossfade, cancelled: threading.Event) -> None:
+    with self._lock:
+      if not cancelled.is_set() and self._overlap_started is not None:
+        self._switch(crossfade)
+
+  def _abandon(self, cancelled: threading.Event) -> None:
+    """Forget a transition that cannot be prepared, unless a newer one has replaced it."""
+    with self._lock:
+      if not cancelled.is_set():
+        self._pending = None
+
+  def _publish(self) -> None:
+    """Have the owner thread publish the player's state after the mixer changed under it."""
+    self.commands.submit(lambda: None)
+
+  def _run(self, crossfade: Crossfade, cancelled: threading.Event, sample_rate: int, channels: int) -> None:
+    import numpy as np
+    try:
+      tail = decode_window(crossfade.outgoing, crossfade.outgoing_duration - crossfade.seconds, crossfade.seconds, sample_rate, channels)
+      head = decode_window(self.open_track(crossfade.incoming_source), 0.0, crossfade.seconds, sample_rate, channels)
+    except (OSError, subprocess.CalledProcessError) as e:
+      logging.error(f"Cannot prepare crossfade: {e}")
+      self._abandon(cancelled)
+      return
+    frames = min(len(tail), len(head))
+    if frames == 0:
+      logging.error(f"Cannot prepare crossfade: nothing decoded from '{crossfade.outgoing}' or '{crossfade.incoming_source}'")
+      self._abandon(cancelled)
+      return
+    fade_out, fade_in = fade_curves(frames)
+    tail = tail[-frames:] * (fade_out * crossfade.outgoing_volume)[:, np.newaxis]
+    head = head[:frames] * (fade_in * crossfade.incoming_volume)[:, np.newaxis]
+    overlap = frames / sample_rate
+    crossfade.offset = overlap
+    fade_point = crossfade.outgoing_duration - overlap
+    while not cancelled.is_set():
+      remaining = fade_point - self.position()
+      if remaining <= SPIN_INTERVAL:
+        break
+      cancelled.wait(remaining if remaining < SPIN_WINDOW else min(POLL_INTERVAL, remaining - SPIN_WINDOW / 2))
+    if not self._start(crossfade, cancelled, fade_point, [tail, head]):
+      return
+    self._publish()
+    started = time.perf_counter()
+    while not cancelled.is_set():
+      remaining = started + overlap - time.perf_counter()
+      if remaining <= 0:
+        break
+      cancelled.wait(SPIN_INTERVAL if remaining < SPIN_WINDOW else remaining - SPIN_WINDOW / 2)
+    if not cancelled.is_set():
+      self._end(crossfade, cancelled)
+      self._publish()
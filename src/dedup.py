@@ -0,0 +1,314 @@
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import subprocess
+import threading
+from collections import defaultdict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, replace
+from typing import Callable, Iterable, Optional
+
+from instrumentation import metrics
+from metadata import MetadataCache
+
+HASH_FILE: str = "hashes.db"
+PARTIAL_BLOCK: int = 16 * 1024  # hashed at the start, middle and end of a file
+HASH_CHUNK: int = 1024 * 1024
+
+DUPLICATES_KEEP: str = "keep"
+DUPLICATES_SKIP: str = "skip"
+DUPLICATES_MERGE: str = "merge"
+DUPLICATE_MODES: tuple[str, ...] = (DUPLICATES_SKIP, DUPLICATES_MERGE, DUPLICATES_KEEP)
+
+def partial_hash(path: str, size: int) -> str:
+  """Hash of the size and three small blocks of a file: its start, middle and end."""
+  digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+  with open(path, "rb") as file:
+    for offset in sorted({0, max(0, size // 2 - PARTIAL_BLOCK // 2), max(0, size - PARTIAL_BLOCK)}):
+      file.seek(offset)
+      digest.update(file.read(PARTIAL_BLOCK))
+  return digest.hexdigest()
+
+def content_hash(path: str) -> str:
+  """Hash of a track's decoded audio, or of the whole file if ffmpeg cannot decode it; runs in a worker process."""
+  if shutil.which("ffmpeg") is not None:
+    digest = hashlib.blake2b(digest_size=16)
+    decoded = 0
+    command = ["ffmpeg", "-v", "error", "-nostdin", "-i", path, "-map", "0:a:0", "-f", "s16le", "-"]
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+      for chunk in iter(lambda: process.stdout.read(HASH_CHUNK), b""):
+        digest.update(chunk)
+        decoded += len(chunk)
+    if process.returncode == 0 and decoded:
+      return f"pcm:{digest.hexdigest()}"
+  digest = hashlib.blake2b(digest_size=16)
+  with open(path, "rb") as file:
+    for chunk in iter(lambda: file.read(HASH_CHUNK), b""):
+      digest.update(chunk)
+  return f"file:{digest.hexdigest()}"
+
+@dataclass(frozen=True)
+class Fingerprint:
+  """Hashes of one version of a file, filled in as they are needed."""
+  mtime_ns: int
+  size: int
+  partial: Optional[str] = None
+  content: Optional[str] = None
+
+class HashCache:
+  """Fingerprints by path, persisted in SQLite and invalidated on (mtime, size) change.
+
+  Read on first use and written after each check; only the duplicate
+  finder's thread uses it.
+  """
+
+  def __init__(self, db_path: str = HASH_FILE) -> None:
+    self.db_path = db_path
+    self._entries: Optional[dict[str, Fingerprint]] = None
+    self._dirty: dict[str, Fingerprint] = {}
+
+  def _connect(self) -> sqlite3.Connection:
+    connection = sqlite3.connect(self.db_path)
+    connection.execute(
+      "CREATE TABLE IF NOT EXISTS fingerprints ("
+      "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, partial TEXT, content TEXT)"
+    )
+    return connection
+
+  @property
+  def entries(self) -> dict[str, Fingerprint]:
+    if self._entries is None:
+      self._entries = {}
+      try:
+        connection = self._connect()
+        try:
+          for path, *row in connection.execute("SELECT path, mtime_ns, size, partial, content FROM fingerprints"):
+            self._entries[path] = Fingerprint(*row)
+        finally:
+          connection.close()
+      except sqlite3.Error as e:
+        logging.error(f"Error loading file hashes: {e}")
+    return self._entries
+
+  def peek(self, path: str) -> Optional[Fingerprint]:
+    """The cached fingerprint without checking the file."""
+    return self.entries.get(path)
+
+  def get(self, path: str, stat: os.stat_result) -> Fingerprint:
+    """The cached fingerprint if the file is unchanged, else an empty one for its current version."""
+    entry = self.entries.get(path)
+    if entry is None or entry.mtime_ns != stat.st_mtime_ns or entry.size != stat.st_size:
+      entry = Fingerprint(stat.st_mtime_ns, stat.st_size)
+    return entry
+
+  def put(self, path: str, entry: Fingerprint) -> None:
+    self.entries[path] = entry
+    self._dirty[path] = entry
+
+  def flush(self) -> None:
+    """Write new hashes to disk."""
+    if not self._dirty:
+      return
+    dirty, self._dirty = self._dirty, {}
+    try:
+      connection = self._connect()
+      try:
+        with connection:
+          connection.executemany(
+            "INSERT OR REPLACE INTO fingerprints (path, mtime_ns, size, partial, content) VALUES (?, ?, ?, ?, ?)",
+            [(path, entry.mtime_ns, entry.size, entry.partial, entry.content) for path, entry in dirty.items()]
+          )
+      finally:
+        connection.close()
+    except sqlite3.Error as e:
+      logging.error(f"Error saving file hashes: {e}")
+
+@dataclass
+class ImportCheck:
+  """Outcome of checking one batch of imported files, in the order they were given."""
+  sequence: int
+  added: list[str] = field(default_factory=list)
+  duplicates: list[tuple[str, str]] = field(default_factory=list)  # (imported path, track it duplicates)
+
+class DuplicateFinder:
+  """Checks imported files against a playlist's tracks and each other, cheapest test first.
+
+  Paths already present are dropped at once. Otherwise files are compared
+  by size and, only when sizes match, by a hash of three small blocks;
+  matches there are confirmed by hashing the decoded audio in a process
+  pool. Sizes come from the metadata cache where the file was probed, so a
+  100k-file import costs at most a stat per file, and whole files are read
+  only for likely duplicates. Hashes are cached per file.
+
+  Checks run one at a time on a background thread, in the order they were
+  asked for, and each sees the files accepted by the ones before it.
+  """
+
+  def __init__(self, metadata: MetadataCache, db_path: str = HASH_FILE, max_workers: Optional[int] = None) -> None:
+    self.metadata = metadata
+    self.hashes = HashCache(db_path)
+    self.max_workers = max_workers or max(1, (os.cpu_count() or 2) // 2)
+    self._sequence: int = 0
+    self._pending: int = 0
+    self._lock = threading.Lock()
+    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dedup")
+    self._pool: Optional[ProcessPoolExecutor] = None
+    # The index of accepted tracks; only the dedup thread touches it.
+    self._paths: set[str] = set()
+    self._sizes: defaultdict[int, list[str]] = defaultdict(list)
+    self._reports: list[ImportCheck] = []
+
+  @property
+  def busy(self) -> bool:
+    """True while checks are queued or running."""
+    with self._lock:
+      return self._pending > 0
+
+  def check(self, paths: list[str], on_done: Callable[[ImportCheck], object], snapshot: Optional[Iterable[str]] = None, applied: int = 0) -> int:
+    """Queue files to be checked; `on_done` gets the result on the dedup thread. Returns the check's sequence number.
+
+    With a snapshot of the playlist the index is rebuilt from it, adding back
+    the files of checks numbered above `applied`, the last one the caller
+    has acted on.
+    """
+    with self._lock:
+      self._sequence += 1
+      self._pending += 1
+      sequence = self._sequence
+    self._executor.submit(self._run, sequence, paths, on_done, snapshot, applied)
+    return sequence
+
+  def close(self) -> None:
+    self._executor.shutdown(wait=False, cancel_futures=True)
+    if self._pool is not None:
+      self._pool.shutdown(wait=False, cancel_futures=True)
+
+  def _run(self, sequence: int, paths: list[str], on_done: Callable[[ImportCheck], object], snapshot: Optional[Iterable[str]], applied: int) -> None:
+    try:
+      try:
+        self._reports = [report for report in self._reports if report.sequence > applied]
+        if snapshot is not None:
+          self._rebuild(snapshot)
+        report = self._check(sequence, paths)
+      except Exception as e:
+        logging.error(f"Duplicate check failed; adding {len(paths)} files unchecked: {e}", exc_info=True)
+        report = ImportCheck(sequence, added=list(dict.fromkeys(paths)))
+      self._reports.append(report)
+      self.hashes.flush()
+      on_done(report)
+    finally:
+      with self._lock:
+        self._pending -= 1
+
+  def _rebuild(self, snapshot: Iterable[str]) -> None:
+    """Index a playlist's tracks by size, from cached sizes where possible."""
+    self._paths.clear()
+    self._sizes.clear()
+    for path in snapshot:
+      self._index(path, self._size_of(path))
+    for report in self._reports:
+      for path in report.added:
+        self._index(path, self._size_of(path))
+
+  def _size_of(self, path: str, stats: Optional[dict[str, Optional[os.stat_result]]] = None) -> Optional[int]:
+    """A file's size as last probed or hashed, so most files need no stat; sizes that match are checked against the file."""
+    entry = self.metadata.peek(path) or self.hashes.peek(path)
+    if entry is not None:
+      return entry.size
+    stat = self._stat(path, {} if stats is None else stats)
+    return None if stat is None else stat.st_size
+
+  def _index(self, path: str, size: Optional[int]) -> None:
+    if path in self._paths:
+      return
+    self._paths.add(path)
+    if size:
+      self._sizes[size].append(path)
+
+  def _check(self, sequence: int, paths: list[str]) -> ImportCheck:
+    report = ImportCheck(sequence)
+    stats: dict[str, Optional[os.stat_result]] = {}
+    sizes: dict[str, Optional[int]] = {}
+    candidates: dict[str, list[str]] = {}
+    batch_sizes: defaultdict[int, list[str]] = defaultdict(list)
+    for path in dict.fromkeys(paths):
+      if path in self._paths:
+        report.duplicates.append((path, path))
+        continue
+      size = sizes[path] = self._size_of(path, stats)
+      if not size:
+        continue  # unreadable or empty: nothing to compare, so it is added
+      same_size = self._sizes.get(size, []) + batch_sizes[size]
+      batch_sizes[size].append(path)
+      if not same_size:
+        continue
+      partial = self._fingerprint(path, stats, partial=True)
+      if partial is None:
+        continue
+      matches = [other for other in same_size if (entry := self._fingerprint(other, stats, partial=True)) is not None and entry.partial == partial.partial]
+      if matches:
+        candidates[path] = matches
+    metrics.count("dedup.files_checked", len(sizes))
+    contents = self._contents({other for path, matches in candidates.items() for other in (path, *matches)}, stats)
+    originals: dict[str, str] = {}
+    for path in sizes:
+      content = contents.get(path)
+      original = next((other for other in candidates.get(path, ()) if content is not None and contents.get(other) == content), None)
+      if original is not None:
+        originals[path] = original = originals.get(original, original)
+        report.duplicates.append((path, original))
+        continue
+      report.added.append(path)
+      self._index(path, sizes[path])
+    return report
+
+  def _stat(self, path: str, stats: dict[str, Optional[os.stat_result]]) -> Optional[os.stat_result]:
+    if path not in stats:
+      try:
+        stats[path] = os.stat(path)
+      except OSError:
+        stats[path] = None
+    return stats[path]
+
+  def _fingerprint(self, path: str, stats: dict[str, Optional[os.stat_result]], partial: bool = False) -> Optional[Fingerprint]:
+    """A file's current fingerprint, with its partial hash computed if asked for; None if it cannot be read."""
+    stat = self._stat(path, stats)
+    if stat is None:
+      return None
+    entry = self.hashes.get(path, stat)
+    if partial and entry.partial is None:
+      try:
+        entry = replace(entry, partial=partial_hash(path, stat.st_size))
+      except OSError as e:
+        logging.error(f"Cannot hash '{path}': {e}")
+        return None
+      self.hashes.put(path, entry)
+      metrics.count("dedup.partial_hashes")
+    return entry
+
+  def _contents(self, paths: set[str], stats: dict[str, Optional[os.stat_result]]) -> dict[str, str]:
+    """Audio hashes of files, computing the uncached ones in parallel."""
+    contents: dict[str, str] = {}
+    futures: dict[Future, tuple[str, Fingerprint]] = {}
+    for path in paths:
+      entry = self._fingerprint(path, stats)
+      if entry is None:
+        continue
+      if entry.content is not None:
+        contents[path] = entry.content
+        continue
+      if self._pool is None:
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+      futures[self._pool.submit(content_hash, path)] = (path, entry)
+    wait(futures)
+    for future, (path, entry) in futures.items():
+      try:
+        contents[path] = future.result()
+      except Exception as e:
+        logging.error(f"Cannot hash the audio of '{path}': {e}")
+        continue
+      self.hashes.put(path, replace(entry, content=contents[path]))
+      metrics.count("dedup.content_hashes")
+    return contents
@@ -0,0 +1,26 @@
+import logging
+from collections import defaultdict
+from typing import Any, Callable
+
+class EventBus:
+  """Minimal publish/subscribe hub for player events."""
+
+  def __init__(self) -> None:
+    self._subscribers: defaultdict[str, list[Callable[..., Any]]] = defaultdict(list)
+
+  def subscribe(self, event: str, callback: Callable[..., Any]) -> Callable[[], None]:
+    """Register a callback for an event; returns a function that unsubscribes it."""
+    self._subscribers[event].append(callback)
+
+    def unsubscribe() -> None:
+      if callback in self._subscribers[event]:
+        self._subscribers[event].remove(callback)
+    return unsubscribe
+
+  def publish(self, event: str, **payload: Any) -> None:
+    """Call every subscriber of an event, isolating their failures."""
+    for callback in list(self._subscribers.get(event, ())):
+      try:
+        callback(**payload)
+      except Exception as e:
+        logging.error(f"Error in '{event}' subscriber: {e}", exc_info=True)
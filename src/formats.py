@@ -0,0 +1,272 @@
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Optional
+
+HEADER_BYTES: int = 36
+TRANSCODE_DIR: str = "transcode_cache"
+TRANSCODE_EXTENSION: str = ".ogg"
+TRANSCODE_CACHE_BYTES: int = 2 * 1024 * 1024 * 1024
+
+Matcher = Callable[[bytes], bool]
+TagReader = Callable[[str], Any]
+
+def magic(*parts: tuple[int, bytes]) -> Matcher:
+  """Matcher requiring each byte string at its offset in the file header."""
+  def matches(header: bytes) -> bool:
+    return all(header[offset:offset + len(expected)] == expected for offset, expected in parts)
+  return matches
+
+def mp3_frame_sync(header: bytes) -> bool:
+  """An MPEG audio frame header: 11 sync bits and a non-reserved layer."""
+  return len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0 and header[1] & 0x06 != 0
+
+def adts_sync(header: bytes) -> bool:
+  """An AAC ADTS frame header: 12 sync bits and layer 0."""
+  return len(header) >= 2 and header[0] == 0xFF and header[1] & 0xF6 == 0xF0
+
+def mutagen_tags(path: str) -> Any:
+  """Read tags with mutagen's own format detection; None if the file is not recognized."""
+  import mutagen
+  return mutagen.File(path, easy=True)
+
+@dataclass(frozen=True)
+class AudioFormat:
+  """A container/codec the player understands.
+
+  `matchers` recognize the format from the first HEADER_BYTES of a file;
+  `extensions` are only used to pick files cheaply while scanning.
+  `streamable` formats are handed to the audio backend as they are; the
+  rest are transcoded to Ogg Vorbis in the background before playback.
+  """
+  name: str
+  extensions: tuple[str, ...]
+  matchers: tuple[Matcher, ...] = field(repr=False)
+  streamable: bool = True
+  read_tags: TagReader = field(default=mutagen_tags, repr=False)
+
+  def matches(self, header: bytes) -> bool:
+    return any(matcher(header) for matcher in self.matchers)
+
+class FormatRegistry:
+  """Ordered set of audio formats; the first whose signature matches wins."""
+
+  def __init__(self, formats: Iterable[AudioFormat] = ()) -> None:
+    self._formats: list[AudioFormat] = []
+    self._extensions: dict[str, AudioFormat] = {}
+    for audio_format in formats:
+      self.register(audio_format)
+
+  def __iter__(self):
+    return iter(self._formats)
+
+  def register(self, audio_format: AudioFormat, first: bool = False) -> None:
+    """Add a format; `first` lets a more specific signature take precedence."""
+    if first:
+      self._formats.insert(0, audio_format)
+    else:
+      self._formats.append(audio_format)
+    for extension in audio_format.extensions:
+      self._extensions.setdefault(extension, audio_format)
+
+  @property
+  def extensions(self) -> tuple[str, ...]:
+    return tuple(self._extensions)
+
+  def for_name(self, name: str) -> Optional[AudioFormat]:
+    """Format implied by a file name's extension."""
+    return self._extensions.get(os.path.splitext(name)[1].lower())
+
+  def named(self, name: str) -> Optional[AudioFormat]:
+    """Registered format with this name, as recorded by a metadata probe."""
+    for audio_format in self._formats:
+      if audio_format.name == name:
+        return audio_format
+    return None
+
+  def identify(self, header: bytes) -> Optional[AudioFormat]:
+    for audio_format in self._formats:
+      if audio_format.matches(header):
+        return audio_format
+    return None
+
+  def detect(self, path: str) -> Optional[AudioFormat]:
+    """Format of a file from its first few bytes, or None if unrecognized or unreadable."""
+    try:
+      with open(path, "rb") as file:
+        header = file.read(HEADER_BYTES)
+    except OSError as e:
+      logging.error(f"Cannot read '{path}': {e}")
+      return None
+    return self.identify(header)
+
+  def is_audio_file(self, path: str, sniff: bool = False) -> bool:
+    """Check a path by extension; with `sniff`, files without an extension are checked by signature."""
+    if self.for_name(path) is not None:
+      return True
+    return sniff and not os.path.splitext(path)[1] and os.path.isfile(path) and self.detect(path) is not None
+
+REGISTRY = FormatRegistry([
+  AudioFormat("mp3", (".mp3",), (magic((0, b"ID3")), mp3_frame_sync)),
+  AudioFormat("flac", (".flac",), (magic((0, b"fLaC")),)),
+  AudioFormat("opus", (".opus",), (magic((0, b"OggS"), (28, b"OpusHead")),), streamable=False),
+  AudioFormat("vorbis", (".ogg", ".oga"), (magic((0, b"OggS"), (28, b"\x01vorbis")),)),
+  AudioFormat("wav", (".wav",), (magic((0, b"RIFF"), (8, b"WAVE")),)),
+  AudioFormat("aiff", (".aiff", ".aif"), (magic((0, b"FORM"), (8, b"AIFF")), magic((0, b"FORM"), (8, b"AIFC")))),
+  AudioFormat("mp4", (".m4a", ".mp4"), (magic((4, b"ftyp")),), streamable=False),
+  AudioFormat("aac", (".aac",), (adts_sync,), streamable=False)
+])
+
+def register_format(audio_format: AudioFormat, first: bool = False) -> None:
+  REGISTRY.register(audio_format, first)
+
+def detect_format(path: str) -> Optional[AudioFormat]:
+  return REGISTRY.detect(path)
+
+def format_named(name: str) -> Optional[AudioFormat]:
+  return REGISTRY.named(name)
+
+def is_audio_file(path: str, sniff: bool = False) -> bool:
+  return REGISTRY.is_audio_file(path, sniff)
+
+def audio_extensions() -> tuple[str, ...]:
+  return REGISTRY.extensions
+
+def read_tags(path: str, audio_format: Optional[AudioFormat] = None) -> Any:
+  """Tags for a file using the reader of its format, detected from the header unless given."""
+  audio_format = audio_format or detect_format(path)
+  return (audio_format.read_tags if audio_format is not None else mutagen_tags)(path)
+
+def transcode(source: str, target: str) -> str:
+  """Decode a file with ffmpeg into an Ogg Vorbis file, written atomically."""
+  temporary = f"{target}.part"
+  command = [
+    "ffmpeg", "-v", "error", "-nostdin", "-y", "-i", source,
+    "-vn", "-c:a", "libvorbis", "-q:a", "6", "-f", "ogg", temporary
+  ]
+  try:
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    os.replace(temporary, target)
+  except (OSError, subprocess.CalledProcessError):
+    if os.path.exists(temporary):
+      os.remove(temporary)
+    raise
+  return target
+
+class TranscodeCache:
+  """Background transcoding of formats the backend cannot stream, cached on disk.
+
+  Cached files are named after the source path, size and mtime, so an edited
+  source is transcoded again rather than served stale. A file's own mtime
+  records when it was last played; each finished transcode deletes the least
+  recently played files until the cache fits its byte budget.
+  """
+
+  def __init__(self, directory: str = TRANSCODE_DIR, max_workers: int = 1, budget_bytes: int = TRANSCODE_CACHE_BYTES) -> None:
+    self.directory = directory
+    self.budget_bytes = budget_bytes
+    self._futures: dict[str, Future] = {}
+    self._failed: set[str] = set()
+    self._lock = threading.Lock()
+    self._warned = False
+    self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="transcode")
+
+  def target_for(self, path: str) -> Optional[str]:
+    try:
+      stat = os.stat(path)
+    except OSError:
+      return None
+    key = hashlib.sha1(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}".encode("utf-8", "surrogateescape")).hexdigest()
+    return os.path.join(self.directory, f"{key}{TRANSCODE_EXTENSION}")
+
+  def cached(self, path: str) -> Optional[str]:
+    """Path of the finished transcode of a file, if there is one."""
+    target = self.target_for(path)
+    return target if target is not None and os.path.exists(target) else None
+
+  def fetch(self, path: str) -> Optional[str]:
+    """Like `cached`, but marks the transcode as recently used because it is about to be played."""
+    target = self.target_for(path)
+    if target is None:
+      return None
+    try:
+      os.utime(target)
+    except OSError:
+      return None
+    return target
+
+  def failed(self, path: str) -> bool:
+    with self._lock:
+      return path in self._failed
+
+  def request(self, path: str) -> None:
+    """Transcode a file in the background unless it is cached or already queued."""
+    with self._lock:
+      if path in self._futures or path in self._failed:
+        return
+      if shutil.which("ffmpeg") is None:
+        if not self._warned:
+          logging.warning("ffmpeg not found; formats that need transcoding cannot be played.")
+          self._warned = True
+        self._failed.add(path)
+        return
+      target = self.target_for(path)
+      if target is None:
+        self._failed.add(path)
+        return
+      os.makedirs(self.directory, exist_ok=True)
+      future = self._executor.submit(transcode, path, target)
+      self._futures[path] = future
+    future.add_done_callback(lambda done: self._finished(path, done))
+    logging.info(f"Transcoding '{path}' for playback.")
+
+  def _finished(self, path: str, future: Future) -> None:
+    if not future.cancelled() and future.exception() is None:
+      self._prune(future.result())  # before the transcode stops counting as queued
+    with self._lock:
+      self._futures.pop(path, None)
+      if future.cancelled():
+        return
+      error = future.exception()
+      if error is not None:
+        self._failed.add(path)
+    if error is not None:
+      logging.error(f"Transcoding '{path}' failed: {error}")
+
+  def _prune(self, keep: str) -> None:
+    """Delete the least recently used transcodes, other than `keep`, until the cache fits its budget."""
+    try:
+      with os.scandir(self.directory) as entries:
+        files = sorted(
+          (entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+          for entry in entries if entry.name.endswith(TRANSCODE_EXTENSION)
+        )
+    except OSError as e:
+      logging.error(f"Error listing the transcode cache: {e}")
+      return
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for _, size, target in files:
+      if total <= self.budget_bytes:
+        break
+      if target == keep:
+        continue
+      try:
+        os.remove(target)
+      except FileNotFoundError:
+        pass
+      except OSError as e:
+        logging.error(f"Error removing '{target}' from the transcode cache: {e}")
+        continue
+      total -= size
+      removed += 1
+    if removed:
+      logging.info(f"Removed {removed} transcodes least recently played; the cache holds {total} bytes.")
+
+  def close(self) -> None:
+    self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,10 +1,14 @@
 import logging
 import os
-from tkinter import messagebox, ttk, filedialog
+from tkinter import messagebox, filedialog, simpledialog
 from tkinterdnd2 import TkinterDnD, DND_FILES
-from mutagen.mp3 import MP3
+from formats import audio_extensions, is_audio_file
+from instrumentation import Profiler, timed
+from scanner import ScanJob
+from state import PlayerState
+import bisect
 import tkinter as tk
-from typing import Optional, TypeVar, Generic, Tuple
+from typing import Callable, Optional, Sequence, TypeVar, Generic, Tuple
 
 T = TypeVar('T')
 
@@ -28,35 +32,180 @@ BUTTON_COLOR: Constant[str] = Constant("#423F3F")
 HIGHLIGHT_COLOR: Constant[str] = Constant("#a7a7a7")
 FONT: Constant[Tuple[str, int, str]] = Constant(("Helvetica", 12, "bold"))
 FONT_SMALL: Constant[str] = Constant(("Helvetica", 10))
-WINDOW_SIZE: Constant[str] = Constant("420x640")
-
-# Configure logging
-logging.basicConfig(
-  level=logging.INFO,
-  format="%(asctime)s - %(levelname)s - %(message)s",
-  handlers=[
-    logging.FileHandler("player.log"),  # Log to a file
-    logging.StreamHandler()             # Log to the console
-  ]
-)
-
-def create_gui(root: TkinterDnD.Tk, player: object) -> None:
+WINDOW_SIZE: Constant[str] = Constant("420x790")
+MAX_CROSSFADE_SECONDS: Constant[int] = Constant(12)
+WAVEFORM_WIDTH: Constant[int] = Constant(400)
+WAVEFORM_HEIGHT: Constant[int] = Constant(48)
+WAVEFORM_COLOR: Constant[str] = Constant("#5f5a5a")
+WAVEFORM_PLAYED_COLOR: Constant[str] = Constant("#DFD7D7")
+PLAYLIST_ROWS: Constant[int] = Constant(12)
+SCAN_POLL_MS: Constant[int] = Constant(100)
+FILTER_DEBOUNCE_MS: Constant[int] = Constant(150)
+
+def create_gui(root: TkinterDnD.Tk, player: object, profiler: Optional[Profiler] = None) -> None:
   """Set up the GUI components for the Music Player."""
   try:
-    gui = MusicPlayerGUI(root, player)
+    gui = MusicPlayerGUI(root, player, profiler)
   except Exception as e:
     logging.error(f"Failed to create GUI: {e}", exc_info=True)
     raise
 
+class VirtualPlaylistView:
+  """Listbox that renders only the visible window of a playlist and repaints changed rows only."""
+  def __init__(self, parent: tk.Widget, rows: int, row_text: Callable[[int], str], **listbox_options) -> None:
+    self.rows = rows
+    self.row_text = row_text
+    self.length = 0
+    self.offset = 0
+    self.selected: Optional[int] = None
+    self._rendered: list[str] = []
+    self.listbox = tk.Listbox(parent, height=rows, exportselection=False, **listbox_options)
+    self.scrollbar = tk.Scrollbar(parent, orient=tk.VERTICAL, command=self._on_scroll, bg=BUTTON_COLOR.value)
+    self.listbox.bind("<<ListboxSelect>>", self._on_select)
+    self.listbox.bind("<MouseWheel>", lambda event: self.scroll_by(-1 if event.delta > 0 else 1))
+    self.listbox.bind("<Button-4>", lambda event: self.scroll_by(-1))
+    self.listbox.bind("<Button-5>", lambda event: self.scroll_by(1))
+
+  def grid(self, row: int, column: int) -> None:
+    """Place the list and its scrollbar side by side."""
+    self.listbox.grid(row=row, column=column)
+    self.scrollbar.grid(row=row, column=column + 1, sticky="ns")
+
+  def set_length(self, length: int) -> None:
+    """Update the number of rows in the underlying playlist."""
+    self.length = length
+    if self.selected is not None and self.selected >= length:
+      self.selected = None
+    self.offset = max(0, min(self.offset, length - self.rows))
+
+  def refresh(self) -> None:
+    """Re-render the visible window, touching only rows whose text changed."""
+    end = min(self.offset + self.rows, self.length)
+    visible = [self.row_text(index) for index in range(self.offset, end)]
+    for row, text in enumerate(visible):
+      if row >= len(self._rendered):
+        self.listbox.insert(tk.END, text)
+      elif self._rendered[row] != text:
+        self.listbox.delete(row)
+        self.listbox.insert(row, text)
+    if len(self._rendered) > len(visible):
+      self.listbox.delete(len(visible), tk.END)
+    self._rendered = visible
+    self._sync_selection()
+    if self.length:
+      self.scrollbar.set(self.offset / self.length, end / self.length)
+    else:
+      self.scrollbar.set(0.0, 1.0)
+
+  def _sync_selection(self) -> None:
+    self.listbox.select_clear(0, tk.END)
+    if self.selected is not None and self.offset <= self.selected < self.offset + len(self._rendered):
+      self.listbox.select_set(self.selected - self.offset)
+
+  def scroll_to(self, offset: int) -> None:
+    """Scroll so that the given row is at the top of the window."""
+    offset = max(0, min(offset, self.length - self.rows))
+    if offset != self.offset:
+      self.offset = offset
+      self.refresh()
+
+  def scroll_by(self, rows: int) -> None:
+    """Scroll the window by a number of rows."""
+    self.scroll_to(self.offset + rows)
+
+  def see(self, index: int) -> None:
+    """Scroll the minimum amount needed to make a row visible."""
+    if index < self.offset:
+      self.scroll_to(index)
+    elif index >= self.offset + self.rows:
+      self.scroll_to(index - self.rows + 1)
+
+  def select(self, index: Optional[int]) -> None:
+    """Select a row by playlist index and bring it into view."""
+    self.selected = index
+    if index is not None:
+      self.see(index)
+    self._sync_selection()
+
+  def selected_index(self) -> Optional[int]:
+    """Return the selected playlist index, if any."""
+    return self.selected
+
+  def _on_select(self, event) -> None:
+    selection = self.listbox.curselection()
+    if selection:
+      self.selected = self.offset + selection[0]
+
+  def _on_scroll(self, action: str, value: str, unit: Optional[str] = None) -> None:
+    if action == tk.MOVETO:
+      self.scroll_to(int(float(value) * self.length))
+    elif action == tk.SCROLL:
+      self.scroll_by(int(value) * (self.rows if unit == tk.PAGES else 1))
+
+class WaveformView:
+  """Canvas showing a track's peak overview, one vertical line per pixel column, with the played part highlighted."""
+  def __init__(self, parent: tk.Widget, width: int, height: int, **canvas_options) -> None:
+    self.width = width
+    self.height = height
+    self.canvas = tk.Canvas(parent, width=width, height=height, highlightthickness=0, **canvas_options)
+    self._columns: list[int] = []
+    self._played = 0
+    self._key: Optional[tuple] = None
+    self.set_peaks(None, None)
+
+  def pack(self, **options) -> None:
+    self.canvas.pack(**options)
+
+  def set_peaks(self, key: Optional[tuple], peaks: Optional[Sequence[int]]) -> None:
+    """Redraw for new interleaved int8 (min, max) peaks; without peaks draw a flat line."""
+    if key == self._key and self._columns:
+      return
+    self._key = key
+    self.canvas.delete("all")
+    middle = self.height / 2
+    pairs = len(peaks) // 2 if peaks else 0
+    self._columns = []
+    for column in range(self.width):
+      low = high = 0
+      if pairs:
+        start = column * pairs // self.width
+        end = max(start + 1, (column + 1) * pairs // self.width)
+        low = min(peaks[2 * start:2 * end:2])
+        high = max(peaks[2 * start + 1:2 * end:2])
+      top = middle - high * middle / 127
+      bottom = middle - low * middle / 127
+      self._columns.append(self.canvas.create_line(column, top, column, max(bottom, top + 1), fill=WAVEFORM_COLOR.value))
+    self._played = 0
+
+  def set_progress(self, fraction: float) -> None:
+    """Recolour only the columns whose played state changed."""
+    played = int(self.width * min(1.0, max(0.0, fraction)))
+    if played == self._played:
+      return
+    low, high = sorted((played, self._played))
+    color = WAVEFORM_PLAYED_COLOR.value if played > self._played else WAVEFORM_COLOR.value
+    for column in range(low, high):
+      self.canvas.itemconfigure(self._columns[column], fill=color)
+    self._played = played
+
 class MusicPlayerGUI:
-  def __init__(self, root: TkinterDnD.Tk, player: object) -> None:
+  def __init__(self, root: TkinterDnD.Tk, player: object, profiler: Optional[Profiler] = None) -> None:
     self.root = root
     self.player = player
-    self.track_listbox: Optional[tk.Listbox] = None
+    self.profiler = profiler or Profiler()
+    self.playlist_view: Optional[VirtualPlaylistView] = None
+    self._rendered_state: Optional[tuple] = None
+    self._rendered_current: Optional[int] = None
+    self.filter_var: Optional[tk.StringVar] = None
+    self.visible_indices: Optional[list[int]] = None
+    self._filtered_state: Optional[tuple] = None
+    self._filter_after_id: Optional[str] = None
     self.status_bar: Optional[tk.Label] = None
-    self.progress_bar: Optional[ttk.Progressbar] = None
+    self.waveform_view: Optional[WaveformView] = None
     self.play_button: Optional[tk.Button] = None
     self.repeat_button: Optional[tk.Button] = None
+    self.shuffle_button: Optional[tk.Button] = None
+    self.scan_jobs: list[ScanJob] = []
     self.setup_gui()
 
   def setup_gui(self) -> None:
@@ -72,6 +221,7 @@ class MusicPlayerGUI:
       self.configure_drag_and_drop()
       self.bind_keyboard_shortcuts()
       self.update_ui()
+      self.player.events.subscribe("changed", self.on_state_changed)
       self.root.protocol("WM_DELETE_WINDOW", self.handle_close)
     except Exception as e:
       logging.error(f"Failed to create GUI: {e}", exc_info=True)
@@ -101,29 +251,86 @@ class MusicPlayerGUI:
     playlist_frame = tk.Frame(self.root, bg=BACKGROUND_COLOR.value)
     playlist_frame.pack(pady=5)
 
-    self.track_listbox = tk.Listbox(
+    playlist_bar = tk.Frame(playlist_frame, bg=BACKGROUND_COLOR.value)
+    playlist_bar.grid(row=0, column=0, columnspan=2, sticky="ew", pady=(0, 5))
+    self.playlist_name_var = tk.StringVar()
+    self.playlist_menu = tk.OptionMenu(playlist_bar, self.playlist_name_var, "")
+    self.playlist_menu.config(
+      width=24,
+      font=FONT_SMALL.value,
+      bg=BUTTON_COLOR.value,
+      fg=TEXT_COLOR.value,
+      highlightthickness=0
+    )
+    self.playlist_menu.pack(side=tk.LEFT)
+    self.create_control_button(playlist_bar, "New", self.new_playlist, width=6).pack(side=tk.LEFT, padx=(5, 0))
+    self.create_control_button(playlist_bar, "Delete", self.delete_playlist, width=6).pack(side=tk.LEFT, padx=(5, 0))
+    self.refresh_playlist_menu()
+
+    self.filter_var = tk.StringVar()
+    self.filter_var.trace_add("write", lambda *args: self.schedule_filter())
+    filter_entry = tk.Entry(
+      playlist_frame,
+      textvariable=self.filter_var,
+      font=FONT_SMALL.value,
+      bg=BUTTON_COLOR.value,
+      fg=TEXT_COLOR.value,
+      insertbackground=TEXT_COLOR.value
+    )
+    filter_entry.grid(row=1, column=0, columnspan=2, sticky="ew", pady=(0, 5))
+
+    self.playlist_view = VirtualPlaylistView(
       playlist_frame,
+      rows=PLAYLIST_ROWS.value,
+      row_text=self.format_track_row,
       width=53,
-      height=12,
       font=FONT_SMALL.value,
       bg=BACKGROUND_COLOR.value,
       fg=TEXT_COLOR.value,
       selectbackground=HIGHLIGHT_COLOR.value,
       selectforeground=BACKGROUND_COLOR.value
     )
-    self.track_listbox.grid(row=0, column=0)
-
-    scrollbar = tk.Scrollbar(
-      playlist_frame,
-      orient=tk.VERTICAL,
-      command=self.track_listbox.yview,
-      bg=BUTTON_COLOR.value
-    )
-    scrollbar.grid(row=0, column=1, sticky="ns")
-    self.track_listbox.config(yscrollcommand=scrollbar.set)
+    self.playlist_view.grid(row=2, column=0)
+
+  def refresh_playlist_menu(self) -> None:
+    """Rebuild the playlist chooser from the library's playlist names."""
+    menu = self.playlist_menu["menu"]
+    menu.delete(0, tk.END)
+    for name in self.player.playlist_names():
+      menu.add_command(label=name, command=lambda name=name: self.switch_playlist(name))
+    self.playlist_name_var.set(self.player.playlist_name or "")
+
+  def switch_playlist(self, name: str) -> None:
+    """Show another playlist."""
+    self.player.switch_playlist(name)
+    self.playlist_name_var.set(self.player.playlist_name or "")
+    self.playlist_view.select(None)
+    self.playlist_view.scroll_to(0)
+
+  def new_playlist(self) -> None:
+    """Ask for a name and create an empty playlist."""
+    name = simpledialog.askstring("New Playlist", "Playlist name:", parent=self.root)
+    if not name:
+      return
+    if self.player.create_playlist(name):
+      self.refresh_playlist_menu()
+      self.playlist_view.select(None)
+      self.playlist_view.scroll_to(0)
+    else:
+      messagebox.showwarning("New Playlist", f"Cannot create playlist '{name}'.")
+
+  def delete_playlist(self) -> None:
+    """Delete the shown playlist after confirmation; its tracks stay in the library."""
+    name = self.player.playlist_name
+    if name is None or len(self.player.playlist_names()) < 2:
+      messagebox.showwarning("Delete Playlist", "The last playlist cannot be deleted.")
+      return
+    if messagebox.askyesno("Delete Playlist", f"Delete playlist '{name}'?"):
+      self.player.delete_playlist(name)
+      self.refresh_playlist_menu()
 
   def create_volume_controls(self) -> None:
-    """Create the volume slider controls."""
+    """Create the volume and crossfade slider controls."""
     volume_label = tk.Label(
       self.root,
       text="Volume",
@@ -147,6 +354,22 @@ class MusicPlayerGUI:
     volume_slider.set(50)
     volume_slider.pack(pady=(0, 5), padx=5)
 
+    crossfade_slider = tk.Scale(
+      self.root,
+      from_=0,
+      to=MAX_CROSSFADE_SECONDS.value,
+      orient=tk.HORIZONTAL,
+      label="Crossfade (s)",
+      command=lambda value: self.player.set_crossfade(float(value)),
+      length=350,
+      font=FONT_SMALL.value,
+      bg=BACKGROUND_COLOR.value,
+      fg=TEXT_COLOR.value,
+      sliderlength=20
+    )
+    crossfade_slider.set(int(self.player.crossfade))
+    crossfade_slider.pack(pady=(0, 5), padx=5)
+
   def set_volume(self, value: float) -> None:
     """Set the volume for the music player."""
     self.player.set_volume(value)
@@ -159,7 +382,11 @@ class MusicPlayerGUI:
     self.create_control_button(button_frame_1, "Load Folder", self.load_folder).grid(row=0, column=0, padx=5)
     self.create_control_button(button_frame_1, "Add File", self.add_file).grid(row=0, column=1, padx=5)
 
-    self.create_control_button(self.root, "Remove Track", self.remove_selected_track, width=38).pack(pady=5)
+    track_frame = tk.Frame(self.root, bg=BACKGROUND_COLOR.value)
+    track_frame.pack(pady=5)
+
+    self.create_control_button(track_frame, "Play Next", self.queue_selected_track).grid(row=0, column=0, padx=5)
+    self.create_control_button(track_frame, "Remove Track", self.remove_selected_track).grid(row=0, column=1, padx=5)
 
     button_frame_2 = tk.Frame(self.root, bg=BACKGROUND_COLOR.value)
     button_frame_2.pack(pady=5)
@@ -167,7 +394,8 @@ class MusicPlayerGUI:
     self.create_control_button(button_frame_2, "Move Up", lambda: self.move_track(up=True)).grid(row=0, column=0, padx=5)
     self.create_control_button(button_frame_2, "Move Down", lambda: self.move_track(up=False)).grid(row=0, column=1, padx=5)
 
-    self.create_control_button(self.root, "Shuffle", self.shuffle_playlist, width=38).pack(pady=5)
+    self.shuffle_button = self.create_control_button(self.root, "Shuffle", self.toggle_shuffle, width=38)
+    self.shuffle_button.pack(pady=5)
 
     self.repeat_button = self.create_control_button(self.root, "Repeat", self.toggle_repeat, width=38)
     self.repeat_button.pack(pady=5)
@@ -203,26 +431,37 @@ class MusicPlayerGUI:
     self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
 
   def create_progress_bar(self) -> None:
-    """Create a progress bar to show playback progress."""
-    self.progress_bar = ttk.Progressbar(
+    """Create the waveform overview that shows playback progress."""
+    self.waveform_view = WaveformView(
       self.root,
-      orient=tk.HORIZONTAL,
-      length=400,
-      mode="determinate"
+      width=WAVEFORM_WIDTH.value,
+      height=WAVEFORM_HEIGHT.value,
+      bg=BACKGROUND_COLOR.value
     )
-    self.progress_bar.pack(pady=5)
+    self.waveform_view.pack(pady=5)
+    self.waveform_view.canvas.bind("<Button-1>", self.seek_to_click)
+    self.player.events.subscribe("position", lambda seconds: self.update_progress_bar(seconds))
+
+  def seek_to_click(self, event) -> None:
+    """Seek to the position under the mouse in the waveform."""
+    duration = self.player.get_duration()
+    width = self.waveform_view.canvas.winfo_width()
+    if duration and width:
+      self.player.seek(duration * min(1.0, max(0.0, event.x / width)))
 
   def configure_drag_and_drop(self) -> None:
     """Configure drag-and-drop functionality for the application."""
     def handle_dragged_files(event) -> None:
       paths = self.root.tk.splitlist(event.data)
+      files: list[str] = []
       for path in paths:
         if os.path.isdir(path):
-          self.player.load_folder(path)
-        elif os.path.isfile(path) and path.endswith(".mp3"):
-          self.player.add_file(path)
+          self.start_scan(path)
+        elif os.path.isfile(path) and is_audio_file(path, sniff=True):
+          files.append(path)
         else:
           messagebox.showwarning("Unsupported File", f"Cannot add: {os.path.basename(path)}")
+      self.player.add_files(files)
       self.update_playlist_display()
 
     self.root.drop_target_register(DND_FILES)
@@ -230,55 +469,138 @@ class MusicPlayerGUI:
 
   def bind_keyboard_shortcuts(self) -> None:
     """Bind keyboard shortcuts for common actions."""
-    self.root.bind("<space>", lambda event: self.toggle_play())
+    self.root.bind("<space>", lambda event: None if isinstance(event.widget, tk.Entry) else self.toggle_play())
+    self.root.bind("<Escape>", lambda event: self.cancel_scans())
+    self.root.bind("<F12>", lambda event: self.profiler.toggle())
 
+  @timed("gui.update_ui")
   def update_ui(self) -> None:
-    """Update the UI periodically."""
+    """Draw every part of the UI from the player's current state."""
     self.update_playlist_display()
     self.update_status_bar()
     self.update_progress_bar()
+    self.update_play_button()
     self.monitor_repeat_mode()
-    self.root.after(1000, self.update_ui)
-
+    self.monitor_shuffle_mode()
+
+  @timed("gui.on_state_changed")
+  def on_state_changed(self, state: PlayerState, changes: frozenset[str]) -> None:
+    """Redraw only the parts affected by a player command, whichever thread or client issued it."""
+    if "playlist_name" in changes:
+      self.refresh_playlist_menu()
+    if changes & {"version", "metadata_version", "current_track_id", "is_playing", "queue_version"}:
+      self.update_playlist_display()
+    if changes & {"is_playing", "is_paused", "current_track_id"}:
+      self.update_status_bar()
+      self.update_progress_bar()
+      self.update_play_button()
+    if "repeat" in changes:
+      self.monitor_repeat_mode()
+    if "shuffle" in changes:
+      self.monitor_shuffle_mode()
+
+  @timed("gui.update_playlist_display")
   def update_playlist_display(self) -> None:
-    """Update the playlist display to reflect the current state."""
-    self.track_listbox.delete(0, tk.END)
-    for index, track in enumerate(self.player.playlist):
-      try:
-        audio = MP3(track)
-        duration = int(audio.info.length)
-        mins, secs = divmod(duration, 60)
-        duration_str = f"{mins}:{secs:02d}"
-      except Exception as e:
-        logging.error(f"Error reading track duration: {e}")
-        duration_str = "Unknown"
-      track_name = os.path.basename(track)
-      display_name = f"> {track_name} ({duration_str})" if index == self.player.current_track_index else f"{track_name} ({duration_str})"
-      self.track_listbox.insert(tk.END, display_name)
+    """Update the playlist display if the playlist, metadata, filter or current track changed."""
+    state = (
+      self.player.version,
+      self.player.metadata.version,
+      self.player.current_track_index,
+      self.player.is_playing,
+      self.player.queue_version
+    )
+    if state == self._rendered_state:
+      return
+    self._rendered_state = state
+    if self.visible_indices is not None and state[:2] != self._filtered_state:
+      self.apply_filter()
+      return
+    length = len(self.player.playlist) if self.visible_indices is None else len(self.visible_indices)
+    self.playlist_view.set_length(length)
+    self.playlist_view.refresh()
     self.highlight_current_track()
 
+  def schedule_filter(self) -> None:
+    """Re-filter the playlist shortly after the user stops typing."""
+    if self._filter_after_id is not None:
+      self.root.after_cancel(self._filter_after_id)
+    self._filter_after_id = self.root.after(FILTER_DEBOUNCE_MS.value, self.apply_filter)
+
+  def apply_filter(self) -> None:
+    """Narrow the visible rows to tracks matching the filter text."""
+    self._filter_after_id = None
+    self.visible_indices = self.player.search(self.filter_var.get())
+    self._filtered_state = (self.player.version, self.player.metadata.version)
+    self._rendered_state = None
+    self._rendered_current = None
+    self.playlist_view.select(None)
+    self.playlist_view.scroll_to(0)
+    self.update_playlist_display()
+
+  def track_index(self, row: int) -> int:
+    """Map a visible row to its playlist index."""
+    return row if self.visible_indices is None else self.visible_indices[row]
+
+  def row_of(self, index: int) -> Optional[int]:
+    """Map a playlist index to its visible row, if it is not filtered out."""
+    if self.visible_indices is None:
+      return index
+    row = bisect.bisect_left(self.visible_indices, index)
+    return row if row < len(self.visible_indices) and self.visible_indices[row] == index else None
+
+  def selected_track_index(self) -> Optional[int]:
+    """Playlist index of the selected row, if any."""
+    row = self.playlist_view.selected_index()
+    return None if row is None else self.track_index(row)
+
+  def format_track_row(self, row: int) -> str:
+    """Build the display text for a playlist row."""
+    index = self.track_index(row)
+    track = self.player.playlist[index]
+    duration_str = self.player.duration_str(track)
+    track_name = os.path.basename(track)
+    if index == self.player.current_track_index:
+      return f"> {track_name} ({duration_str})"
+    queued = self.player.queue_position(index)
+    return f"{track_name} ({duration_str})" if queued is None else f"[{queued}] {track_name} ({duration_str})"
+
   def highlight_current_track(self) -> None:
-    """Highlight the currently playing track in the playlist."""
-    if self.player.is_playing and self.player.current_track_index is not None:
-      self.track_listbox.select_clear(0, tk.END)
-      self.track_listbox.select_set(self.player.current_track_index)
-      self.track_listbox.see(self.player.current_track_index)
+    """Highlight the currently playing track in the playlist when it changes."""
+    current = self.player.current_track_index if self.player.is_playing else None
+    if current is not None and current != self._rendered_current:
+      row = self.row_of(current)
+      if row is not None:
+        self.playlist_view.select(row)
+    self._rendered_current = current
 
   def update_status_bar(self) -> None:
     """Update the status bar with the current track details."""
-    if self.player.is_playing and self.player.current_track_index is not None:
+    if self.scan_jobs:
+      found = sum(job.found for job in self.scan_jobs)
+      probed = sum(job.probed for job in self.scan_jobs)
+      self.status_bar.config(text=f"Scanning: {found} tracks found, {probed} tagged (Esc to cancel)")
+    elif self.player.is_playing and self.player.current_track_index is not None:
       track = self.player.playlist[self.player.current_track_index]
       self.status_bar.config(text=f"Now Playing: {os.path.basename(track)}")
     else:
       self.status_bar.config(text="No track playing")
 
-  def update_progress_bar(self) -> None:
-    """Update the progress bar based on the current playback position."""
-    if self.player.is_playing:
+  def update_progress_bar(self, position: Optional[float] = None) -> None:
+    """Update the waveform for the current track and highlight the played fraction."""
+    path = self.player.current_track_path
+    peaks = self.player.waveforms.get(path) if path is not None else None
+    self.waveform_view.set_peaks((path, peaks is not None), peaks)
+    duration = self.player.get_duration()
+    if not duration or not (self.player.is_playing or self.player.is_paused):
+      self.waveform_view.set_progress(0.0)
+      return
+    if position is None:
       position = self.player.get_position()
-      self.progress_bar["value"] = position
-    else:
-      self.progress_bar["value"] = 0
+    self.waveform_view.set_progress(position / duration)
+
+  def update_play_button(self) -> None:
+    """Keep the play button label in step with the playback state."""
+    self.play_button.config(text="Pause" if self.player.is_playing else "Play")
 
   def monitor_repeat_mode(self) -> None:
     """Monitor the repeat mode and update the button state."""
@@ -287,14 +609,17 @@ class MusicPlayerGUI:
     else:
       self.repeat_button.config(bg=BUTTON_COLOR.value)
 
+  def monitor_shuffle_mode(self) -> None:
+    """Show whether shuffle is on."""
+    self.shuffle_button.config(bg="blue" if self.player.shuffle else BUTTON_COLOR.value)
+
   def toggle_play(self) -> None:
     """Toggle between play and pause."""
     if self.player.is_playing:
       self.player.pause()
-      self.play_button.config(text="Play")
     else:
       self.player.play()
-      self.play_button.config(text="Pause")
+    self.update_play_button()
 
   def toggle_repeat(self) -> None:
     """Toggle repeat mode."""
@@ -302,43 +627,77 @@ class MusicPlayerGUI:
     self.monitor_repeat_mode()
 
   def load_folder(self) -> None:
-    """Load a folder and add all mp3 files to the playlist."""
+    """Scan a folder tree in the background, add its audio files to the playlist and watch it for changes."""
     folder = filedialog.askdirectory()
     if folder:
-      self.player.load_folder(folder)
-      self.update_playlist_display()
+      self.start_scan(folder)
+
+  def start_scan(self, folder: str) -> None:
+    """Start a background scan and begin polling it for results."""
+    job = self.player.load_folder(folder, watch=True)
+    if job is None:
+      return
+    self.scan_jobs.append(job)
+    if len(self.scan_jobs) == 1:
+      self.root.after(SCAN_POLL_MS.value, self.poll_scans)
+
+  def poll_scans(self) -> None:
+    """Move discovered tracks from running scans into the playlist."""
+    for job in list(self.scan_jobs):
+      for batch in job.drain():
+        if not job.cancelled:
+          self.player.add_files(batch)
+      if job.done:
+        self.scan_jobs.remove(job)
+    self.update_playlist_display()
+    self.update_status_bar()
+    if self.scan_jobs:
+      self.root.after(SCAN_POLL_MS.value, self.poll_scans)
+
+  def cancel_scans(self) -> None:
+    """Cancel all running folder scans."""
+    for job in self.scan_jobs:
+      job.cancel()
 
   def add_file(self) -> None:
     """Add a file to the playlist."""
-    file = filedialog.askopenfilename(filetypes=[("MP3 files", "*.mp3")])
+    patterns = " ".join(f"*{extension}" for extension in audio_extensions())
+    file = filedialog.askopenfilename(filetypes=[("Audio files", patterns), ("All files", "*")])
     if file:
       self.player.add_file(file)
       self.update_playlist_display()
 
   def remove_selected_track(self) -> None:
     """Remove the selected track from the playlist."""
-    try:
-      selected_index = self.track_listbox.curselection()[0]
+    selected_index = self.selected_track_index()
+    if selected_index is not None:
       self.player.remove_track(selected_index)
       self.update_playlist_display()
-    except IndexError:
-      pass
 
   def move_track(self, up: bool) -> None:
     """Move the selected track up or down in the playlist."""
-    try:
-      selected_index = self.track_listbox.curselection()[0]
-      self.player.move_track(selected_index, up)
+    selected_index = self.selected_track_index()
+    if selected_index is not None:
+      new_index = selected_index - 1 if up else selected_index + 1
+      self.player.move_track(selected_index, new_index)
+      self.update_playlist_display()
+      row = self.row_of(new_index)
+      if row is not None:
+        self.playlist_view.select(row)
+
+  def toggle_shuffle(self) -> None:
+    """Toggle shuffled playback; the playlist order is kept."""
+    self.player.toggle_shuffle()
+    self.monitor_shuffle_mode()
+
+  def queue_selected_track(self) -> None:
+    """Play the selected track after the current one."""
+    selected_index = self.selected_track_index()
+    if selected_index is not None:
+      self.player.queue_next(selected_index)
       self.update_playlist_display()
-    except IndexError:
-      pass
-
-  def shuffle_playlist(self) -> None:
-    """Shuffle the playlist."""
-    self.player.shuffle_playlist()
-    self.update_playlist_display()
 
   def handle_close(self) -> None:
     """Handle window close event."""
-    self.player.stop()
+    self.player.shutdown()
     self.root.quit()
@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import cProfile
+import functools
+import io
+import logging
+import logging.handlers
+import os
+import pstats
+import queue
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from tkinter import TclError
+from typing import TYPE_CHECKING, Callable, Iterator, Optional, TypeVar
+
+if TYPE_CHECKING:
+  from tkinter import Misc
+
+F = TypeVar("F", bound=Callable)
+
+BUCKET_BOUNDS_MS: tuple[float, ...] = tuple(0.1 * 2 ** exponent for exponent in range(18))  # 0.1 ms .. ~13 s
+LAG_INTERVAL_MS: int = 100
+METRICS_ENV: str = "PLAYER_METRICS"  # set to 1 to sample main-loop lag without profiling
+LAG_WARNING_MS: float = 200.0
+PROFILE_TOP: int = 30
+TRACEMALLOC_FRAMES: int = 10
+
+class Histogram:
+  """Fixed log-scale histogram of durations in milliseconds.
+
+  Buckets double in width, so recording is a short scan and memory stays
+  constant no matter how many samples are taken. Percentiles are reported
+  as the upper bound of the bucket they fall in.
+  """
+
+  __slots__ = ("counts", "count", "total", "max")
+
+  def __init__(self) -> None:
+    self.counts: list[int] = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+    self.count: int = 0
+    self.total: float = 0.0
+    self.max: float = 0.0
+
+  def record(self, elapsed_ms: float) -> None:
+    bucket = 0
+    while bucket < len(BUCKET_BOUNDS_MS) and elapsed_ms > BUCKET_BOUNDS_MS[bucket]:
+      bucket += 1
+    self.counts[bucket] += 1
+    self.count += 1
+    self.total += elapsed_ms
+    self.max = max(self.max, elapsed_ms)
+
+  def percentile(self, fraction: float) -> float:
+    """Upper bound of the bucket holding the given fraction of samples, capped at the maximum."""
+    if not self.count:
+      return 0.0
+    seen = 0
+    for bucket, count in enumerate(self.counts):
+      seen += count
+      if seen >= fraction * self.count:
+        return min(BUCKET_BOUNDS_MS[bucket], self.max) if bucket < len(BUCKET_BOUNDS_MS) else self.max
+    return self.max
+
+  @property
+  def mean(self) -> float:
+    return self.total / self.count if self.count else 0.0
+
+class Metrics:
+  """Named timing histograms and counters, safe to update from any thread."""
+
+  def __init__(self) -> None:
+    self.histograms: dict[str, Histogram] = {}
+    self.counters: dict[str, int] = {}
+    self._lock = threading.Lock()
+
+  def record(self, name: str, elapsed_ms: float) -> None:
+    with self._lock:
+      histogram = self.histograms.get(name)
+      if histogram is None:
+        histogram = self.histograms[name] = Histogram()
+      histogram.record(elapsed_ms)
+
+  def count(self, name: str, amount: int = 1) -> None:
+    with self._lock:
+      self.counters[name] = self.counters.get(name, 0) + amount
+
+  @contextmanager
+  def timer(self, name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.record(name, (time.perf_counter() - started) * 1000)
+
+  def reset(self) -> None:
+    with self._lock:
+      self.histograms.clear()
+      self.counters.clear()
+
+  def report(self) -> str:
+    """Plain-text table of every histogram and counter."""
+    with self._lock:
+      lines = [f"{'timer':<32} {'count':>8} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  (ms)"]
+      for name, histogram in sorted(self.histograms.items()):
+        lines.append(
+          f"{name:<32} {histogram.count:>8} {histogram.mean:>9.2f} {histogram.percentile(0.5):>9.2f} "
+          f"{histogram.percentile(0.95):>9.2f} {histogram.percentile(0.99):>9.2f} {histogram.max:>9.2f}"
+        )
+      if self.counters:
+        lines.append("")
+        lines.extend(f"{name:<32} {value:>8}" for name, value in sorted(self.counters.items()))
+    return "\n".join(lines)
+
+metrics = Metrics()
+
+def timed(name: str) -> Callable[[F], F]:
+  """Decorator recording each call's duration in the `name` histogram."""
+  def decorate(function: F) -> F:
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+      with metrics.timer(name):
+        return function(*args, **kwargs)
+    return wrapper
+  return decorate
+
+def metrics_enabled() -> bool:
+  return os.environ.get(METRICS_ENV, "") not in ("", "0")
+
+class LoopLagMonitor:
+  """Measures how late Tk runs a timer callback, i.e. how long the main loop was blocked.
+
+  Its timer wakes the main loop every interval, so it only runs while
+  profiling or when metrics are enabled with PLAYER_METRICS.
+  """
+
+  def __init__(self, root: Misc, interval_ms: int = LAG_INTERVAL_MS, warning_ms: float = LAG_WARNING_MS) -> None:
+    self.root = root
+    self.interval_ms = interval_ms
+    self.warning_ms = warning_ms
+    self._expected: float = 0.0
+    self._after_id: Optional[str] = None
+
+  def start(self) -> None:
+    if self._after_id is None:
+      self._schedule()
+
+  def stop(self) -> None:
+    if self._after_id is not None:
+      try:
+        self.root.after_cancel(self._after_id)
+      except TclError:
+        pass  # the window is already gone
+      self._after_id = None
+
+  def _schedule(self) -> None:
+    self._expected = time.perf_counter() + self.interval_ms / 1000
+    self._after_id = self.root.after(self.interval_ms, self._tick)
+
+  def _tick(self) -> None:
+    lag_ms = max(0.0, (time.perf_counter() - self._expected) * 1000)
+    metrics.record("tk.loop_lag", lag_ms)
+    if lag_ms > self.warning_ms:
+      logging.warning(f"Main loop blocked for {lag_ms:.0f} ms.")
+    self._schedule()
+
+class Profiler:
+  """Toggles cProfile and tracemalloc on the calling thread and writes a report when stopped."""
+
+  def __init__(self, report_prefix: str = "profile") -> None:
+    self.report_prefix = report_prefix
+    self.lag_monitor: Optional[LoopLagMonitor] = None
+    self._profile: Optional[cProfile.Profile] = None
+
+  @property
+  def running(self) -> bool:
+    return self._profile is not None
+
+  def attach_lag_monitor(self, monitor: LoopLagMonitor) -> None:
+    """Sample main-loop lag while profiling, or all the time when metrics are enabled."""
+    self.lag_monitor = monitor
+    if self.running or metrics_enabled():
+      monitor.start()
+
+  def start(self) -> None:
+    if self.running:
+      return
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    self._profile = cProfile.Profile()
+    self._profile.enable()
+    if self.lag_monitor is not None:
+      self.lag_monitor.start()
+    logging.info("Profiling started.")
+
+  def stop(self) -> Optional[str]:
+    """Stop profiling and return the path of the written report."""
+    if not self.running:
+      return None
+    self._profile.disable()
+    if self.lag_monitor is not None and not metrics_enabled():
+      self.lag_monitor.stop()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stream = io.StringIO()
+    stats = pstats.Stats(self._profile, stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP)
+    self._profile = None
+    stream.write("\nTop allocations\n")
+    for statistic in snapshot.statistics("lineno")[:PROFILE_TOP]:
+      stream.write(f"{statistic}\n")
+    stream.write("\nTimers\n")
+    stream.write(metrics.report())
+    path = f"{self.report_prefix}-{time.strftime('%Y%m%d-%H%M%S')}.txt"
+    try:
+      with open(path, "w", encoding="utf-8") as file:
+        file.write(stream.getvalue())
+    except OSError as e:
+      logging.error(f"Error writing profile report: {e}")
+      return None
+    logging.info(f"Profile report written to '{path}'.")
+    return path
+
+  def toggle(self) -> None:
+    if self.running:
+      self.stop()
+    else:
+      self.start()
+
+def start_queue_logging(handlers: list[logging.Handler], level: int = logging.INFO, fmt: Optional[str] = None) -> logging.handlers.QueueListener:
+  """Route root logging through a queue so emitting a record never blocks on I/O.
+
+  The given handlers run on the listener's thread; stop the returned
+  listener at exit to flush what is still queued.
+  """
+  formatter = logging.Formatter(fmt)
+  for handler in handlers:
+    handler.setFormatter(formatter)
+  records: queue.SimpleQueue = queue.SimpleQueue()
+  root = logging.getLogger()
+  root.setLevel(level)
+  root.addHandler(logging.handlers.QueueHandler(records))
+  listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+  listener.start()
+  return listener
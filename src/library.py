@@ -0,0 +1,314 @@
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from array import array
+from typing import Optional
+
+from instrumentation import timed
+from persistence import apply_op, read_legacy_playlist
+from playlist import Playlist, TrackTable
+
+LIBRARY_FILE: str = "library.db"
+DEFAULT_PLAYLIST: str = "Library"
+DEBOUNCE_SECONDS: float = 1.0
+
+SCHEMA: tuple[str, ...] = (
+  "CREATE TABLE IF NOT EXISTS tracks (id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT NOT NULL UNIQUE)",
+  "CREATE TABLE IF NOT EXISTS playlists (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, track_ids BLOB NOT NULL)",
+  "CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)"
+)
+
+def pack_ids(track_ids: array) -> bytes:
+  """Track IDs as little-endian int64s."""
+  if sys.byteorder != "little":
+    track_ids = array("q", track_ids)
+    track_ids.byteswap()
+  return track_ids.tobytes()
+
+def unpack_ids(blob: bytes) -> array:
+  track_ids = array("q")
+  track_ids.frombytes(blob)
+  if sys.byteorder != "little":
+    track_ids.byteswap()
+  return track_ids
+
+class StoredTracks(TrackTable):
+  """The library's track table, read from the database on a background thread.
+
+  Until it has loaded, a path asked for by ID is read on its own, so the
+  visible rows of the active playlist show without waiting for the whole
+  table. Lookups by path, changes and iteration wait for the load.
+  """
+
+  def __init__(self, db_path: str, next_id: int) -> None:
+    super().__init__(next_id=next_id)
+    self.db_path = db_path
+    self._loaded = threading.Event()
+    threading.Thread(target=self._load, name="library-tracks", daemon=True).start()
+
+  def _load(self) -> None:
+    try:
+      connection = sqlite3.connect(self.db_path)
+      try:
+        paths = {track_id: sys.intern(path) for track_id, path in connection.execute("SELECT id, path FROM tracks")}
+      finally:
+        connection.close()
+      self._ids = dict(zip(paths.values(), paths.keys()))
+      self._paths = paths
+      self.next_id = max(self.next_id, max(paths, default=0) + 1)
+    except sqlite3.Error as e:
+      logging.error(f"Error loading library tracks: {e}")
+    finally:
+      self._loaded.set()
+
+  def wait_loaded(self, timeout: Optional[float] = None) -> bool:
+    return self._loaded.wait(timeout)
+
+  def path(self, track_id: int) -> str:
+    try:
+      return self._paths[track_id]
+    except KeyError:
+      if self._loaded.is_set():
+        raise
+    connection = sqlite3.connect(self.db_path)
+    try:
+      row = connection.execute("SELECT path FROM tracks WHERE id = ?", (track_id,)).fetchone()
+    finally:
+      connection.close()
+    if row is None:
+      raise KeyError(track_id)
+    return row[0]
+
+class LibraryStore:
+  """Named playlists over one shared track table in a SQLite database.
+
+  Every track path is stored once in `tracks`; a playlist is a row holding
+  its order as a packed array of track IDs. Opening the store reads only
+  the active playlist and loads the track table in the background. Other
+  playlists are read the first time they are opened (one row, no
+  per-entry work) and then stay in memory, so switching costs what the
+  view renders.
+
+  Changes are applied in memory and written together, at most `debounce`
+  seconds after the first one, in a single transaction. Renaming a track
+  updates one row and every playlist follows. Discarding paths (files that
+  are gone) removes the tracks, and the IDs are pruned from every stored
+  playlist in the same transaction.
+  """
+
+  def __init__(self, path: str = LIBRARY_FILE, legacy_path: Optional[str] = None, debounce: float = DEBOUNCE_SECONDS) -> None:
+    self.path = path
+    self.legacy_path = legacy_path
+    self.debounce = debounce
+    self.tracks = TrackTable()
+    self.names: list[str] = []
+    self.active: Optional[str] = None
+    self._playlists: dict[str, Playlist] = {}
+    self._dirty: set[str] = set()
+    self._persisted_id: int = 1  # tracks with lower IDs are already in the database
+    self._saved_active: Optional[str] = None
+    self._timer: Optional[threading.Timer] = None
+    self._lock = threading.Lock()
+    self._io_lock = threading.Lock()
+
+  def _connect(self) -> sqlite3.Connection:
+    connection = sqlite3.connect(self.path)
+    for statement in SCHEMA:
+      connection.execute(statement)
+    return connection
+
+  @timed("library_store.load")
+  def load(self) -> Playlist:
+    """Open the database at the active playlist, importing the legacy playlist file on first use."""
+    self.flush()
+    with self._io_lock:
+      connection = self._connect()
+      try:
+        sequence = connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'tracks'").fetchone()
+        names = [row[0] for row in connection.execute("SELECT name FROM playlists ORDER BY id")]
+        active = connection.execute("SELECT value FROM settings WHERE key = 'active'").fetchone()
+      finally:
+        connection.close()
+    with self._lock:
+      self.tracks = StoredTracks(self.path, sequence[0] + 1 if sequence else 1)
+      self._persisted_id = self.tracks.next_id
+      self._playlists = {}
+      self._dirty = set()
+    self.names = names
+    self._saved_active = active[0] if active else None
+    if not self.names:
+      self._migrate()
+    logging.info(f"Opened library with {len(self.names)} playlists.")
+    return self.open(self._saved_active if self._saved_active in self.names else self.names[0])
+
+  def _migrate(self) -> None:
+    """One-shot import of the single-list playlist file (and its journal) as the first playlist."""
+    paths: list[str] = []
+    if self.legacy_path is not None and os.path.exists(self.legacy_path):
+      try:
+        paths = read_legacy_playlist(self.legacy_path) or []
+        logging.info(f"Imported {len(paths)} tracks from '{self.legacy_path}'.")
+      except (IOError, ValueError) as e:
+        logging.error(f"Cannot import '{self.legacy_path}': {e}")
+    self.create(DEFAULT_PLAYLIST)
+    with self._lock:
+      self._playlists[DEFAULT_PLAYLIST].extend(paths)
+      self._dirty.add(DEFAULT_PLAYLIST)
+    self.flush()
+
+  def open(self, name: str) -> Playlist:
+    """Make a playlist active, reading it from disk the first time it is used."""
+    playlist = self._load(name)
+    self.active = name
+    self._schedule()
+    return playlist
+
+  def _load(self, name: str) -> Playlist:
+    """A playlist, read from disk the first time it is used."""
+    with self._lock:
+      playlist = self._playlists.get(name)
+    if playlist is None:
+      self.flush()  # stored playlists must not refer to tracks discarded in memory
+      with self._io_lock:
+        connection = self._connect()
+        try:
+          row = connection.execute("SELECT track_ids FROM playlists WHERE name = ?", (name,)).fetchone()
+        finally:
+          connection.close()
+      if row is None:
+        raise KeyError(f"No playlist named '{name}'")
+      with self._lock:
+        playlist = self._playlists.setdefault(name, Playlist.from_track_ids(unpack_ids(row[0]), self.tracks))
+    return playlist
+
+  def create(self, name: str) -> None:
+    """Add an empty playlist."""
+    if name in self.names:
+      raise ValueError(f"A playlist named '{name}' already exists")
+    with self._io_lock:
+      connection = self._connect()
+      try:
+        with connection:
+          connection.execute("INSERT INTO playlists (name, track_ids) VALUES (?, ?)", (name, b""))
+      finally:
+        connection.close()
+    with self._lock:
+      self._playlists[name] = Playlist(tracks=self.tracks)
+    self.names.append(name)
+
+  def delete(self, name: str) -> None:
+    """Delete a playlist. Its tracks stay in the library."""
+    if name not in self.names:
+      raise KeyError(f"No playlist named '{name}'")
+    if name == self.active:
+      raise ValueError("The active playlist cannot be deleted")
+    with self._lock:
+      self._playlists.pop(name, None)
+      self._dirty.discard(name)
+    with self._io_lock:
+      connection = self._connect()
+      try:
+        with connection:
+          connection.execute("DELETE FROM playlists WHERE name = ?", (name,))
+      finally:
+        connection.close()
+    self.names.remove(name)
+
+  def apply(self, playlist: Playlist, op: dict) -> None:
+    """Apply an operation to the active playlist and queue it for the next flush.
+
+    Discarded and renamed paths are files that were deleted or moved, so
+    every loaded playlist follows; discarded ones leave the track table too.
+    """
+    self._apply(self.active, playlist, op)
+
+  def apply_to(self, name: str, op: dict) -> Playlist:
+    """Apply an operation to a playlist by name, loading it if needed without making it active."""
+    playlist = self._load(name)
+    self._apply(name, playlist, op)
+    return playlist
+
+  def _apply(self, name: str, playlist: Playlist, op: dict) -> None:
+    with self._lock:
+      apply_op(playlist, op)
+      self._dirty.add(name)
+      for other_name, other in self._playlists.items():
+        if other is playlist:
+          continue
+        if op["op"] == "discard" and other.discard(op["paths"]) or op["op"] == "rename" and other.rename(op["old"], op["new"]):
+          self._dirty.add(other_name)
+      if op["op"] == "discard":
+        self.tracks.remove(op["paths"])
+    self._schedule()
+
+  def _schedule(self) -> None:
+    with self._lock:
+      if self._timer is None:
+        self._timer = threading.Timer(self.debounce, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+  @timed("library_store.flush")
+  def flush(self) -> None:
+    """Write queued changes now, in one transaction."""
+    with self._io_lock:
+      with self._lock:
+        if self._timer is not None:
+          self._timer.cancel()
+          self._timer = None
+        added, renamed, removed = [], [], []
+        persisted_id = self._persisted_id
+        if self.tracks.wait_loaded(0):  # nothing can change before the table has loaded
+          added, renamed, removed = self.tracks.take_changes(persisted_id)
+          self._persisted_id = self.tracks.next_id
+        dirty, self._dirty = self._dirty, set()
+        orders = [(pack_ids(self._playlists[name].track_ids()), name) for name in dirty if name in self._playlists]
+        active = self.active if self.active != self._saved_active else None
+      if not (added or renamed or removed or orders or active):
+        return
+      try:
+        connection = self._connect()
+        try:
+          with connection:
+            connection.executemany("DELETE FROM tracks WHERE id = ?", [(track_id,) for track_id in removed])
+            connection.executemany("UPDATE tracks SET path = ? WHERE id = ?", renamed)
+            connection.executemany("INSERT INTO tracks (id, path) VALUES (?, ?)", added)
+            connection.executemany("UPDATE playlists SET track_ids = ? WHERE name = ?", orders)
+            if removed:
+              self._prune(connection, set(removed), {name for _, name in orders})
+            if active is not None:
+              connection.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('active', ?)", (active,))
+        finally:
+          connection.close()
+        if active is not None:
+          self._saved_active = active
+        logging.info(f"Saved library: {len(added)} tracks added, {len(renamed)} renamed, {len(removed)} removed, {len(orders)} playlists written.")
+      except sqlite3.Error as e:
+        logging.error(f"Error saving library, will retry: {e}")
+        with self._lock:
+          self._persisted_id = persisted_id
+          self.tracks.restore_changes(renamed, removed)
+          self._dirty |= dirty
+        self._schedule()
+
+  def _prune(self, connection: sqlite3.Connection, removed: set[int], written: set[str]) -> None:
+    """Drop removed track IDs from stored playlists that were not just rewritten."""
+    for name, blob in connection.execute("SELECT name, track_ids FROM playlists").fetchall():
+      if name in written:
+        continue
+      track_ids = unpack_ids(blob)
+      kept = array("q", (track_id for track_id in track_ids if track_id not in removed))
+      if len(kept) != len(track_ids):
+        connection.execute("UPDATE playlists SET track_ids = ? WHERE name = ?", (pack_ids(kept), name))
+
+  def save(self) -> None:
+    """Write every loaded playlist now."""
+    with self._lock:
+      self._dirty.update(self._playlists)
+    self.flush()
+
+  def close(self) -> None:
+    """Flush on shutdown."""
+    self.flush()
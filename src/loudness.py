@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import functools
+import logging
+import os
+import shutil
+import struct
+import subprocess
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import IO, TYPE_CHECKING, Callable, Optional
+
+if TYPE_CHECKING:
+  import numpy as np
+
+SAMPLE_RATE: int = 48000
+SUB_BLOCK: int = SAMPLE_RATE // 10  # 100 ms; four make one 400 ms gating block
+CHUNK_SUB_BLOCKS: int = 50          # decode 5 s at a time
+TARGET_LOUDNESS: float = -18.0      # ReplayGain 2.0 reference level in LUFS
+ABSOLUTE_GATE: float = -70.0
+RELATIVE_GATE: float = -10.0
+
+# ITU-R BS.1770 K-weighting biquads for 48 kHz: (b, a) for the shelf and high-pass stages
+K_WEIGHTING: tuple[tuple[tuple[float, ...], tuple[float, ...]], ...] = (
+  ((1.53512485958697, -2.69169618940638, 1.19839281085285), (1.0, -1.69065929318241, 0.73248077421585)),
+  ((1.0, -2.0, 1.0), (1.0, -1.99004745483398, 0.99007225036621))
+)
+# BS.1770 channel weights for ffmpeg's 5.0, 5.1 and 7.1 layouts: surrounds count 1.41 times, the LFE not at all
+CHANNEL_WEIGHTS: dict[int, tuple[float, ...]] = {
+  5: (1.0, 1.0, 1.0, 1.41, 1.41),
+  6: (1.0, 1.0, 1.0, 0.0, 1.41, 1.41),
+  8: (1.0, 1.0, 1.0, 0.0, 1.41, 1.41, 1.41, 1.41),
+}
+
+@functools.lru_cache(maxsize=None)
+def _pole_responses(a: tuple[float, ...]) -> tuple[np.ndarray, np.ndarray]:
+  """Responses of 1 / A(z) over one block: the spectrum of its impulse response, and its responses to a unit output one and two samples before the block."""
+  import numpy as np
+  _, a1, a2 = a
+  responses = np.zeros((3, SUB_BLOCK))
+  for row, (impulse, y1, y2) in enumerate(((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0))):
+    for n in range(SUB_BLOCK):
+      y = (impulse if n == 0 else 0.0) - a1 * y1 - a2 * y2
+      responses[row, n] = y
+      y1, y2 = y, y1
+  return np.fft.rfft(responses[0], n=2 * SUB_BLOCK), responses[1:]
+
+class _Biquad:
+  """One K-weighting stage, run over whole 100 ms blocks with its state carried from call to call.
+
+  Within a block the recursive part is a convolution with the impulse
+  response of 1 / A(z), done by FFT for every block at once. Only the two
+  output samples each block hands to the next go through a Python loop, so
+  the result matches a direct-form filter without a loop per sample.
+  """
+
+  def __init__(self, b: tuple[float, ...], a: tuple[float, ...], channels: int) -> None:
+    import numpy as np
+    self.b = b
+    self.impulse, self.from_state = _pole_responses(a)  # from_state has shape (2, SUB_BLOCK)
+    self.inputs = np.zeros((2, channels))  # the last two input samples
+    self.outputs = np.zeros((2, channels))  # the last two output samples, latest first
+
+  def __call__(self, samples: np.ndarray) -> np.ndarray:
+    """Filter samples of shape (blocks, SUB_BLOCK, channels)."""
+    import numpy as np
+    blocks, _, channels = samples.shape
+    flat = np.concatenate([self.inputs, samples.reshape(-1, channels)])
+    self.inputs = flat[-2:].copy()
+    b0, b1, b2 = self.b
+    forward = (b0 * flat[2:] + b1 * flat[1:-1] + b2 * flat[:-2]).reshape(blocks, SUB_BLOCK, channels)
+    spectrum = np.fft.rfft(forward, n=2 * SUB_BLOCK, axis=1) * self.impulse[:, None]
+    output = np.fft.irfft(spectrum, n=2 * SUB_BLOCK, axis=1)[:, :SUB_BLOCK]
+    states = np.empty((blocks, 2, channels))
+    ends = self.from_state[:, [-1, -2]]  # how each state sample reaches the block's last two outputs
+    for block in range(blocks):
+      states[block] = self.outputs
+      self.outputs = output[block, [-1, -2]] + ends.T @ self.outputs
+    output += self.from_state.T @ states
+    return output
+
+def _read_wav_channels(stream: IO[bytes]) -> Optional[int]:
+  """Read a streamed WAV header up to its data chunk and return the channel count."""
+  header = stream.read(12)
+  if len(header) < 12 or header[:4] != b"RIFF" or header[8:] != b"WAVE":
+    return None
+  channels = None
+  while len(chunk := stream.read(8)) == 8:
+    name, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+    if name == b"data":
+      return channels
+    body = stream.read(size + size % 2)
+    if name == b"fmt " and len(body) >= 4:
+      channels = struct.unpack_from("<H", body, 2)[0]
+  return None
+
+def ffmpeg_available() -> bool:
+  return shutil.which("ffmpeg") is not None
+
+def measure_loudness(stream: IO[bytes]) -> Optional[tuple[float, float]]:
+  """(Integrated loudness in LUFS, sample peak) of a 48 kHz 32-bit float WAV stream, read a few seconds at a time."""
+  import numpy as np
+  channels = _read_wav_channels(stream)
+  if not channels:
+    return None
+  stages = [_Biquad(b, a, channels) for b, a in K_WEIGHTING]
+  weights = np.array(CHANNEL_WEIGHTS.get(channels, (1.0,) * channels))
+  block_bytes = SUB_BLOCK * channels * 4
+  energies: list[np.ndarray] = []
+  peak = 0.0
+  carry = b""
+  while data := stream.read(block_bytes * CHUNK_SUB_BLOCKS):
+    data = carry + data
+    usable = len(data) - len(data) % block_bytes
+    carry = data[usable:]
+    samples = np.frombuffer(data[:usable], dtype="<f4").reshape(-1, SUB_BLOCK, channels)
+    if samples.size:
+      peak = max(peak, float(np.abs(samples).max()))
+      weighted = samples.astype(np.float64)
+      for stage in stages:
+        weighted = stage(weighted)
+      energies.append(np.square(weighted).mean(axis=1) @ weights)
+  if not energies:
+    return None
+  sub_blocks = np.concatenate(energies)
+  if len(sub_blocks) < 4:
+    blocks = sub_blocks[:1] if len(sub_blocks) else sub_blocks
+  else:
+    window = np.lib.stride_tricks.sliding_window_view(sub_blocks, 4)
+    blocks = window.mean(axis=1)
+  with np.errstate(divide="ignore"):
+    block_loudness = -0.691 + 10 * np.log10(blocks)
+  gated = blocks[block_loudness > ABSOLUTE_GATE]
+  if not gated.size:
+    return ABSOLUTE_GATE, peak
+  relative_threshold = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE
+  gated = blocks[block_loudness > max(ABSOLUTE_GATE, relative_threshold)]
+  loudness = -0.691 + 10 * np.log10(gated.mean())
+  return float(loudness), peak
+
+def analyze_loudness(path: str) -> Optional[tuple[float, float]]:
+  """Stream-decode a track and return (integrated loudness in LUFS, sample peak).
+
+  Audio is decoded by ffmpeg to 48 kHz float PCM in its own channel layout,
+  so mono is measured as one channel rather than duplicated, and processed a
+  few seconds at a time: memory use does not grow with track length beyond
+  one float per 100 ms for gating.
+  """
+  command = [
+    "ffmpeg", "-v", "error", "-nostdin", "-i", path, "-map", "0:a:0",
+    "-c:a", "pcm_f32le", "-ar", str(SAMPLE_RATE), "-f", "wav", "-"
+  ]
+  with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+    result = measure_loudness(process.stdout)
+  if process.returncode != 0:
+    return None
+  return result
+
+def gain_for(loudness: Optional[float], peak: Optional[float], target: float = TARGET_LOUDNESS) -> float:
+  """Linear gain that brings a track to the target loudness without clipping its peak."""
+  if loudness is None:
+    return 1.0
+  gain = 10 ** ((target - loudness) / 20)
+  if peak:
+    gain = min(gain, 1.0 / peak)
+  return gain
+
+class LoudnessAnalyzer:
+  """Runs loudness analysis in a background process pool, once per file."""
+
+  def __init__(self, on_result: Callable[[str, float, float], None], max_workers: Optional[int] = None) -> None:
+    self.on_result = on_result
+    self.max_workers = max_workers or max(1, (os.cpu_count() or 2) // 2)
+    self._executor: Optional[ProcessPoolExecutor] = None
+    self._pending: set[str] = set()
+    self._lock = threading.Lock()
+    self._warned = False
+
+  def request(self, path: str) -> None:
+    """Analyze a file in the background unless it is already queued."""
+    if not ffmpeg_available():
+      if not self._warned:
+        logging.warning("ffmpeg not found; loudness normalization disabled.")
+        self._warned = True
+      return
+    with self._lock:
+      if path in self._pending:
+        return
+      self._pending.add(path)
+      if self._executor is None:
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+      future = self._executor.submit(analyze_loudness, path)
+    future.add_done_callback(lambda done: self._finished(path, done))
+
+  def _finished(self, path: str, future: Future) -> None:
+    with self._lock:
+      self._pending.discard(path)
+    if future.cancelled():
+      return
+    try:
+      result = future.result()
+    except Exception as e:
+      logging.error(f"Loudness analysis failed for '{path}': {e}")
+      return
+    if result is None:
+      logging.warning(f"Could not analyze loudness of '{path}'.")
+      return
+    loudness, peak = result
+    logging.info(f"Loudness of '{path}': {loudness:.1f} LUFS, peak {peak:.3f}.")
+    self.on_result(path, loudness, peak)
+
+  def close(self) -> None:
+    with self._lock:
+      if self._executor is not None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
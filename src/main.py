@@ -1,50 +1,110 @@
+import time
+STARTED: float = time.perf_counter()
+
+import argparse
 import logging
+import logging.handlers
 from tkinterdnd2 import TkinterDnD
 from tkinter import Tk
+from typing import Optional
+from control import DEFAULT_CONTROL_ADDRESS, ControlServer
+from dedup import DUPLICATE_MODES, DUPLICATES_SKIP
 from gui import create_gui  # Import the function here
 from player import Player
+from preload import TRACK_CACHE_BYTES
+from scheduler import PlaybackScheduler
+from instrumentation import LoopLagMonitor, Profiler, metrics, start_queue_logging
+
+def parse_arguments() -> argparse.Namespace:
+    """Parse command-line options."""
+    parser = argparse.ArgumentParser(description="Desktop Music Player")
+    parser.add_argument("--profile", action="store_true", help="profile from startup; report written on exit (F12 toggles at runtime, PLAYER_METRICS=1 samples main-loop lag without profiling)")
+    parser.add_argument("--control", default=DEFAULT_CONTROL_ADDRESS, metavar="ADDRESS", help=f"socket path or host:port for remote control with remote.py (default: {DEFAULT_CONTROL_ADDRESS})")
+    parser.add_argument("--no-control", action="store_true", help="do not accept remote control commands")
+    parser.add_argument("--duplicates", choices=DUPLICATE_MODES, default=DUPLICATES_SKIP, help="when importing, skip duplicate tracks, merge them into the better-tagged copy, or keep them (default: %(default)s)")
+    parser.add_argument("--exit-when-interactive", action="store_true", help="quit once the window is interactive; for timing startup")
+    parser.add_argument("--cache-mb", type=int, default=TRACK_CACHE_BYTES // (1024 * 1024), metavar="MB", help="memory for reading tracks ahead from slow or network storage (default: %(default)s)")
+    return parser.parse_args()
+
+def configure_logging() -> logging.handlers.QueueListener:
+    """Configure application-wide logging; modules only log, they never configure.
+
+    Records are queued and written by a listener thread, so logging never
+    blocks the UI thread on file or console I/O.
+    """
+    return start_queue_logging(
+        [logging.FileHandler("app.log"), logging.StreamHandler()],
+        level=logging.INFO,
+        fmt="%(asctime)s - %(levelname)s - %(message)s"
+    )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("app.log"),
-        logging.StreamHandler()
-    ]
-)
-
-def initialize_application() -> tuple[TkinterDnD.Tk, Player]:
+def report_startup_time() -> None:
+    """Log the time from interpreter start of this module to the first idle event loop pass."""
+    logging.info(f"Time to interactive: {(time.perf_counter() - STARTED) * 1000:.0f} ms.")
+
+def initialize_application(cache_bytes: int = TRACK_CACHE_BYTES, duplicates: str = DUPLICATES_SKIP) -> tuple[TkinterDnD.Tk, Player]:
     """Initialize root window and player instance."""
     logging.info("Initializing the application...")
     try:
         root: TkinterDnD.Tk = TkinterDnD.Tk()
-        player: Player = Player()
+        root.update()  # map the window before loading the playlist
+        player: Player = Player(cache_bytes=cache_bytes, duplicates=duplicates)
         return root, player
     except Exception as e:
         logging.error(f"Failed to initialize application: {e}", exc_info=True)
         raise
 
-def run_application(root: TkinterDnD.Tk, player: Player) -> None:
+def start_control_server(root: TkinterDnD.Tk, player: Player, address: Optional[str]) -> Optional[ControlServer]:
+    """Accept remote commands on the address; the player keeps running without them if it cannot be bound."""
+    if address is None:
+        return None
+    server = ControlServer(player, address)
+    try:
+        server.start()
+    except OSError as e:
+        logging.error(f"Remote control disabled: {e}")
+        return None
+    return server
+
+def run_application(root: TkinterDnD.Tk, player: Player, profiler: Profiler, control_address: Optional[str] = None, exit_when_interactive: bool = False) -> None:
     """Set up GUI and run the application."""
     logging.info("Setting up the GUI...")
+    control: Optional[ControlServer] = None
     try:
-        create_gui(root, player)  # Initialize the GUI here
+        create_gui(root, player, profiler)  # Initialize the GUI here
+        player.commands.attach(root)  # run commands from other threads on the Tk thread
+        PlaybackScheduler(root, player).start()
+        profiler.attach_lag_monitor(LoopLagMonitor(root))
+        control = start_control_server(root, player, control_address)
+        root.after_idle(report_startup_time)
+        if exit_when_interactive:
+            root.after_idle(root.quit)
         logging.info("Starting the main application loop.")
         root.mainloop()
     except Exception as e:
         logging.error(f"An error occurred while running the application: {e}", exc_info=True)
         raise
+    finally:
+        if control is not None:
+            control.close()
 
 def main() -> None:
     """Run the music player app."""
+    arguments = parse_arguments()
+    listener = configure_logging()
+    profiler = Profiler()
+    if arguments.profile:
+        profiler.start()
     try:
-        root, player = initialize_application()
-        run_application(root, player)
+        root, player = initialize_application(arguments.cache_mb * 1024 * 1024, arguments.duplicates)
+        run_application(root, player, profiler, None if arguments.no_control else arguments.control, arguments.exit_when_interactive)
     except Exception as e:
         logging.critical(f"Application crashed: {e}", exc_info=True)
     finally:
+        profiler.stop()
+        logging.info(f"Performance counters:\n{metrics.report()}")
         logging.info("Application shutdown.")
+        listener.stop()
 
 if __name__ == "__main__":
     main()
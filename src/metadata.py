@@ -0,0 +1,261 @@
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import astuple, dataclass, replace
+from typing import Optional
+
+from events import EventBus
+from formats import detect_format, read_tags
+from instrumentation import metrics
+
+METADATA_FILE: str = "metadata.db"
+FLUSH_THRESHOLD: int = 256
+
+@dataclass(frozen=True)
+class TrackMetadata:
+  """Tag and stream details for a single audio file."""
+  path: str
+  mtime_ns: int
+  size: int
+  duration: Optional[float] = None
+  title: Optional[str] = None
+  artist: Optional[str] = None
+  album: Optional[str] = None
+  bitrate: Optional[int] = None
+  sample_rate: Optional[int] = None
+  loudness: Optional[float] = None
+  peak: Optional[float] = None
+  format_name: Optional[str] = None  # detected AudioFormat; "" if none matched, None if probed before it was recorded
+
+  @property
+  def duration_str(self) -> str:
+    """Duration formatted as m:ss, or 'Unknown' if it could not be read."""
+    if self.duration is None:
+      return "Unknown"
+    mins, secs = divmod(int(self.duration), 60)
+    return f"{mins}:{secs:02d}"
+
+COLUMNS: tuple[str, ...] = tuple(TrackMetadata.__dataclass_fields__)
+
+def _first_tag(tags: Optional[dict], key: str) -> Optional[str]:
+  """Return the first value of an easy tag, if present."""
+  if not tags:
+    return None
+  values = tags.get(key)
+  return str(values[0]) if values else None
+
+def probe_track(path: str, stat: Optional[os.stat_result] = None) -> TrackMetadata:
+  """Read tags and stream info for a file. Never raises for unreadable audio."""
+  stat = stat or os.stat(path)
+  audio_format = detect_format(path)
+  format_name = audio_format.name if audio_format is not None else ""
+  try:
+    audio = read_tags(path, audio_format)
+  except Exception as e:
+    logging.error(f"Error reading metadata for '{path}': {e}")
+    audio = None
+  if audio is None:
+    return TrackMetadata(path, stat.st_mtime_ns, stat.st_size, format_name=format_name)
+  info = audio.info
+  return TrackMetadata(
+    path=path,
+    mtime_ns=stat.st_mtime_ns,
+    size=stat.st_size,
+    duration=getattr(info, "length", None),
+    title=_first_tag(audio.tags, "title"),
+    artist=_first_tag(audio.tags, "artist"),
+    album=_first_tag(audio.tags, "album"),
+    bitrate=getattr(info, "bitrate", None),
+    sample_rate=getattr(info, "sample_rate", None),
+    format_name=format_name
+  )
+
+class MetadataCache:
+  """Persistent track metadata keyed by path and invalidated on (mtime, size) change.
+
+  The database is read on a background thread at construction, so creating the
+  cache is instant; lookups made before it finishes simply miss.
+  Lookups never touch the file system: entries are served from memory and any
+  path not yet confirmed this session is validated (and re-probed if it changed)
+  on a background worker. `version` is bumped whenever an entry changes so
+  readers can tell when to redraw, and an "updated" event carrying the new
+  entries is published (from the worker thread) for incremental consumers;
+  "loaded" is published once the on-disk cache is in memory.
+  """
+
+  def __init__(self, db_path: str = METADATA_FILE, max_workers: int = 2) -> None:
+    self.db_path = db_path
+    self.version: int = 0
+    self.events = EventBus()
+    self._entries: dict[str, TrackMetadata] = {}
+    self._validated: set[str] = set()
+    self._pending: set[str] = set()
+    self._dirty: dict[str, TrackMetadata] = {}
+    self._deleted: set[str] = set()
+    self._lock = threading.Lock()
+    self._db_lock = threading.Lock()
+    self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="metadata")
+    self._loaded = threading.Event()
+    threading.Thread(target=self.load, name="metadata-load", daemon=True).start()
+
+  def _connect(self) -> sqlite3.Connection:
+    connection = sqlite3.connect(self.db_path)
+    connection.execute(
+      "CREATE TABLE IF NOT EXISTS tracks ("
+      "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, duration REAL, "
+      "title TEXT, artist TEXT, album TEXT, bitrate INTEGER, sample_rate INTEGER, "
+      "loudness REAL, peak REAL, format_name TEXT)"
+    )
+    existing = {row[1] for row in connection.execute("PRAGMA table_info(tracks)")}
+    for column, kind in (("loudness", "REAL"), ("peak", "REAL"), ("format_name", "TEXT")):
+      if column not in existing:
+        connection.execute(f"ALTER TABLE tracks ADD COLUMN {column} {kind}")
+    return connection
+
+  def load(self) -> None:
+    """Load all cached entries from disk into memory."""
+    try:
+      with self._db_lock:
+        connection = self._connect()
+        try:
+          rows = connection.execute(f"SELECT {', '.join(COLUMNS)} FROM tracks").fetchall()
+        finally:
+          connection.close()
+      loaded = {row[0]: TrackMetadata(*row) for row in rows}
+      with self._lock:
+        loaded.update(self._entries)
+        for path in self._deleted:
+          loaded.pop(path, None)
+        self._entries = loaded
+        self.version += 1
+      logging.info(f"Loaded metadata for {len(rows)} tracks.")
+    except sqlite3.Error as e:
+      logging.error(f"Error loading metadata cache: {e}")
+    finally:
+      self._loaded.set()
+    self.events.publish("loaded")
+
+  def wait_loaded(self, timeout: Optional[float] = None) -> bool:
+    """Block until the on-disk cache has been read into memory."""
+    return self._loaded.wait(timeout)
+
+  def flush(self) -> None:
+    """Write changed entries to disk."""
+    with self._lock:
+      dirty, self._dirty = list(self._dirty.values()), {}
+      deleted, self._deleted = list(self._deleted), set()
+    if not dirty and not deleted:
+      return
+    try:
+      with self._db_lock:
+        connection = self._connect()
+        try:
+          with connection:
+            connection.executemany("DELETE FROM tracks WHERE path = ?", [(path,) for path in deleted])
+            connection.executemany(
+              f"INSERT OR REPLACE INTO tracks ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+              [astuple(m) for m in dirty]
+            )
+        finally:
+          connection.close()
+      logging.info(f"Saved metadata for {len(dirty)} tracks, removed {len(deleted)}.")
+    except sqlite3.Error as e:
+      logging.error(f"Error saving metadata cache: {e}")
+
+  def get(self, path: str) -> Optional[TrackMetadata]:
+    """Return cached metadata and schedule a background refresh if unvalidated."""
+    with self._lock:
+      entry = self._entries.get(path)
+      if path in self._validated or path in self._pending:
+        return entry
+      self._pending.add(path)
+    self._executor.submit(self._refresh, path)
+    return entry
+
+  def peek(self, path: str) -> Optional[TrackMetadata]:
+    """Return cached metadata without scheduling validation."""
+    with self._lock:
+      return self._entries.get(path)
+
+  def _refresh(self, path: str) -> None:
+    """Validate an entry against the file and re-probe it if it changed."""
+    self._loaded.wait()
+    try:
+      stat = os.stat(path)
+    except OSError as e:
+      logging.error(f"Cannot stat '{path}': {e}")
+      with self._lock:
+        self._pending.discard(path)
+        self._validated.add(path)
+      return
+    with self._lock:
+      entry = self._entries.get(path)
+    if entry is None or entry.mtime_ns != stat.st_mtime_ns or entry.size != stat.st_size or entry.format_name is None:
+      metrics.count("metadata.probes")
+      self.put(probe_track(path, stat))
+    with self._lock:
+      self._pending.discard(path)
+      self._validated.add(path)
+
+  def put(self, entry: TrackMetadata) -> None:
+    """Store a freshly probed entry."""
+    self.put_many([entry])
+
+  def put_many(self, entries: list[TrackMetadata]) -> None:
+    """Store freshly probed entries in one step."""
+    if not entries:
+      return
+    with self._lock:
+      for entry in entries:
+        self._entries[entry.path] = entry
+        self._dirty[entry.path] = entry
+        self._validated.add(entry.path)
+      self.version += 1
+      should_flush = len(self._dirty) >= FLUSH_THRESHOLD
+    self.events.publish("updated", entries=entries)
+    if should_flush:
+      self.flush()
+
+  def forget(self, paths: list[str]) -> None:
+    """Drop entries for files that no longer exist."""
+    with self._lock:
+      for path in paths:
+        self._entries.pop(path, None)
+        self._dirty.pop(path, None)
+        self._validated.discard(path)
+        self._deleted.add(path)
+      self.version += 1
+
+  def rename(self, old: str, new: str) -> None:
+    """Move an entry to a file's new path, keeping its tags and analysis."""
+    with self._lock:
+      entry = self._entries.pop(old, None)
+      self._dirty.pop(old, None)
+      self._validated.discard(old)
+      self._deleted.add(old)
+      if entry is None:
+        return
+      entry = replace(entry, path=new)
+      self._deleted.discard(new)
+      self._entries[new] = entry
+      self._dirty[new] = entry
+      self.version += 1
+    self.events.publish("updated", entries=[entry])
+
+  def set_loudness(self, path: str, loudness: float, peak: float) -> None:
+    """Attach loudness analysis results to a cached entry."""
+    entry = self.peek(path)
+    if entry is None:
+      try:
+        entry = probe_track(path)
+      except OSError as e:
+        logging.error(f"Cannot stat '{path}': {e}")
+        return
+    self.put(replace(entry, loudness=loudness, peak=peak))
+
+  def close(self) -> None:
+    """Stop background workers and persist pending changes."""
+    self._executor.shutdown(wait=False, cancel_futures=True)
+    self.flush()
@@ -0,0 +1,90 @@
+import json
+import logging
+import marshal
+import os
+import tempfile
+from typing import Optional
+
+from playlist import Playlist
+
+def atomic_write_marshal(path: str, data: object) -> None:
+  """Write a marshal dump to a temp file next to `path` and rename it into place."""
+  directory = os.path.dirname(os.path.abspath(path))
+  fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".snapshot", dir=directory)
+  try:
+    with os.fdopen(fd, "wb") as file:
+      marshal.dump(data, file)
+    os.replace(tmp_path, path)
+  except BaseException:
+    try:
+      os.unlink(tmp_path)
+    except OSError:
+      pass
+    raise
+
+SNAPSHOT_VERSION: int = 1
+
+def _file_signature(path: str) -> Optional[tuple[int, int]]:
+  try:
+    stat = os.stat(path)
+  except OSError:
+    return None
+  return stat.st_mtime_ns, stat.st_size
+
+def write_startup_snapshot(snapshot_path: str, playlist_path: str, paths: list[str], hints: list[str]) -> None:
+  """Save paths and their display hints for a fast start, tied to the current playlist file."""
+  atomic_write_marshal(snapshot_path, (SNAPSHOT_VERSION, _file_signature(playlist_path), paths, hints))
+
+def read_startup_snapshot(snapshot_path: str, playlist_path: str) -> Optional[tuple[list[str], list[str]]]:
+  """Return (paths, hints) if the snapshot still matches the playlist file."""
+  try:
+    with open(snapshot_path, "rb") as file:
+      version, signature, paths, hints = marshal.load(file)
+  except (OSError, EOFError, ValueError, TypeError) as e:
+    if not isinstance(e, FileNotFoundError):
+      logging.warning(f"Ignoring unreadable startup snapshot: {e}")
+    return None
+  if version != SNAPSHOT_VERSION or signature != _file_signature(playlist_path) or len(paths) != len(hints):
+    return None
+  return paths, hints
+
+def apply_op(playlist: Playlist, op: dict) -> None:
+  """Apply a journaled playlist operation in place."""
+  kind = op["op"]
+  if kind == "add":
+    playlist.extend(op["paths"])
+  elif kind == "remove":
+    playlist.pop(op["index"])
+  elif kind == "move":
+    playlist.move(op["old"], op["new"])
+  elif kind == "set":
+    playlist.replace(op["paths"])
+  elif kind == "permute":
+    playlist.reorder(op["order"])
+  elif kind == "rename":
+    playlist.rename(op["old"], op["new"])
+  elif kind == "discard":
+    playlist.discard(op["paths"])
+  else:
+    raise ValueError(f"Unknown playlist operation: {kind}")
+
+def read_legacy_playlist(path: str) -> Optional[list[str]]:
+  """Paths of the single-list playlist file used before the library database, with its journal replayed.
+
+  Returns None if there is no such file.
+  """
+  if not os.path.exists(path):
+    return None
+  with open(path, "r") as file:
+    data: dict[str, list[str]] = json.load(file)
+  playlist = Playlist(data.get("music_files", []))
+  journal_path = f"{path}.journal"
+  if os.path.exists(journal_path):
+    with open(journal_path, "r") as file:
+      for line in file:
+        try:
+          apply_op(playlist, json.loads(line))
+        except (ValueError, KeyError, IndexError) as e:
+          logging.error(f"Skipping bad journal entry: {e}")
+          break
+  return list(playlist)
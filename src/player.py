@@ -1,139 +1,564 @@
-import json
 import os
-import pygame
 from dataclasses import dataclass, field
 import logging
 import time
-from typing import Optional
-import random
-
-# Configure logging
-logging.basicConfig(
-  level=logging.INFO,
-  format="%(asctime)s - %(levelname)s - %(message)s",
-  handlers=[
-    logging.FileHandler("player.log"),
-    logging.StreamHandler()
-  ]
-)
-
-# Initialize pygame mixer
-try:
-  pygame.mixer.init()
-  logging.info("Pygame mixer initialized successfully.")
-except pygame.error as e:
-  logging.critical(f"Error initializing pygame mixer: {e}")
-  raise SystemExit("Failed to initialize pygame mixer")
+from typing import Callable, Optional
+import sqlite3
+import threading
+from collections import deque
+from audio import AudioBackend, AudioError, create_backend
+from crossfade import Crossfade, CrossfadeEngine
+from dedup import DUPLICATES_KEEP, DUPLICATES_MERGE, DUPLICATES_SKIP, HASH_FILE, DuplicateFinder, ImportCheck
+from events import EventBus
+from formats import TRANSCODE_DIR, TranscodeCache, detect_format, format_named, is_audio_file
+from instrumentation import timed
+from library import LIBRARY_FILE, LibraryStore
+from loudness import LoudnessAnalyzer, gain_for
+from metadata import MetadataCache, TrackMetadata, METADATA_FILE
+from persistence import read_startup_snapshot, write_startup_snapshot
+from playlist import Playlist
+from preload import TRACK_CACHE_BYTES, TrackCache, TrackPreloader
+from search import SearchIndex, tokenize
+from shuffle import ShuffleOrder
+from state import CommandQueue, PlayerState, command
+from waveform import WAVEFORM_DIR, WaveformCache
+from watch import WATCH_FILE, FolderWatcher
+from scanner import LibraryScanner, ScanJob
+
+GAP_HISTORY: int = 100
+HYDRATE_CHUNK: int = 5000
 
 @dataclass
 class Player:
-  PLAYLIST_FILE: str = "playlist.json"
+  PLAYLIST_FILE: str = "playlist.json"  # legacy single playlist, imported once into the library
+  LIBRARY_FILE: str = LIBRARY_FILE
+  METADATA_FILE: str = METADATA_FILE
+  TRANSCODE_DIR: str = TRANSCODE_DIR
+  WAVEFORM_DIR: str = WAVEFORM_DIR
+  WATCH_FILE: str = WATCH_FILE
+  HASH_FILE: str = HASH_FILE
   is_playing: bool = False
-  playlist: list[str] = field(default_factory=list)
+  is_paused: bool = False
+  playlist: Playlist = field(default_factory=Playlist)
   repeat: bool = False
-  current_track_index: Optional[int] = None
+  shuffle: bool = False
+  current_track_id: Optional[int] = None
   volume: float = 0.5
+  version: int = 0
+  gapless: bool = True
+  crossfade: float = 0.0
+  normalize: bool = True
+  cache_bytes: int = TRACK_CACHE_BYTES
+  duplicates: str = DUPLICATES_SKIP  # what add_files does with duplicates: skip, merge or keep
+  gap_latencies_ms: deque[float] = field(default_factory=lambda: deque(maxlen=GAP_HISTORY), repr=False)
+  commands: CommandQueue = field(init=False, repr=False)
+  state: PlayerState = field(default_factory=PlayerState, init=False, repr=False)
+  metadata: MetadataCache = field(init=False, repr=False)
+  scanner: LibraryScanner = field(init=False, repr=False)
+  store: LibraryStore = field(init=False, repr=False)
+  track_cache: TrackCache = field(init=False, repr=False)
+  preloader: TrackPreloader = field(init=False, repr=False)
+  events: EventBus = field(default_factory=EventBus, repr=False)
+  audio: AudioBackend = field(default_factory=create_backend, repr=False)
+  search_index: SearchIndex = field(default_factory=SearchIndex, repr=False)
+  loudness: LoudnessAnalyzer = field(init=False, repr=False)
+  transcoder: TranscodeCache = field(init=False, repr=False)
+  crossfader: CrossfadeEngine = field(init=False, repr=False)
+  waveforms: WaveformCache = field(init=False, repr=False)
+  shuffle_order: ShuffleOrder = field(init=False, repr=False)
+  play_next: deque[int] = field(default_factory=deque, init=False, repr=False)
+  queue_version: int = field(default=0, init=False, repr=False)
+  watcher: FolderWatcher = field(init=False, repr=False)
+  dedup: DuplicateFinder = field(init=False, repr=False)
+  _queued_id: Optional[int] = field(default=None, init=False, repr=False)
+  _queued_end: Optional[float] = field(default=None, init=False, repr=False)  # perf_counter time the current track should run out while the next one is queued
+  _track_gain: float = field(default=1.0, init=False, repr=False)
+  _seek_offset: float = field(default=0.0, init=False, repr=False)
+  _awaiting_id: Optional[int] = field(default=None, init=False, repr=False)
+  _transcoding_next: Optional[str] = field(default=None, init=False, repr=False)
+  _resume_id: Optional[int] = field(default=None, init=False, repr=False)  # last track not played from the queue
+  display_hints: dict[str, str] = field(default_factory=dict, init=False, repr=False)
+  _index_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+  _pending_index_ops: Optional[list[tuple[str, object]]] = field(default=None, init=False, repr=False)
+  _dedup_version: Optional[int] = field(default=None, init=False, repr=False)  # playlist version the duplicate index matches
+  _imports_applied: int = field(default=0, init=False, repr=False)
 
   def __post_init__(self) -> None:
-    """Load playlist and set volume."""
+    """Load playlist and metadata cache and set volume. The creating thread becomes the owner of the player's state."""
+    self.commands = CommandQueue(self._publish_state)
+    self.metadata = MetadataCache(self.METADATA_FILE)
+    self.scanner = LibraryScanner(self.metadata)
+    self.dedup = DuplicateFinder(self.metadata, self.HASH_FILE)
+    self.store = LibraryStore(self.LIBRARY_FILE, legacy_path=self.PLAYLIST_FILE)
+    self.track_cache = TrackCache(self.cache_bytes)
+    self.preloader = TrackPreloader(self.track_cache)
+    self.loudness = LoudnessAnalyzer(self.metadata.set_loudness)
+    self.transcoder = TranscodeCache(self.TRANSCODE_DIR)
+    self.crossfader = CrossfadeEngine(self.audio, self.get_position, self.commands, self.track_cache.open)
+    self.waveforms = WaveformCache(self.WAVEFORM_DIR)
+    self.watcher = FolderWatcher(self.WATCH_FILE, on_change=self.apply_library_changes)
+    self.shuffle_order = ShuffleOrder(self.playlist, self._artist_of)
+    self.metadata.events.subscribe("loaded", self._on_metadata_loaded)
+    self.metadata.events.subscribe("updated", self._on_metadata_updated)
     self.load_playlist()
     self.set_volume(self.volume)
+    self.watcher.start()
+
+  @property
+  def current_track_index(self) -> Optional[int]:
+    """Position of the current track; follows the track when rows move."""
+    if self.current_track_id is None:
+      return None
+    return self.playlist.index_of(self.current_track_id)
+
+  @current_track_index.setter
+  def current_track_index(self, index: Optional[int]) -> None:
+    self.current_track_id = None if index is None else self.playlist.id_at(index)
+
+  @property
+  def current_track_path(self) -> Optional[str]:
+    return None if self.current_track_id is None else self.playlist.path_of(self.current_track_id)
 
+  @property
+  def snapshot_file(self) -> str:
+    return f"{self.LIBRARY_FILE}.snapshot"
+
+  @property
+  def playlist_name(self) -> Optional[str]:
+    return self.store.active
+
+  @command
   def load_playlist(self) -> None:
-    """Load playlist from file."""
-    if os.path.exists(self.PLAYLIST_FILE):
-      try:
-        with open(self.PLAYLIST_FILE, "r") as file:
-          data: dict[str, list[str]] = json.load(file)
-          self.playlist = data.get("music_files", [])
-          self.current_track_index = 0 if self.playlist else None
-          logging.info("Playlist loaded successfully.")
-      except (IOError, json.JSONDecodeError) as e:
-        logging.error(f"Error loading playlist: {e}")
-        self.playlist = []
-    else:
-      logging.warning("Playlist file not found; starting with empty playlist.")
-      self.save_playlist()
+    """Open the library at its active playlist; the startup snapshot supplies display hints if it is current."""
+    snapshot = read_startup_snapshot(self.snapshot_file, self.LIBRARY_FILE)
+    if snapshot is not None:
+      paths, hints = snapshot
+      self.display_hints = {path: hint for path, hint in zip(paths, hints) if hint}
+    try:
+      playlist = self.store.load()
+    except (sqlite3.Error, OSError, KeyError) as e:
+      logging.error(f"Error loading library: {e}")
+      self.playlist = Playlist()
+      return
+    self._show_playlist(playlist)
+    logging.info(f"Playlist '{self.store.active}' loaded successfully.")
+
+  def _show_playlist(self, playlist: Playlist) -> None:
+    self.playlist = playlist
+    self.current_track_index = 0 if self.playlist else None
+    self.shuffle_order = ShuffleOrder(playlist, self._artist_of)
+    self.play_next.clear()
+    self.queue_version += 1
+    self.version += 1
+    self._hydrate_search_index()
+
+  def playlist_names(self) -> list[str]:
+    return list(self.store.names)
+
+  @command
+  @timed("player.switch_playlist")
+  def switch_playlist(self, name: str) -> None:
+    """Stop playback and show another playlist; it is read from disk only the first time."""
+    if name == self.store.active:
+      return
+    try:
+      playlist = self.store.open(name)
+    except (sqlite3.Error, KeyError) as e:
+      logging.error(f"Cannot open playlist '{name}': {e}")
+      return
+    self.stop()
+    self._show_playlist(playlist)
+    logging.info(f"Switched to playlist '{name}'.")
 
+  @command
+  def create_playlist(self, name: str) -> bool:
+    """Add an empty playlist and switch to it."""
+    name = name.strip()
+    if not name:
+      return False
+    try:
+      self.store.create(name)
+    except (sqlite3.Error, ValueError) as e:
+      logging.error(f"Cannot create playlist '{name}': {e}")
+      return False
+    logging.info(f"Created playlist '{name}'.")
+    self.switch_playlist(name)
+    return True
+
+  @command
+  def delete_playlist(self, name: str) -> bool:
+    """Delete a playlist, switching away first if it is shown. Its tracks stay in the library."""
+    others = [other for other in self.store.names if other != name]
+    if not others or name not in self.store.names:
+      logging.warning(f"Cannot delete playlist '{name}'.")
+      return False
+    if name == self.store.active:
+      self.switch_playlist(others[0])
+    try:
+      self.store.delete(name)
+    except (sqlite3.Error, KeyError, ValueError) as e:
+      logging.error(f"Cannot delete playlist '{name}': {e}")
+      return False
+    logging.info(f"Deleted playlist '{name}'.")
+    return True
+
+  def _hydrate_search_index(self) -> None:
+    """Build the search index on a background thread once cached tags are loaded."""
+    playlist = self.playlist.copy()
+    pending: list[tuple[str, object]] = []
+    with self._index_lock:
+      self._pending_index_ops = pending
+
+    def build() -> None:
+      tracks = list(zip(playlist.track_ids(), playlist))
+      self.metadata.wait_loaded()
+      index = SearchIndex()
+      for start in range(0, len(tracks), HYDRATE_CHUNK):
+        if self._pending_index_ops is not pending:
+          return  # superseded; stop competing with the new build for the GIL
+        index.add_many((track_id, path, self.metadata.peek(path)) for track_id, path in tracks[start:start + HYDRATE_CHUNK])
+      with self._index_lock:
+        if self._pending_index_ops is not pending:
+          return  # superseded by a later load
+        for kind, value in pending:
+          self._apply_index_op(index, kind, value)
+        self._pending_index_ops = None
+        self.search_index = index
+      logging.info(f"Search index built for {len(tracks)} tracks.")
+    threading.Thread(target=build, name="search-index", daemon=True).start()
+
+  def _update_search_index(self, kind: str, value: object) -> None:
+    """Apply an index change now, or queue it while the index is being built."""
+    with self._index_lock:
+      if self._pending_index_ops is not None:
+        self._pending_index_ops.append((kind, value))
+      else:
+        self._apply_index_op(self.search_index, kind, value)
+
+  def _apply_index_op(self, index: SearchIndex, kind: str, value: object) -> None:
+    if kind == "add":
+      index.add_many((track_id, path, self.metadata.peek(path)) for track_id, path in value)
+    elif kind == "remove":
+      index.remove(value)
+    elif kind == "update":
+      index.update(value)
+
+  def duration_str(self, path: str) -> str:
+    """Display duration for a track, falling back to the startup snapshot until tags are known."""
+    entry = self.metadata.get(path)
+    if entry is not None:
+      return entry.duration_str
+    return self.display_hints.get(path, "...")
+
+  @timed("player.save_playlist")
   def save_playlist(self) -> None:
-    """Save playlist to file."""
+    """Write every loaded playlist to the library immediately."""
     try:
-      data: dict[str, list[str]] = {"music_files": self.playlist}
-      with open(self.PLAYLIST_FILE, "w") as file:
-        json.dump(data, file, indent=4)
+      self.store.save()
       logging.info("Playlist saved successfully.")
-    except IOError as e:
+    except (IOError, OSError) as e:
       logging.error(f"Error saving playlist: {e}")
 
-  def load_folder(self, folder: str) -> None:
-    """Load MP3 files from folder."""
-    if not os.path.exists(folder):
+  @command
+  def load_folder(self, folder: str, watch: bool = False) -> Optional[ScanJob]:
+    """Start a background scan of a folder tree; poll the job and pass its batches to add_files.
+
+    With `watch`, later changes under the folder are picked up by
+    apply_library_changes, and new files go to the playlist that is active now.
+    """
+    if not os.path.isdir(folder):
       logging.error(f"The folder '{folder}' does not exist.")
+      return None
+    logging.info(f"Scanning '{folder}'.")
+    if watch:
+      self.watcher.watch(folder, self.store.active)
+    return self.scanner.scan(folder)
+
+  @command
+  def apply_library_changes(self) -> bool:
+    """Apply file changes reported by the folder watcher. Returns True if anything changed.
+
+    Renamed and removed files change every playlist, through the library
+    store. New files go to the playlist their watched folder was added to.
+    """
+    changed = False
+    for delta in self.watcher.drain():
+      for old, new in delta.renamed:
+        self.update_and_save_playlist({"op": "rename", "old": old, "new": new})
+        self.metadata.rename(old, new)
+      if delta.removed:
+        self.update_and_save_playlist({"op": "discard", "paths": delta.removed})
+        self.metadata.forget(delta.removed)
+      added: dict[str, list[str]] = {}
+      for path in delta.added:
+        added.setdefault(self.watcher.owner_of(path) or self.store.active, []).append(path)
+      for name, paths in added.items():
+        self._add_watched_files(name, paths)
+      changed = True
+    return changed
+
+  def _add_watched_files(self, name: str, paths: list[str]) -> None:
+    """Add new files from a watched folder to its playlist; they are checked for duplicates only when it is the active one."""
+    if name not in self.store.names:
+      name = self.store.active  # the folder's playlist was deleted
+    if name == self.store.active:
+      self.add_files(paths)
+      return
+    paths = [path for path in paths if is_audio_file(path, sniff=True)]
+    if not paths:
       return
     try:
-      new_tracks: list[str] = [
-        os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".mp3")
-      ]
-      if new_tracks:
-        self.playlist.extend(new_tracks)
-        self.update_and_save_playlist()
-        logging.info(f"Loaded {len(new_tracks)} tracks from '{folder}'.")
-      else:
-        logging.warning(f"No MP3 files found in '{folder}'.")
-    except Exception as e:
-      logging.error(f"Error loading folder: {e}")
+      self.store.apply_to(name, {"op": "add", "paths": paths})
+    except (sqlite3.Error, KeyError) as e:
+      logging.error(f"Cannot add {len(paths)} new tracks to playlist '{name}': {e}")
+      return
+    logging.info(f"Added {len(paths)} new tracks to playlist '{name}'.")
 
-  def add_file(self, file: str) -> None:
-    """Add MP3 file to playlist."""
-    if file.endswith(".mp3"):
-      self.playlist.append(file)
-      self.update_and_save_playlist()
-      logging.info(f"Added file '{file}' to playlist.")
+  @command
+  def add_files(self, files: list[str], duplicates: Optional[str] = None, then: Optional[Callable[[ImportCheck], None]] = None) -> int:
+    """Add several audio files to the playlist at once. Returns the number of audio files taken.
+
+    Unless `duplicates` (default: the player's setting) is "keep", they are
+    first checked against the playlist in the background and added by
+    _import_checked, which skips or merges the duplicates. `then` is called
+    with the outcome once the files are in the playlist.
+    """
+    new_tracks: list[str] = [file for file in files if is_audio_file(file, sniff=True)]
+    if not new_tracks:
+      return 0
+    mode = duplicates or self.duplicates
+    if mode == DUPLICATES_KEEP:
+      self.update_and_save_playlist({"op": "add", "paths": new_tracks})
+      logging.info(f"Added {len(new_tracks)} tracks to playlist.")
+      if then is not None:
+        then(ImportCheck(self._imports_applied, added=new_tracks))
     else:
-      logging.warning(f"File '{file}' is not an MP3.")
+      snapshot = None if self._dedup_version == self.version else self.playlist.copy()
+      self._dedup_version = self.version
+      self.dedup.check(new_tracks, lambda report: self._import_checked(report, mode, then), snapshot, self._imports_applied)
+    return len(new_tracks)
+
+  @command
+  def add_file(self, file: str) -> None:
+    """Add an audio file to the playlist."""
+    if not self.add_files([file]):
+      logging.warning(f"File '{file}' is not a supported audio file.")
+
+  @command
+  def _import_checked(self, report: ImportCheck, duplicates: str, then: Optional[Callable[[ImportCheck], None]] = None) -> None:
+    """Add the files a duplicate check let through; with "merge", a better-tagged duplicate takes over its original's entries."""
+    in_step = self._dedup_version == self.version
+    self._imports_applied = report.sequence
+    if report.added:
+      self.update_and_save_playlist({"op": "add", "paths": report.added})
+      logging.info(f"Added {len(report.added)} tracks to playlist.")
+    merged = 0
+    if duplicates == DUPLICATES_MERGE:
+      for path, original in report.duplicates:
+        if path != original and self._tag_count(path) > self._tag_count(original):
+          self.update_and_save_playlist({"op": "rename", "old": original, "new": path})
+          merged += 1
+    if in_step and not merged:
+      self._dedup_version = self.version
+    if report.duplicates:
+      logging.info(f"Duplicates: {len(report.duplicates) - merged} skipped, {merged} merged.")
+    if then is not None:
+      then(report)
 
+  def _tag_count(self, path: str) -> int:
+    entry = self.metadata.peek(path)
+    return 0 if entry is None else sum(value is not None for value in (entry.title, entry.artist, entry.album))
+
+  @command
   def remove_track(self, track_index: int) -> None:
     """Remove track by index."""
     if 0 <= track_index < len(self.playlist):
-      removed: str = self.playlist.pop(track_index)
-      self.update_and_save_playlist()
+      removed: str = self.playlist[track_index]
+      self.update_and_save_playlist({"op": "remove", "index": track_index})
       logging.info(f"Removed track '{removed}'.")
     else:
       logging.error(f"Invalid index: {track_index}.")
 
+  @command
   def move_track(self, old_index: int, new_index: int) -> None:
     """Move track to new index."""
     if 0 <= old_index < len(self.playlist) and 0 <= new_index < len(self.playlist):
-      track: str = self.playlist.pop(old_index)
-      self.playlist.insert(new_index, track)
-      self.update_and_save_playlist()
+      track: str = self.playlist[old_index]
+      self.update_and_save_playlist({"op": "move", "old": old_index, "new": new_index})
       logging.info(f"Moved track '{track}' from {old_index} to {new_index}.")
     else:
       logging.error(f"Invalid indices: {old_index} -> {new_index}.")
 
-  def update_and_save_playlist(self) -> None:
-    """Update and save playlist."""
-    self.save_playlist()
+  @command
+  def update_and_save_playlist(self, op: dict) -> None:
+    """Apply a playlist operation, keep the search index in step and schedule it to be persisted."""
+    tracks = self.playlist.tracks
+    removed: list[int] = []
+    renamed: int = 0
+    current_index = self.current_track_index
+    if op["op"] == "remove":
+      removed = [tracks.id_of(self.playlist[op["index"]])]
+    elif op["op"] == "discard":
+      gone = {tracks.id_of(path) for path in op["paths"]}
+      removed = [track_id for track_id in self.playlist.track_ids() if track_id in gone]
+    elif op["op"] == "rename":
+      old = tracks.id_of(op["old"])
+      renamed = len(self.playlist.positions_of((old,))) if old is not None else 0
+    self.store.apply(self.playlist, op)
+    if current_index is not None and self.current_track_index is None:
+      self.current_track_id = None
+      if self.playlist:
+        self.current_track_index = min(current_index, len(self.playlist) - 1)
+    if op["op"] == "add":
+      self._update_search_index("add", [(tracks.id_of(path), path) for path in op["paths"]])
+    elif renamed:
+      for _ in range(renamed):
+        self._update_search_index("remove", old)
+      self._update_search_index("add", [(tracks.id_of(op["new"]), op["new"])] * renamed)
+    for track_id in removed:
+      self._update_search_index("remove", track_id)
+    self.version += 1
     self._update_current_track_index()
+    if self.is_playing:
+      self._preload_next()
+
+  @command
+  def _on_metadata_loaded(self) -> None:
+    """Cached tags became available; settling the command publishes the new metadata version."""
+
+  @command
+  def _on_metadata_updated(self, entries: list[TrackMetadata]) -> None:
+    current_path: Optional[str] = None
+    if self.is_playing and self.current_track_index is not None:
+      current_path = self.playlist[self.current_track_index]
+    for entry in entries:
+      self._update_search_index("update", entry)
+      if entry.path == current_path and entry.loudness is not None:
+        self._update_track_gain(current_path)
+
+  def search(self, query: str) -> Optional[list[int]]:
+    """Playlist indices matching a query, or None when the query is empty."""
+    with self._index_lock:
+      hydrating = self._pending_index_ops is not None
+    if hydrating:
+      terms = tokenize(query)
+      if not terms:
+        return None
+      return [index for index, path in enumerate(self.playlist) if all(term in os.path.basename(path).lower() for term in terms)]
+    matches = self.search_index.search(query)
+    if matches is None:
+      return None
+    return self.playlist.positions_of(matches)
+
+  def _publish_state(self) -> None:
+    """Replace the state snapshot after a command and announce what changed."""
+    state = PlayerState(
+      is_playing=self.is_playing,
+      is_paused=self.is_paused,
+      current_track_id=self.current_track_id,
+      current_track_index=self.current_track_index,
+      playlist_name=self.store.active,
+      playlist_length=len(self.playlist),
+      version=self.version,
+      queue_version=self.queue_version,
+      metadata_version=self.metadata.version,
+      shuffle=self.shuffle,
+      repeat=self.repeat,
+      volume=self.volume,
+      crossfade=self.crossfade,
+      normalize=self.normalize
+    )
+    if state != self.state:
+      changes = state.changes_from(self.state)
+      self.state = state
+      self.events.publish("changed", state=state, changes=changes)
 
   def _update_current_track_index(self) -> None:
-    """Update current track index."""
-    if self.current_track_index is not None and self.current_track_index >= len(self.playlist):
-      self.current_track_index = len(self.playlist) - 1
-    elif self.current_track_index is None and self.playlist:
+    """Point at the first track if nothing is current."""
+    if self.current_track_id is None and self.playlist:
       self.current_track_index = 0
 
+  @command
   def toggle_play(self, track_index: int) -> None:
     """Toggle music playback."""
     if self.is_playing:
-      pygame.mixer.music.stop()
+      self.audio.stop()
       self.is_playing = False
+      self._reset_queue()
+      self.events.publish("state", is_playing=False)
       logging.info("Playback stopped.")
     elif 0 <= track_index < len(self.playlist):
       self.play_music(track_index)
     else:
       logging.warning(f"Invalid index: {track_index}.")
 
+  @command
+  def play(self) -> None:
+    """Resume if paused, otherwise start the current (or first) track."""
+    if self.is_paused:
+      self.resume()
+    elif self.current_track_index is not None:
+      self.play_music(self.current_track_index)
+    elif self.playlist:
+      self.play_music(0)
+
+  @command
+  def pause(self) -> None:
+    """Pause playback, keeping the position."""
+    self._settle_crossfade()
+    if self.is_playing:
+      self.audio.pause()
+      self.is_playing = False
+      self.is_paused = True
+      self.events.publish("state", is_playing=False)
+      logging.info("Playback paused.")
+
+  @command
+  def resume(self) -> None:
+    """Resume paused playback."""
+    if self.is_paused:
+      self.audio.unpause()
+      self.is_playing = True
+      self.is_paused = False
+      self.events.publish("state", is_playing=True)
+      logging.info("Playback resumed.")
+
+  def get_position(self) -> float:
+    """Seconds into the current track. Cheap enough to call every frame."""
+    if not (self.is_playing or self.is_paused):
+      return 0.0
+    overlap_position = self.crossfader.overlap_position()
+    if overlap_position is not None:
+      return overlap_position
+    return self._seek_offset + max(0, self.audio.get_pos()) / 1000
+
+  def get_duration(self) -> Optional[float]:
+    """Length of the current track in seconds, from the metadata cache."""
+    path = self.current_track_path
+    if path is None:
+      return None
+    entry = self.metadata.peek(path)
+    return entry.duration if entry is not None else None
+
+  @command
+  def seek(self, seconds: float) -> None:
+    """Jump to a position in the current track."""
+    self._settle_crossfade()
+    if not (self.is_playing or self.is_paused):
+      return
+    duration = self.get_duration()
+    seconds = max(0.0, min(seconds, duration if duration is not None else seconds))
+    try:
+      self.audio.set_pos(seconds)
+    except AudioError as e:
+      logging.error(f"Cannot seek: {e}")
+      return
+    self._seek_offset = seconds - max(0, self.audio.get_pos()) / 1000
+    self.events.publish("position", seconds=seconds)
+    logging.info(f"Seeked to {seconds:.1f}s.")
+
+  @command
+  @timed("player.play_music")
   def play_music(self, track_index: int) -> None:
     """Play track by index."""
     if track_index < 0 or track_index >= len(self.playlist):
@@ -141,59 +566,473 @@ class Player:
       return
     try:
       track_path: str = self.playlist[track_index]
-      pygame.mixer.music.load(track_path)
-      pygame.mixer.music.play()
+      source = self.playable_source(track_path)
+      if source is None:
+        self._await_transcode(track_index)
+        return
+      self._awaiting_id = None
+      self.waveforms.get(track_path)
+      self.audio.load(self.track_cache.open(source), namehint=os.path.splitext(source)[1])
+      self._update_track_gain(track_path)
+      self.audio.play()
+      self._discard_end_events()
       self.is_playing = True
+      self.is_paused = False
+      self._seek_offset = 0.0
       self.current_track_index = track_index
+      self._track_started(self.current_track_id)
+      self._reset_queue()
+      self._preload_next()
+      self.events.publish("track_change", index=track_index, path=track_path)
+      self.events.publish("state", is_playing=True)
       logging.info(f"Now playing: {track_path}")
-    except pygame.error as e:
-      logging.error(f"Pygame error: {e}")
+    except AudioError as e:
+      logging.error(f"Audio error: {e}")
+      self.events.publish("error", message=str(e), path=self.playlist[track_index])
     except Exception as e:
       logging.error(f"Unexpected error: {e}")
+      self.events.publish("error", message=str(e), path=self.playlist[track_index])
+
+  def playable_source(self, path: str) -> Optional[str]:
+    """File the audio backend can stream for a track, or None while it is being transcoded.
+
+    The format comes from the metadata probe; the file header is read here
+    only for tracks that have not been probed yet.
+    """
+    entry = self.metadata.peek(path)
+    if entry is not None and entry.format_name is not None:
+      audio_format = format_named(entry.format_name) if entry.format_name else None
+    else:
+      audio_format = detect_format(path)
+    if audio_format is None or audio_format.streamable:
+      return path
+    cached = self.transcoder.fetch(path)
+    if cached is None:
+      self.transcoder.request(path)
+    return cached
 
+  def _await_transcode(self, track_index: int) -> None:
+    """Mark a track as current and start it from pump_events once its transcode is ready."""
+    track_path = self.playlist[track_index]
+    if self.transcoder.failed(track_path):
+      raise AudioError(f"Cannot decode '{track_path}'.")
+    self.audio.stop()
+    self._discard_end_events()
+    self.is_playing = True
+    self.is_paused = False
+    self.current_track_index = track_index
+    self._awaiting_id = self.current_track_id
+    self._reset_queue()
+    self.events.publish("state", is_playing=True)
+    logging.info(f"Waiting for '{track_path}' to be transcoded.")
+
+  def _start_awaited_track(self) -> None:
+    index = self.playlist.index_of(self._awaiting_id)
+    if index is None:
+      self._awaiting_id = None
+      self.stop()
+      return
+    path = self.playlist[index]
+    if self.transcoder.cached(path) is not None:
+      self.play_music(index)
+    elif self.transcoder.failed(path):
+      self._awaiting_id = None
+      logging.error(f"Cannot play '{path}': transcoding failed.")
+      self.events.publish("error", message="Transcoding failed", path=path)
+      self.stop()
+
+  @command
   def toggle_repeat(self) -> None:
     """Toggle repeat mode."""
     self.repeat = not self.repeat
     logging.info(f"Repeat {'enabled' if self.repeat else 'disabled'}.")
 
+  @command
   def set_volume(self, volume: float) -> None:
     """Set volume (0.0 to 1.0)."""
     self.volume = max(0.0, min(1.0, volume))
-    pygame.mixer.music.set_volume(self.volume)
+    self._apply_volume()
     logging.info(f"Volume set to {self.volume:.2f}.")
 
+  def _apply_volume(self) -> None:
+    self.audio.set_volume(min(1.0, self.volume * self._track_gain))
+
+  def _update_track_gain(self, path: str) -> None:
+    """Set the normalization gain for a track, requesting analysis if it is unknown."""
+    entry = self.metadata.get(path) if self.normalize else None
+    if self.normalize and (entry is None or entry.loudness is None):
+      self.loudness.request(path)
+    self._track_gain = gain_for(entry.loudness, entry.peak) if entry is not None else 1.0
+    self._apply_volume()
+
+  @command
+  def set_crossfade(self, seconds: float) -> None:
+    """Set the crossfade length between tracks; 0 switches back to gapless playback."""
+    self.crossfade = max(0.0, seconds)
+    if self.crossfade and not self.crossfader.available:
+      logging.warning("ffmpeg not found; crossfade disabled.")
+    self._reset_queue()
+    if self.is_playing or self.is_paused:
+      self._preload_next()
+    logging.info(f"Crossfade set to {self.crossfade:.1f}s.")
+
+  @command
+  def set_normalize(self, enabled: bool) -> None:
+    """Enable or disable per-track loudness normalization."""
+    self.normalize = enabled
+    if self.is_playing and self.current_track_index is not None:
+      self._update_track_gain(self.playlist[self.current_track_index])
+    else:
+      self._track_gain = 1.0
+      self._apply_volume()
+
+  @command
   def stop(self) -> None:
     """Stop music playback."""
-    if self.is_playing:
-      pygame.mixer.music.stop()
+    if self.is_playing or self.is_paused:
+      self.audio.stop()
       self.is_playing = False
+      self.is_paused = False
       self.current_track_index = None
+      self._awaiting_id = None
+      self._reset_queue()
+      self.events.publish("state", is_playing=False)
       logging.info("Music stopped.")
 
-  def shuffle_playlist(self) -> None:
-    """Shuffle the playlist."""
-    random.shuffle(self.playlist)
-    self.update_and_save_playlist()
-    logging.info("Playlist shuffled.")
+  @command
+  def shutdown(self) -> None:
+    """Stop playback and persist cached state."""
+    self.stop()
+    self.track_cache.close()
+    logging.info(f"Read-ahead cache: {self.track_cache.stats()}")
+    self.loudness.close()
+    self.transcoder.close()
+    self.crossfader.cancel()
+    self.waveforms.close()
+    self.watcher.close()
+    self.audio.close()
+    self.scanner.close()
+    self.dedup.close()
+    self.store.close()
+    self.metadata.close()
+    self.save_startup_snapshot()
+
+  def save_startup_snapshot(self) -> None:
+    """Record paths and display durations so the next start can skip parsing and tag lookups."""
+    paths: list[str] = list(self.playlist)
+    hints: list[str] = []
+    for path in paths:
+      entry = self.metadata.peek(path)
+      hints.append(entry.duration_str if entry is not None else self.display_hints.get(path, ""))
+    try:
+      write_startup_snapshot(self.snapshot_file, self.LIBRARY_FILE, paths, hints)
+    except OSError as e:
+      logging.error(f"Error saving startup snapshot: {e}")
+
+  @command
+  def toggle_shuffle(self) -> None:
+    """Play in a shuffled order without repeats. The playlist order is left alone and nothing is saved."""
+    self.shuffle = not self.shuffle
+    self.shuffle_order.reset()
+    if self.shuffle and self.current_track_id is not None:
+      self.shuffle_order.mark_played(self.current_track_id)
+    if self.is_playing:
+      self._preload_next()
+    logging.info(f"Shuffle {'enabled' if self.shuffle else 'disabled'}.")
+
+  def _artist_of(self, track_id: int) -> Optional[str]:
+    entry = self.metadata.peek(self.playlist.path_of(track_id))
+    return entry.artist if entry is not None and entry.artist else None
+
+  @command
+  def queue_next(self, track_index: int) -> None:
+    """Queue a track to play after the current one and any tracks queued before it."""
+    if not 0 <= track_index < len(self.playlist):
+      logging.error(f"Invalid index: {track_index}.")
+      return
+    self.play_next.append(self.playlist.id_at(track_index))
+    self.queue_version += 1
+    if self.is_playing:
+      self._preload_next()
+    logging.info(f"Queued '{self.playlist[track_index]}' to play next.")
+
+  @command
+  def queue_file(self, path: str) -> bool:
+    """Queue a file to play next, adding it to the playlist first if it is not there.
+
+    A new file is queued once the duplicate check has added it, or its
+    original queued if it turned out to be a duplicate. Returns False if the
+    file is not a supported audio file.
+    """
+    index = self.playlist.find(path)
+    if index is not None:
+      self.queue_next(index)
+      return True
+    return bool(self.add_files([path], then=lambda report: self._queue_imported(path, report)))
+
+  def _queue_imported(self, path: str, report: ImportCheck) -> None:
+    index = self.playlist.find(path)
+    if index is None:
+      original = next((original for duplicate, original in report.duplicates if duplicate == path), None)
+      index = None if original is None else self.playlist.find(original)
+    if index is None:
+      logging.error(f"Cannot queue '{path}': it was not added to the playlist.")
+      return
+    self.queue_next(index)
+
+  def queue_position(self, track_index: int) -> Optional[int]:
+    """1-based place of a track in the play-next queue, if it is queued."""
+    if not self.play_next:
+      return None
+    track_id = self.playlist.id_at(track_index)
+    for position, queued in enumerate(self.play_next, 1):
+      if queued == track_id:
+        return position
+    return None
+
+  def _track_started(self, track_id: int) -> None:
+    """Consume the play-next queue and shuffle pool for a track that started playing."""
+    if self.play_next and self.play_next[0] == track_id:
+      self.play_next.popleft()
+      self.queue_version += 1
+    else:
+      self._resume_id = track_id
+    if self.shuffle:
+      self.shuffle_order.mark_played(track_id)
+
+  @command
+  def skip(self) -> None:
+    """Start the track that would follow the current one, even in repeat mode; stop after the last."""
+    if self.current_track_index is None:
+      self.play()
+      return
+    next_index = self._next_index(follow_repeat=False)
+    if next_index is None:
+      self.stop()
+    else:
+      self.play_music(next_index)
+
+  def _next_index(self, follow_repeat: bool = True) -> Optional[int]:
+    """Index of the track that follows the current one.
+
+    Repeat wins, then the play-next queue, then the shuffled order or the
+    playlist order, which resumes after the last track not played from the queue.
+    """
+    if self.current_track_index is None:
+      return None
+    if self.repeat and follow_repeat:
+      return self.current_track_index
+    while self.play_next:
+      index = self.playlist.index_of(self.play_next[0])
+      if index is not None:
+        return index
+      self.play_next.popleft()
+      self.queue_version += 1
+    if self.shuffle:
+      track_id = self.shuffle_order.peek()
+      return None if track_id is None else self.playlist.index_of(track_id)
+    anchor = None if self._resume_id is None else self.playlist.index_of(self._resume_id)
+    if anchor is None:
+      anchor = self.current_track_index
+    if anchor + 1 < len(self.playlist):
+      return anchor + 1
+    return None
+
+  def _preload_next(self) -> None:
+    """Start reading the next track in the background for gapless playback."""
+    if self.crossfade and self.crossfader.available:
+      self._schedule_crossfade()
+      return
+    next_index = self._next_index()
+    if not self.gapless or next_index is None:
+      self._queued_id = None
+      return
+    next_id = self.playlist.id_at(next_index)
+    next_path = self.playlist.path_of(next_id)
+    if self._queued_id is not None and self.preloader.path == next_path:
+      self._queued_id = next_id
+      return
+    self._queued_id = None
+    if next_path in (self.preloader.path, self._transcoding_next):
+      return
+    source = self.playable_source(next_path)
+    if source is None:
+      self.preloader.cancel()
+      self._transcoding_next = next_path
+      return
+    self.preloader.preload(next_path, source)
+    if self.normalize:
+      entry = self.metadata.get(next_path)
+      if entry is None or entry.loudness is None:
+        self.loudness.request(next_path)
+
+  def _schedule_crossfade(self) -> None:
+    """Arrange for the next track to fade in over the end of the current one."""
+    if self.crossfader.busy:
+      return  # rescheduled once the running transition is collected
+    next_index = self._next_index()
+    if next_index is None or self.current_track_id is None:
+      self.crossfader.cancel()
+      return
+    next_id = self.playlist.id_at(next_index)
+    scheduled = self.crossfader.scheduled
+    if scheduled is not None and scheduled.track_id == next_id:
+      return
+    next_path = self.playlist.path_of(next_id)
+    duration = self.get_duration()
+    source = self.playable_source(next_path)
+    if source is None:
+      self._transcoding_next = next_path
+    if duration is None or source is None or duration <= 2 * self.crossfade:
+      self.crossfader.cancel()
+      return
+    entry = self.metadata.get(next_path)
+    incoming_gain = gain_for(entry.loudness, entry.peak) if self.normalize and entry is not None else 1.0
+    self.track_cache.prefetch(source)
+    self.crossfader.schedule(Crossfade(
+      track_id=next_id,
+      outgoing=self.playlist.path_of(self.current_track_id),
+      outgoing_duration=duration,
+      incoming_source=source,
+      seconds=self.crossfade,
+      outgoing_volume=min(1.0, self.volume * self._track_gain),
+      incoming_volume=min(1.0, self.volume * incoming_gain)
+    ))
+
+  def _settle_crossfade(self) -> None:
+    """Finish a running overlap at once so the next action applies to the incoming track."""
+    if self.crossfader.overlapping:
+      self.crossfader.complete()
+      self.pump_events()
+
+  def _finish_crossfade(self, crossfade: Crossfade) -> None:
+    """Make the faded-in track current once it continues on the music stream."""
+    self._discard_end_events()
+    self.events.publish("track_end", index=self.current_track_index)
+    self.current_track_id = crossfade.track_id
+    self._seek_offset = crossfade.offset
+    index = self.playlist.index_of(crossfade.track_id)
+    if index is None:
+      self.stop()
+      return
+    self._track_started(crossfade.track_id)
+    path = self.playlist.path_of(crossfade.track_id)
+    self._update_track_gain(path)
+    self._preload_next()
+    self.events.publish("track_change", index=index, path=path)
+    logging.info(f"Now playing: {path}")
+
+  def _arm_queue(self) -> None:
+    """Hand the preloaded next track to the mixer so it starts at the sample boundary."""
+    if self._transcoding_next is not None:
+      if self.transcoder.cached(self._transcoding_next) is not None:
+        self._transcoding_next = None
+        self._preload_next()
+      elif self.transcoder.failed(self._transcoding_next):
+        self._transcoding_next = None
+    if self._queued_id is not None or not self.is_playing or not self.preloader.ready():
+      return
+    next_index = self._next_index()
+    if next_index is None or self.playlist[next_index] != self.preloader.path:
+      return
+    source = self.preloader.take()
+    try:
+      self.audio.queue(source, namehint=os.path.splitext(self.preloader.source)[1])
+      self._queued_id = self.playlist.id_at(next_index)
+    except AudioError as e:
+      logging.error(f"Could not queue '{self.preloader.path}': {e}")
+      self.preloader.cancel()
+
+  def _discard_end_events(self) -> None:
+    """Drop end events posted by halting the previous track ourselves."""
+    self.audio.discard_end_events()
+
+  def _reset_queue(self) -> None:
+    self._queued_id = None
+    self._queued_end = None
+    self._transcoding_next = None
+    self.preloader.cancel()
+    self.crossfader.cancel()
+
+  def _expected_end(self) -> Optional[float]:
+    """When the current track should run out, from its tagged duration and the mixer's position."""
+    duration = self.get_duration()
+    if duration is None:
+      return None
+    return time.perf_counter() + duration - self.get_position()
+
+  def _record_gap(self, gap_ms: float) -> None:
+    self.gap_latencies_ms.append(gap_ms)
+    logging.info(f"Track transition gap: {gap_ms:.1f} ms.")
+
+  def gap_stats(self) -> dict[str, float]:
+    """Summary of recent track transition gaps in milliseconds.
+
+    A gapless switch is measured from when the previous track should have run
+    out to when the queued one started; other transitions from handling the
+    end of a track to starting the next.
+    """
+    if not self.gap_latencies_ms:
+      return {"count": 0, "last": 0.0, "mean": 0.0, "max": 0.0}
+    gaps = list(self.gap_latencies_ms)
+    return {"count": len(gaps), "last": gaps[-1], "mean": sum(gaps) / len(gaps), "max": max(gaps)}
+
+  def handle_track_end(self) -> None:
+    """Handle the mixer's end-of-track event, following a queued gapless switch if one happened."""
+    self.events.publish("track_end", index=self.current_track_index)
+    next_index = None if self._queued_id is None else self.playlist.index_of(self._queued_id)
+    if next_index is not None and self.audio.get_busy():
+      started = time.perf_counter() - max(0, self.audio.get_pos()) / 1000  # by the new stream's own clock
+      next_path = self.playlist.path_of(self._queued_id)
+      self.current_track_id = self._queued_id
+      self._queued_id = None
+      self._track_started(self.current_track_id)
+      self._update_track_gain(next_path)
+      self.preloader.cancel()
+      self._seek_offset = 0.0
+      if self._queued_end is not None:
+        self._record_gap(max(0.0, started - self._queued_end) * 1000)
+      self._queued_end = None
+      self._preload_next()
+      self.events.publish("track_change", index=next_index, path=next_path)
+      logging.info(f"Now playing: {next_path}")
+    else:
+      self.handle_music_end()
 
   def handle_music_end(self) -> None:
     """Handle music end."""
-    if self.repeat and self.current_track_index is not None:
-      self.play_music(self.current_track_index)
-    elif self.current_track_index is not None and self.current_track_index + 1 < len(self.playlist):
-      self.play_music(self.current_track_index + 1)
+    started: float = time.perf_counter()
+    next_index = self._next_index()
+    if next_index is not None:
+      self.play_music(next_index)
     else:
+      self.audio.stop()
+      self._discard_end_events()
       self.is_playing = False
       self.current_track_index = None
+      self.shuffle_order.reset()
+      self._reset_queue()
+      self.events.publish("state", is_playing=False)
       logging.info("Playlist completed.")
+      return
+    self._record_gap((time.perf_counter() - started) * 1000)
 
-  def event_loop(self) -> None:
-    """Handle pygame events."""
-    running: bool = True
-    while running:
-      for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-          running = False
-        if not pygame.mixer.music.get_busy():
-          self.handle_music_end()
-      time.sleep(0.1)
+  @command
+  def pump_events(self) -> None:
+    """Process pending mixer events without blocking."""
+    if self._awaiting_id is not None:
+      self._start_awaited_track()
+      return
+    ended = self.audio.poll_end_events()
+    crossfading, finished = self.crossfader.collect()
+    if finished is not None:
+      self._finish_crossfade(finished)
+      return
+    if crossfading:
+      return  # the end event came from stopping the outgoing stream for the overlap
+    for _ in range(ended):
+      if self.is_playing:
+        self.handle_track_end()
+    self._arm_queue()
+    if self._queued_id is not None:
+      self._queued_end = self._expected_end()  # refreshed on every pass, so the last estimate before the switch is the closest
@@ -0,0 +1,384 @@
+import sys
+from array import array
+from typing import Collection, Iterable, Iterator, Optional
+
+BLOCK_SIZE: int = 512
+
+_counting = array("q")  # 0, 1, 2, ... grown on demand; loads slice it instead of counting again
+
+def _count_to(count: int) -> array:
+  if len(_counting) < count:
+    _counting.extend(range(len(_counting), count))
+  return _counting
+
+class TrackTable:
+  """Paths of all known tracks by track ID; each path is stored once and shared by every playlist.
+
+  New tracks get IDs above every ID handed out before, so a stale reference
+  can never point at a different file. Renames and removals are recorded
+  until a store takes them with `take_changes`. Tables filled in the
+  background override `wait_loaded`, which every lookup by path waits on.
+  """
+
+  __slots__ = ("_paths", "_ids", "next_id", "_renamed", "_removed")
+
+  def __init__(self, rows: Iterable[tuple[int, str]] = (), next_id: int = 1) -> None:
+    self._paths: dict[int, str] = {}
+    self._ids: dict[str, int] = {}
+    for track_id, path in rows:
+      path = sys.intern(path)
+      self._paths[track_id] = path
+      self._ids[path] = track_id
+    self.next_id: int = max(next_id, max(self._paths, default=0) + 1)
+    self._renamed: set[int] = set()
+    self._removed: set[int] = set()
+
+  def __len__(self) -> int:
+    self.wait_loaded()
+    return len(self._paths)
+
+  def wait_loaded(self, timeout: Optional[float] = None) -> bool:
+    return True
+
+  def path(self, track_id: int) -> str:
+    return self._paths[track_id]
+
+  def id_of(self, path: str) -> Optional[int]:
+    self.wait_loaded()
+    return self._ids.get(path)
+
+  def id_for(self, path: str) -> int:
+    """ID of a path, adding it as a new track if it is not known yet."""
+    self.wait_loaded()
+    track_id = self._ids.get(path)
+    if track_id is None:
+      track_id = self.next_id
+      self.next_id += 1
+      path = sys.intern(path)
+      self._paths[track_id] = path
+      self._ids[path] = track_id
+    return track_id
+
+  def rename(self, track_id: int, new: str) -> int:
+    """Move a track to a new path. If the path is already a track, that track's ID is returned instead."""
+    self.wait_loaded()
+    existing = self._ids.get(new)
+    if existing is not None:
+      return existing
+    new = sys.intern(new)
+    del self._ids[self._paths[track_id]]
+    self._paths[track_id] = new
+    self._ids[new] = track_id
+    self._renamed.add(track_id)
+    return track_id
+
+  def remove(self, paths: Iterable[str]) -> set[int]:
+    """Forget tracks by path. Returns their IDs."""
+    self.wait_loaded()
+    removed: set[int] = set()
+    for path in paths:
+      track_id = self._ids.pop(path, None)
+      if track_id is not None:
+        del self._paths[track_id]
+        removed.add(track_id)
+    self._renamed -= removed
+    self._removed |= removed
+    return removed
+
+  def take_changes(self, since: int) -> tuple[list[tuple[int, str]], list[tuple[str, int]], list[int]]:
+    """(tracks added with IDs >= since, renamed (path, id), removed IDs) recorded since the last call."""
+    self.wait_loaded()
+    added = [(track_id, self._paths[track_id]) for track_id in range(since, self.next_id) if track_id in self._paths]
+    renamed = [(self._paths[track_id], track_id) for track_id in self._renamed if track_id < since]
+    removed = [track_id for track_id in self._removed if track_id < since]
+    self._renamed, self._removed = set(), set()
+    return added, renamed, removed
+
+  def restore_changes(self, renamed: Iterable[tuple[str, int]], removed: Iterable[int]) -> None:
+    """Record changes taken by `take_changes` again, after writing them failed."""
+    self._removed.update(removed)
+    self._renamed.update(track_id for _, track_id in renamed if track_id in self._paths)
+
+class Playlist:
+  """Ordered track list with stable integer IDs stored in a blocked array.
+
+  Each entry gets an ID that survives moves, so callers can hold on to a track
+  rather than an index. The order is kept in `array('q')` blocks of at most
+  2 * BLOCK_SIZE IDs, which makes inserts, removals and moves cost
+  O(n / BLOCK_SIZE + BLOCK_SIZE) instead of O(n). Entries refer to tracks in a
+  TrackTable, so duplicates and playlists sharing a table store each path
+  once. Reading it behaves like a list of paths.
+
+  A playlist built with `from_track_ids` starts as ranges of entry IDs whose
+  blocks are found arithmetically; only entries that later move are recorded
+  in `_block_for`. Loading one therefore costs O(n / BLOCK_SIZE) Python work.
+  """
+
+  __slots__ = ("_blocks", "_tracks", "_track_of", "_block_for", "_base_blocks", "_base_count", "_length")
+
+  def __init__(self, paths: Iterable[str] = (), tracks: Optional[TrackTable] = None) -> None:
+    self._blocks: list[array] = []
+    self._tracks: TrackTable = tracks if tracks is not None else TrackTable()
+    self._track_of: array = array("q")  # entry ID -> track ID, -1 once removed
+    self._block_for: dict[int, array] = {}
+    self._base_blocks: list[array] = []
+    self._base_count: int = 0
+    self._length: int = 0
+    self.extend(paths)
+
+  @classmethod
+  def from_track_ids(cls, track_ids: array, tracks: TrackTable) -> "Playlist":
+    """Wrap an ordered array of track IDs without touching each entry."""
+    playlist = cls(tracks=tracks)
+    count = len(track_ids)
+    playlist._track_of = array("q", track_ids)
+    counting = _count_to(count)
+    playlist._blocks = [counting[start:min(start + BLOCK_SIZE, count)] for start in range(0, count, BLOCK_SIZE)]
+    playlist._base_blocks = list(playlist._blocks)
+    playlist._base_count = count
+    playlist._length = count
+    return playlist
+
+  @property
+  def tracks(self) -> TrackTable:
+    return self._tracks
+
+  def track_ids(self) -> array:
+    """Track IDs in play order."""
+    return array("q", map(self._track_of.__getitem__, self.ids()))
+
+  def copy(self) -> "Playlist":
+    """An independent copy of the order sharing the track table, for iterating on another thread."""
+    playlist = Playlist(tracks=self._tracks)
+    playlist._track_of = array("q", self._track_of)
+    copies = {id(block): array("q", block) for block in self._blocks}
+    playlist._blocks = [copies[id(block)] for block in self._blocks]
+    playlist._block_for = {track_id: copies[id(block)] for track_id, block in self._block_for.items()}
+    playlist._base_blocks = [copies.get(id(block), block) for block in self._base_blocks]  # blocks no longer in the order hold no entries
+    playlist._base_count = self._base_count
+    playlist._length = self._length
+    return playlist
+
+  def __len__(self) -> int:
+    return self._length
+
+  def __iter__(self) -> Iterator[str]:
+    self._tracks.wait_loaded()
+    path, track_of = self._tracks.path, self._track_of
+    for block in self._blocks:
+      for entry_id in block:
+        yield path(track_of[entry_id])
+
+  def __getitem__(self, index: int) -> str:
+    return self.path_of(self.id_at(index))
+
+  def __repr__(self) -> str:
+    return f"Playlist({list(self)!r})"
+
+  @property
+  def id_bound(self) -> int:
+    """Every track ID handed out so far is below this."""
+    return len(self._track_of)
+
+  def contains_id(self, track_id: int) -> bool:
+    return self._block_of(track_id) is not None
+
+  def ids(self) -> list[int]:
+    """All track IDs in play order."""
+    return [track_id for block in self._blocks for track_id in block]
+
+  def path_of(self, track_id: int) -> str:
+    return self._tracks.path(self._track_of[track_id])
+
+  def _normalize(self, index: int) -> int:
+    if index < 0:
+      index += self._length
+    if not 0 <= index < self._length:
+      raise IndexError("playlist index out of range")
+    return index
+
+  def _locate(self, index: int) -> tuple[int, int]:
+    """Return (block number, offset in block) for a position."""
+    for number, block in enumerate(self._blocks):
+      if index < len(block):
+        return number, index
+      index -= len(block)
+    raise IndexError("playlist index out of range")
+
+  def id_at(self, index: int) -> int:
+    """ID of the track at a position."""
+    number, offset = self._locate(self._normalize(index))
+    return self._blocks[number][offset]
+
+  def index_of(self, track_id: int) -> Optional[int]:
+    """Current position of a track, or None if it is no longer in the playlist."""
+    block = self._block_of(track_id)
+    if block is None:
+      return None
+    position = 0
+    for candidate in self._blocks:
+      if candidate is block:
+        return position + block.index(track_id)
+      position += len(candidate)
+    return None
+
+  def find(self, path: str) -> Optional[int]:
+    """Position of the first entry for a path, or None if it is not in the playlist."""
+    track = self._tracks.id_of(path)
+    if track is None:
+      return None
+    track_of = self._track_of
+    for index, track_id in enumerate(self.ids()):
+      if track_of[track_id] == track:
+        return index
+    return None
+
+  def positions_of(self, tracks: Collection[int]) -> list[int]:
+    """Positions, in order, of the entries for any of the given table track IDs.
+
+    Vectorized, since a broad search can match every entry of a large playlist.
+    """
+    import numpy as np
+    if not tracks or not self._length:
+      return []
+    wanted = np.zeros(self._tracks.next_id, dtype=bool)
+    wanted[np.fromiter(tracks, dtype=np.int64, count=len(tracks))] = True
+    entries = np.concatenate([np.frombuffer(block, dtype=np.int64) for block in self._blocks])
+    track_of = np.frombuffer(self._track_of, dtype=np.int64)[entries]  # a copy, so the arrays stay resizable
+    return np.flatnonzero(wanted[track_of]).tolist()
+
+  def _block_of(self, track_id: int) -> Optional[array]:
+    block = self._block_for.get(track_id)
+    if block is None and track_id < self._base_count and self._track_of[track_id] >= 0:
+      block = self._base_blocks[track_id // BLOCK_SIZE]
+    return block
+
+  def _new_id(self, path: str) -> int:
+    track_id = len(self._track_of)
+    self._track_of.append(self._tracks.id_for(path))
+    return track_id
+
+  def _insert_id(self, index: int, track_id: int) -> None:
+    if not self._blocks:
+      self._blocks.append(array("q"))
+    if index >= self._length:
+      number, offset = len(self._blocks) - 1, len(self._blocks[-1])
+    else:
+      number, offset = self._locate(index)
+    block = self._blocks[number]
+    block.insert(offset, track_id)
+    self._block_for[track_id] = block
+    self._length += 1
+    if len(block) > 2 * BLOCK_SIZE:
+      tail = block[BLOCK_SIZE:]
+      del block[BLOCK_SIZE:]
+      for moved in tail:
+        self._block_for[moved] = tail
+      self._blocks.insert(number + 1, tail)
+
+  def _pop_id(self, index: int) -> int:
+    number, offset = self._locate(self._normalize(index))
+    block = self._blocks[number]
+    track_id = block.pop(offset)
+    self._block_for.pop(track_id, None)
+    self._length -= 1
+    if not block:
+      del self._blocks[number]
+    return track_id
+
+  def insert(self, index: int, path: str) -> int:
+    """Insert a track and return its new ID."""
+    track_id = self._new_id(path)
+    self._insert_id(max(0, index), track_id)
+    return track_id
+
+  def append(self, path: str) -> int:
+    return self.insert(self._length, path)
+
+  def extend(self, paths: Iterable[str]) -> None:
+    """Append tracks, filling the last block before starting new ones."""
+    for path in paths:
+      if not self._blocks or len(self._blocks[-1]) >= BLOCK_SIZE:
+        self._blocks.append(array("q"))
+      block = self._blocks[-1]
+      track_id = self._new_id(path)
+      block.append(track_id)
+      self._block_for[track_id] = block
+      self._length += 1
+
+  def pop(self, index: int = -1) -> str:
+    """Remove a track by position and return its path."""
+    track_id = self._pop_id(index)
+    path = self.path_of(track_id)
+    self._track_of[track_id] = -1
+    return path
+
+  def __delitem__(self, index: int) -> None:
+    self.pop(index)
+
+  def move(self, old_index: int, new_index: int) -> None:
+    """Move a track to a new position, keeping its ID."""
+    self._insert_id(new_index, self._pop_id(old_index))
+
+  def reorder(self, order: list[int]) -> None:
+    """Rearrange tracks so that position i holds the track previously at order[i]."""
+    ids = self.ids()
+    self._rebuild([ids[index] for index in order])
+
+  def rename(self, old: str, new: str) -> int:
+    """Point every entry for `old` at `new`, keeping IDs and positions. Returns the number renamed.
+
+    The track itself is renamed, so other playlists sharing the table follow.
+    """
+    old_track = self._tracks.id_of(old)
+    if old_track is None:
+      return 0
+    renamed = self._track_of.count(old_track)
+    new_track = self._tracks.rename(old_track, new)
+    if new_track != old_track:
+      for track_id, track in enumerate(self._track_of):
+        if track == old_track:
+          self._track_of[track_id] = new_track
+    return renamed
+
+  def discard(self, paths: Iterable[str]) -> int:
+    """Remove every entry for the given paths. Returns the number removed."""
+    gone = {track for track in map(self._tracks.id_of, paths) if track is not None}
+    if not gone:
+      return 0
+    track_of = self._track_of
+    kept = [track_id for track_id in self.ids() if track_of[track_id] not in gone]
+    removed = self._length - len(kept)
+    if removed:
+      for track_id in self.ids():
+        if track_of[track_id] in gone:
+          track_of[track_id] = -1
+      self._rebuild(kept)
+    return removed
+
+  def replace(self, paths: Iterable[str]) -> None:
+    """Replace the contents with new tracks."""
+    self.clear()
+    self.extend(paths)
+
+  def clear(self) -> None:
+    for block in self._blocks:
+      for track_id in block:
+        self._track_of[track_id] = -1
+    self._blocks.clear()
+    self._block_for.clear()
+    self._base_blocks = []
+    self._base_count = 0
+    self._length = 0
+
+  def _rebuild(self, ids: list[int]) -> None:
+    self._blocks.clear()
+    self._block_for.clear()
+    self._base_blocks = []
+    self._base_count = 0
+    for start in range(0, len(ids), BLOCK_SIZE):
+      block = array("q", ids[start:start + BLOCK_SIZE])
+      self._blocks.append(block)
+      for track_id in block:
+        self._block_for[track_id] = block
+    self._length = len(ids)
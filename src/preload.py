@@ -0,0 +1,319 @@
+import io
+import logging
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Union
+
+PRELOAD_MAX_BYTES: int = 64 * 1024 * 1024  # larger tracks stream straight from their file
+TRACK_CACHE_BYTES: int = 256 * 1024 * 1024
+READ_CHUNK: int = 256 * 1024
+TAIL_BYTES: int = 128 * 1024  # decoders look for tags at the end of a file before playing it
+READERS: int = 2  # the current and the next track
+
+class BufferedTrack:
+  """A track read into an anonymous memory map by a background reader.
+
+  The head is read first, then the tail, then the middle in order, so a
+  decoder can open the track and start playing while the rest arrives.
+  Readers take what has arrived and read the rest straight from the file;
+  the map is released once the cache and every reader have let go of it.
+  """
+
+  def __init__(self, path: str, size: int) -> None:
+    self.path = path
+    self.size = size
+    self.buffer = mmap.mmap(-1, max(size, 1))
+    self.filled: int = 0  # bytes [0, filled) are present
+    self.tail_start: int = size  # bytes [tail_start, size) are present
+    self.done: bool = False
+    self.error: Optional[OSError] = None
+    self.readers: int = 0  # open TrackReaders
+    self.evicted: bool = False  # dropped from the cache while a reader held it
+    self.cancelled: bool = False
+    self._progress = threading.Condition()
+
+  def has(self, start: int, end: int) -> bool:
+    return self.done or end <= self.filled or start >= self.tail_start
+
+  def openable(self) -> bool:
+    """True once the head and tail are in, or reading has stopped."""
+    return self.done or self.error is not None or (self.has(0, min(self.size, READ_CHUNK)) and self.has(max(0, self.size - TAIL_BYTES), self.size))
+
+  def available(self, start: int, end: int) -> int:
+    """How many bytes from `start` up to `end` are present, without waiting."""
+    if self.has(start, end):
+      return end - start
+    return max(0, self.filled - start)
+
+  def fill(self) -> int:
+    """Read the file into the buffer; returns the number of bytes read."""
+    try:
+      with open(self.path, "rb", buffering=0) as file:
+        view = memoryview(self.buffer)
+        head = min(self.size, READ_CHUNK)
+        self._read(file, view, 0, head)
+        self._advance(filled=head)
+        if self.size > head + TAIL_BYTES:
+          tail = self.size - TAIL_BYTES
+          file.seek(tail)
+          self._read(file, view, tail, self.size)
+          self._advance(tail_start=tail)
+          file.seek(head)
+        while self.filled < self.tail_start:
+          end = min(self.filled + READ_CHUNK, self.tail_start)
+          self._read(file, view, self.filled, end)
+          self._advance(filled=end)
+        view.release()
+    except OSError as e:
+      with self._progress:
+        self.error = e
+        self._progress.notify_all()
+      if not self.cancelled:
+        logging.error(f"Error reading ahead '{self.path}': {e}")
+      return self.filled + self.size - self.tail_start
+    with self._progress:
+      self.done = True
+      self._progress.notify_all()
+    return self.size
+
+  def _read(self, file: io.RawIOBase, view: memoryview, start: int, end: int) -> None:
+    while start < end:
+      if self.cancelled:
+        raise OSError("read-ahead cancelled")
+      count = file.readinto(view[start:end])
+      if not count:
+        raise OSError(f"file ended at {start} of {self.size} bytes")
+      start += count
+
+  def _advance(self, filled: Optional[int] = None, tail_start: Optional[int] = None) -> None:
+    with self._progress:
+      if filled is not None:
+        self.filled = filled
+      if tail_start is not None:
+        self.tail_start = tail_start
+      self._progress.notify_all()
+
+class TrackReader(io.RawIOBase):
+  """Seekable read-only file over a BufferedTrack.
+
+  Reads never wait on the read-ahead, since the audio callback calling
+  them must not block: bytes not read ahead yet come straight from the
+  file. Closing hands the track back to its cache.
+  """
+
+  def __init__(self, track: BufferedTrack, release: Callable[[BufferedTrack], None]) -> None:
+    super().__init__()
+    self.track = track
+    self.name = track.path
+    self._release = release
+    self._position: int = 0
+    self._file: Optional[int] = None  # descriptor for direct reads, opened on first need
+
+  def readable(self) -> bool:
+    return True
+
+  def seekable(self) -> bool:
+    return True
+
+  def readinto(self, buffer: Any) -> int:
+    start = self._position
+    end = min(start + len(buffer), self.track.size)
+    if start >= end:
+      return 0
+    view = memoryview(buffer).cast("B")
+    count = self.track.available(start, end)
+    view[:count] = self.track.buffer[start:start + count]
+    if start + count < end:
+      if self._file is None:
+        self._file = os.open(self.track.path, os.O_RDONLY)
+      data = os.pread(self._file, end - start - count, start + count)
+      view[count:count + len(data)] = data
+      count += len(data)
+    self._position = start + count
+    return count
+
+  def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+    if whence == io.SEEK_CUR:
+      offset += self._position
+    elif whence == io.SEEK_END:
+      offset += self.track.size
+    if offset < 0:
+      raise ValueError(f"negative seek position {offset}")
+    self._position = offset
+    return offset
+
+  def tell(self) -> int:
+    return self._position
+
+  def close(self) -> None:
+    if not self.closed:
+      if self._file is not None:
+        os.close(self._file)
+        self._file = None
+      self._release(self.track)
+    super().close()
+
+class TrackCache:
+  """Read-ahead cache of whole tracks for slow or network storage.
+
+  Background readers copy tracks into memory maps, and the audio backend
+  plays them through TrackReaders while they fill, so a slow share delays
+  neither the start of a track nor the gapless switch to the next.
+  Finished tracks stay cached within a byte budget, least recently used
+  out first; a track still playing when it is evicted keeps its buffer,
+  and counts against the budget, until its last reader is closed.
+  """
+
+  def __init__(self, budget_bytes: int = TRACK_CACHE_BYTES, max_track_bytes: int = PRELOAD_MAX_BYTES, readers: int = READERS) -> None:
+    self.budget_bytes = budget_bytes
+    self.max_track_bytes = min(max_track_bytes, budget_bytes)
+    self.hits: int = 0
+    self.partial_hits: int = 0
+    self.misses: int = 0
+    self.bypassed: int = 0
+    self.evictions: int = 0
+    self.bytes_read: int = 0
+    self._tracks: OrderedDict[str, BufferedTrack] = OrderedDict()
+    self._bytes: int = 0
+    self._lock = threading.Lock()
+    self._executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="read-ahead")
+
+  def prefetch(self, path: str) -> None:
+    """Start reading a track in the background unless it is cached or too large to buffer."""
+    self._lookup(path)
+
+  def open(self, path: str) -> Union[TrackReader, str]:
+    """A file-like reader for a track, reading it ahead if it is not cached; the path itself if it cannot be buffered."""
+    track, created = self._lookup(path)
+    with self._lock:
+      if track is None:
+        self.bypassed += 1
+        return path
+      if created:
+        self.misses += 1
+      elif track.done:
+        self.hits += 1
+      else:
+        self.partial_hits += 1
+      track.readers += 1
+    return TrackReader(track, self._release)
+
+  def ready(self, path: str) -> bool:
+    """True when a reader for the track could be opened without waiting on the file."""
+    with self._lock:
+      track = self._tracks.get(path)
+    return track is None or track.openable()
+
+  def stats(self) -> dict[str, Union[int, float]]:
+    """Hit and miss counts and the memory in use; partial hits opened a track whose read-ahead was still running."""
+    with self._lock:
+      lookups = self.hits + self.partial_hits + self.misses
+      return {
+        "hits": self.hits,
+        "partial_hits": self.partial_hits,
+        "misses": self.misses,
+        "bypassed": self.bypassed,
+        "hit_ratio": (self.hits + self.partial_hits) / lookups if lookups else 0.0,
+        "evictions": self.evictions,
+        "tracks": len(self._tracks),
+        "cached_bytes": self._bytes,
+        "budget_bytes": self.budget_bytes,
+        "bytes_read": self.bytes_read,
+      }
+
+  def close(self) -> None:
+    with self._lock:
+      for track in self._tracks.values():
+        track.cancelled = True
+      self._tracks.clear()
+      self._bytes = 0
+    self._executor.shutdown(wait=False, cancel_futures=True)
+
+  def _lookup(self, path: str) -> tuple[Optional[BufferedTrack], bool]:
+    """The cached track for a path, moved to the recent end, or a new one being read; (None, False) if it cannot be buffered."""
+    with self._lock:
+      track = self._tracks.get(path)
+      if track is not None and track.error is None:
+        self._tracks.move_to_end(path)
+        return track, False
+    try:
+      size = os.path.getsize(path)
+    except OSError:
+      return None, False
+    if size > self.max_track_bytes:
+      return None, False
+    with self._lock:
+      track = self._tracks.get(path)
+      if track is not None:
+        if track.error is None:
+          return track, False
+        self._forget(path)
+      while self._tracks and self._bytes + size > self.budget_bytes:
+        self._forget(next(iter(self._tracks)))
+        self.evictions += 1
+      track = self._tracks[path] = BufferedTrack(path, size)
+      self._bytes += size
+    self._executor.submit(self._fill, track)
+    return track, True
+
+  def _forget(self, path: str) -> None:
+    """Drop a track from the cache; called with the lock held. A track someone is playing is let go when they close it."""
+    track = self._tracks.pop(path)
+    if track.readers:
+      track.evicted = True
+    else:
+      self._let_go(track)
+
+  def _let_go(self, track: BufferedTrack) -> None:
+    """Stop reading a track and stop counting its buffer; called with the lock held."""
+    self._bytes -= track.size
+    track.cancelled = True
+
+  def _release(self, track: BufferedTrack) -> None:
+    """A reader of the track was closed."""
+    with self._lock:
+      track.readers -= 1
+      if not track.readers and track.evicted:
+        track.evicted = False
+        self._let_go(track)
+
+  def _fill(self, track: BufferedTrack) -> None:
+    if track.cancelled:
+      return
+    count = track.fill()
+    with self._lock:
+      self.bytes_read += count
+
+class TrackPreloader:
+  """Remembers which upcoming track is being read ahead for a gapless switch."""
+
+  def __init__(self, cache: TrackCache) -> None:
+    self.cache = cache
+    self.path: Optional[str] = None
+    self.source: Optional[str] = None
+
+  def preload(self, path: str, source: Optional[str] = None) -> None:
+    """Start reading a track, or the playable file standing in for it, unless it is already being preloaded."""
+    if path == self.path:
+      return
+    self.path = path
+    self.source = source or path
+    self.cache.prefetch(self.source)
+
+  def ready(self) -> bool:
+    """True once the preloaded track can be opened without waiting on its file."""
+    return self.source is not None and self.cache.ready(self.source)
+
+  def take(self) -> Optional[Union[TrackReader, str]]:
+    """Open the preloaded track, or return its path if it cannot be buffered."""
+    if self.source is None:
+      return None
+    return self.cache.open(self.source)
+
+  def cancel(self) -> None:
+    """Forget the current preload; what was read stays cached."""
+    self.path = None
+    self.source = None
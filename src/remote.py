@@ -0,0 +1,111 @@
+import argparse
+import json
+import statistics
+import sys
+import time
+from typing import Any, Optional
+
+from control import DEFAULT_CONTROL_ADDRESS, DEFAULT_EVENTS, EVENTS, ControlClient
+from dedup import DUPLICATE_MODES
+
+def parse_arguments() -> argparse.Namespace:
+  """Parse command-line options."""
+  parser = argparse.ArgumentParser(description="Control a running Desktop Music Player.")
+  parser.add_argument("--address", default=DEFAULT_CONTROL_ADDRESS, help=f"control socket path or host:port (default: {DEFAULT_CONTROL_ADDRESS})")
+  commands = parser.add_subparsers(dest="command", required=True)
+  commands.add_parser("status", help="show what is playing")
+  play = commands.add_parser("play", help="resume, or play the track at an index")
+  play.add_argument("index", type=int, nargs="?")
+  commands.add_parser("pause", help="pause playback")
+  commands.add_parser("stop", help="stop playback")
+  commands.add_parser("next", help="skip to the next track")
+  seek = commands.add_parser("seek", help="jump to a position in the current track")
+  seek.add_argument("seconds", type=float)
+  enqueue = commands.add_parser("enqueue", help="play a track (index or file path) after the current one")
+  enqueue.add_argument("track")
+  add = commands.add_parser("add", help="add files in one request; '-' reads paths from stdin, one per line")
+  add.add_argument("paths", nargs="+")
+  add.add_argument("--duplicates", choices=DUPLICATE_MODES, help="skip, merge or keep files that duplicate tracks in the playlist (default: the player's setting)")
+  volume = commands.add_parser("volume", help="set the volume (0.0 to 1.0)")
+  volume.add_argument("level", type=float)
+  for mode in ("shuffle", "repeat"):
+    toggle = commands.add_parser(mode, help=f"toggle {mode}, or set it on or off")
+    toggle.add_argument("state", choices=("on", "off"), nargs="?")
+  commands.add_parser("playlists", help="list playlists")
+  playlist = commands.add_parser("playlist", help="switch to a playlist")
+  playlist.add_argument("name")
+  commands.add_parser("cache", help="show read-ahead cache hits, misses and memory use")
+  watch = commands.add_parser("watch", help=f"print player events as they happen (default: {', '.join(DEFAULT_EVENTS)})")
+  watch.add_argument("events", choices=EVENTS, nargs="*")
+  ping = commands.add_parser("ping", help="measure round-trip latency")
+  ping.add_argument("--count", type=int, default=100)
+  return parser.parse_args()
+
+def read_paths(arguments: list[str]) -> list[str]:
+  paths: list[str] = []
+  for argument in arguments:
+    if argument == "-":
+      paths.extend(line.rstrip("\n") for line in sys.stdin if line.strip())
+    else:
+      paths.append(argument)
+  return paths
+
+def build_command(arguments: argparse.Namespace) -> dict[str, Any]:
+  """Turn parsed arguments into a control command."""
+  name = arguments.command
+  command: dict[str, Any] = {"cmd": name}
+  if name == "play" and arguments.index is not None:
+    command["index"] = arguments.index
+  elif name == "seek":
+    command["seconds"] = arguments.seconds
+  elif name == "enqueue":
+    if arguments.track.isdigit():
+      command["index"] = int(arguments.track)
+    else:
+      command["path"] = arguments.track
+  elif name == "add":
+    command["paths"] = read_paths(arguments.paths)
+    if arguments.duplicates is not None:
+      command["duplicates"] = arguments.duplicates
+  elif name == "volume":
+    command["level"] = arguments.level
+  elif name in ("shuffle", "repeat") and arguments.state is not None:
+    command["on"] = arguments.state == "on"
+  elif name == "playlist":
+    command["name"] = arguments.name
+  return command
+
+def measure_latency(client: ControlClient, count: int) -> None:
+  """Print round-trip times for `count` pings."""
+  timings: list[float] = []
+  for _ in range(count):
+    started = time.perf_counter()
+    client.call("ping")
+    timings.append((time.perf_counter() - started) * 1000)
+  timings.sort()
+  print(f"{count} pings: min {timings[0]:.2f} ms, median {statistics.median(timings):.2f} ms, p99 {timings[int(0.99 * (count - 1))]:.2f} ms, max {timings[-1]:.2f} ms")
+
+def main() -> Optional[int]:
+  """Send one command to the player and print the result."""
+  arguments = parse_arguments()
+  try:
+    with ControlClient(arguments.address) as client:
+      if arguments.command == "ping":
+        measure_latency(client, max(1, arguments.count))
+      elif arguments.command == "watch":
+        client.call("subscribe", events=arguments.events or list(DEFAULT_EVENTS))
+        for event in client.listen():
+          print(json.dumps(event), flush=True)
+      else:
+        result = client.call(**build_command(arguments))
+        if result is not None:
+          print(json.dumps(result, indent=2))
+  except (OSError, RuntimeError) as e:
+    print(f"Error: {e}", file=sys.stderr)
+    return 1
+  except KeyboardInterrupt:
+    pass
+  return None
+
+if __name__ == "__main__":
+  sys.exit(main())
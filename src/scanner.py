@@ -0,0 +1,169 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterator, Optional
+
+from formats import is_audio_file
+from instrumentation import metrics
+from metadata import MetadataCache, TrackMetadata, probe_track
+
+BATCH_SIZE: int = 256
+MAX_PENDING_BATCHES: int = 64
+
+def walk_audio_files(folder: str, cancelled: Optional[threading.Event] = None) -> Iterator[str]:
+  """Recursively yield audio files under a folder in sorted order.
+
+  Files are picked by extension; only extensionless files have their header read.
+  """
+  stack: list[str] = [folder]
+  while stack:
+    if cancelled is not None and cancelled.is_set():
+      return
+    directory = stack.pop()
+    try:
+      with os.scandir(directory) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    except OSError as e:
+      logging.error(f"Cannot scan '{directory}': {e}")
+      continue
+    subdirectories: list[str] = []
+    for entry in entries:
+      try:
+        if entry.is_dir(follow_symlinks=False):
+          subdirectories.append(entry.path)
+        elif entry.is_file() and is_audio_file(entry.path, sniff=True):
+          yield entry.path
+      except OSError as e:
+        logging.error(f"Cannot read '{entry.path}': {e}")
+    stack.extend(reversed(subdirectories))
+
+def probe_batch(paths: list[str]) -> list[TrackMetadata]:
+  """Probe a batch of files; runs inside a worker process."""
+  results: list[TrackMetadata] = []
+  for path in paths:
+    try:
+      results.append(probe_track(path))
+    except OSError as e:
+      logging.error(f"Cannot probe '{path}': {e}")
+  return results
+
+class ScanJob:
+  """A running folder scan whose discovered tracks are drained in batches."""
+
+  def __init__(self, folder: str) -> None:
+    self.folder = folder
+    self.found: int = 0
+    self.probed: int = 0
+    self.started: float = time.perf_counter()
+    self.batches: queue.Queue[list[str]] = queue.Queue()
+    self._cancelled = threading.Event()
+    self._finished = threading.Event()
+
+  @property
+  def done(self) -> bool:
+    """True once the walk and all tag probes have finished or were cancelled."""
+    return self._finished.is_set() and self.batches.empty()
+
+  @property
+  def cancelled(self) -> bool:
+    return self._cancelled.is_set()
+
+  def cancel(self) -> None:
+    """Stop walking and drop any probes not yet started."""
+    self._cancelled.set()
+
+  def drain(self) -> Iterator[list[str]]:
+    """Yield every batch discovered since the last drain without blocking."""
+    while True:
+      try:
+        yield self.batches.get_nowait()
+      except queue.Empty:
+        return
+
+class LibraryScanner:
+  """Walks folders on a background thread and probes tags in a process pool."""
+
+  def __init__(self, metadata: MetadataCache, max_workers: Optional[int] = None) -> None:
+    self.metadata = metadata
+    self.max_workers = max_workers or os.cpu_count() or 1
+    self._executor: Optional[Executor] = None
+    self._jobs: list[ScanJob] = []
+    self._lock = threading.Lock()
+
+  def _get_executor(self) -> Executor:
+    with self._lock:
+      if self._executor is None:
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+      return self._executor
+
+  def scan(self, folder: str) -> ScanJob:
+    """Start scanning a folder and return the job to poll for results."""
+    job = ScanJob(folder)
+    with self._lock:
+      self._jobs = [j for j in self._jobs if not j.done]
+      self._jobs.append(job)
+    threading.Thread(target=self._run, args=(job,), name=f"scan:{folder}", daemon=True).start()
+    return job
+
+  def _run(self, job: ScanJob) -> None:
+    try:
+      executor = self._get_executor()
+      pending: set[Future] = set()
+      batch: list[str] = []
+      for path in walk_audio_files(job.folder, job._cancelled):
+        batch.append(path)
+        if len(batch) >= BATCH_SIZE:
+          pending.add(self._submit(job, executor, batch))
+          batch = []
+          while len(pending) >= MAX_PENDING_BATCHES and not job.cancelled:
+            pending = self._collect(job, pending)
+      if batch and not job.cancelled:
+        pending.add(self._submit(job, executor, batch))
+      while pending and not job.cancelled:
+        pending = self._collect(job, pending)
+      for future in pending:
+        future.cancel()
+      if not job.cancelled:
+        metrics.record("scanner.scan", (time.perf_counter() - job.started) * 1000)  # the walk and every probe
+      logging.info(f"Scan of '{job.folder}' {'cancelled' if job.cancelled else 'finished'}: {job.found} tracks.")
+    except Exception as e:
+      logging.error(f"Error scanning '{job.folder}': {e}", exc_info=True)
+    finally:
+      job._finished.set()
+
+  def _submit(self, job: ScanJob, executor: Executor, batch: list[str]) -> Future:
+    job.found += len(batch)
+    job.batches.put(batch)
+    return executor.submit(probe_batch, batch)
+
+  def _collect(self, job: ScanJob, pending: set[Future]) -> set[Future]:
+    finished, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+    for future in finished:
+      if future.cancelled():
+        continue
+      try:
+        entries = future.result()
+      except Exception as e:
+        logging.error(f"Tag probe failed: {e}")
+        continue
+      self.metadata.put_many(entries)
+      job.probed += len(entries)
+      metrics.count("scanner.files_probed", len(entries))
+    return pending
+
+  def cancel_all(self) -> None:
+    """Cancel every running scan."""
+    with self._lock:
+      for job in self._jobs:
+        job.cancel()
+
+  def close(self) -> None:
+    """Cancel scans and shut down the worker pool."""
+    self.cancel_all()
+    with self._lock:
+      if self._executor is not None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
@@ -0,0 +1,69 @@
+import logging
+from typing import Optional
+
+from tkinter import Misc
+
+from audio import AudioError
+from player import Player
+
+POSITION_INTERVAL_MS: int = 33
+END_APPROACH_MS: int = 500
+END_POLL_MS: int = 20
+
+class PlaybackScheduler:
+  """Drives the player's mixer events from the Tk main loop.
+
+  Nothing is scheduled while playback is stopped, so an idle player costs no
+  CPU. While a track plays, the scheduler wakes every POSITION_INTERVAL_MS
+  (about 30 Hz) to publish a "position" event, and at a tighter interval as
+  the track approaches its end so the end-of-track event is handled promptly.
+  """
+
+  def __init__(self, root: Misc, player: Player, position_interval_ms: int = POSITION_INTERVAL_MS) -> None:
+    self.root = root
+    self.player = player
+    self.position_interval_ms = position_interval_ms
+    self._after_id: Optional[str] = None
+
+  def start(self) -> None:
+    """Begin following playback state."""
+    self.player.events.subscribe("state", self._on_state)
+    if self.player.is_playing:
+      self._schedule(0)
+    logging.info("Playback scheduler started.")
+
+  def stop(self) -> None:
+    """Cancel any pending wake-up."""
+    if self._after_id is not None:
+      self.root.after_cancel(self._after_id)
+      self._after_id = None
+
+  def _on_state(self, is_playing: bool) -> None:
+    if is_playing and self._after_id is None:
+      self._schedule(0)
+
+  def _schedule(self, delay_ms: int) -> None:
+    self._after_id = self.root.after(delay_ms, self._tick)
+
+  def _tick(self) -> None:
+    self._after_id = None
+    try:
+      self.player.pump_events()
+    except AudioError as e:
+      logging.error(f"Error processing mixer events: {e}")
+      self.player.events.publish("error", message=str(e), path=None)
+    if not self.player.is_playing:
+      return
+    position = self.player.get_position()
+    self.player.events.publish("position", seconds=position)
+    self._schedule(self._next_delay(position * 1000))
+
+  def _next_delay(self, position_ms: float) -> int:
+    """Wake sooner when the current track is about to end."""
+    duration = self.player.get_duration()
+    if duration is None:
+      return self.position_interval_ms
+    remaining_ms = duration * 1000 - position_ms
+    if remaining_ms <= END_APPROACH_MS:
+      return END_POLL_MS
+    return int(min(self.position_interval_ms, remaining_ms - END_APPROACH_MS))
@@ -0,0 +1,162 @@
+import bisect
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from metadata import TrackMetadata
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text: str) -> list[str]:
+  """Split text into lowercase word tokens."""
+  return TOKEN_PATTERN.findall(text.lower())
+
+def trigrams(token: str) -> set[str]:
+  """All three-character substrings of a token."""
+  return {token[i:i + 3] for i in range(len(token) - 2)}
+
+def track_tokens(path: str, entry: Optional[TrackMetadata]) -> set[str]:
+  """Tokens for a track's file name and, when known, its title, artist and album."""
+  fields = [os.path.splitext(os.path.basename(path))[0]]
+  if entry is not None:
+    fields.extend(value for value in (entry.title, entry.artist, entry.album) if value)
+  return {token for field in fields for token in tokenize(field)}
+
+class SearchIndex:
+  """Incremental inverted index over playlist tracks with prefix and trigram matching.
+
+  Tokens map to the IDs of the tracks containing them, so results can be
+  matched against a playlist's track IDs without looking up paths. A sorted
+  vocabulary answers prefix queries with a binary search, and a trigram index
+  narrows substring queries to a few candidate tokens before checking them. A
+  query matches tracks that contain every query term as a prefix or substring
+  of one of their tokens.
+  """
+
+  def __init__(self) -> None:
+    self._postings: dict[str, set[int]] = {}
+    self._trigrams: defaultdict[str, set[str]] = defaultdict(set)
+    self._vocabulary: list[str] = []
+    self._tokens: dict[int, set[str]] = {}
+    self._counts: dict[int, int] = {}
+    self._paths: dict[int, str] = {}
+    self._ids: dict[str, int] = {}
+    self._lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return len(self._tokens)
+
+  def add(self, track_id: int, path: str, entry: Optional[TrackMetadata] = None) -> None:
+    """Index a track; adding it twice only bumps its reference count."""
+    with self._lock:
+      self._counts[track_id] = self._counts.get(track_id, 0) + 1
+      if self._counts[track_id] == 1:
+        self._index(track_id, path, track_tokens(path, entry))
+
+  def add_many(self, tracks: Iterable[tuple[int, str, Optional[TrackMetadata]]]) -> None:
+    """Index several tracks, merging their new tokens into the vocabulary with one sort."""
+    tokenized = [(track_id, path, track_tokens(path, entry)) for track_id, path, entry in tracks]
+    with self._lock:
+      new_tokens: list[str] = []
+      for track_id, path, tokens in tokenized:
+        self._counts[track_id] = self._counts.get(track_id, 0) + 1
+        if self._counts[track_id] == 1:
+          self._index(track_id, path, tokens, new_tokens)
+      if new_tokens:
+        self._vocabulary.extend(new_tokens)
+        self._vocabulary.sort()
+
+  def remove(self, track_id: int) -> None:
+    """Drop one reference to a track, unindexing it when none remain."""
+    with self._lock:
+      count = self._counts.get(track_id, 0)
+      if count > 1:
+        self._counts[track_id] = count - 1
+      elif count == 1:
+        del self._counts[track_id]
+        self._unindex(track_id)
+
+  def update(self, entry: TrackMetadata) -> None:
+    """Re-index a track after its tags changed."""
+    with self._lock:
+      track_id = self._ids.get(entry.path)
+      if track_id is None:
+        return
+      tokens = track_tokens(entry.path, entry)
+      if tokens != self._tokens.get(track_id):
+        self._unindex(track_id)
+        self._index(track_id, entry.path, tokens)
+
+  def clear(self) -> None:
+    with self._lock:
+      self._postings.clear()
+      self._trigrams.clear()
+      self._vocabulary.clear()
+      self._tokens.clear()
+      self._counts.clear()
+      self._paths.clear()
+      self._ids.clear()
+
+  def _index(self, track_id: int, path: str, tokens: set[str], new_tokens: Optional[list[str]] = None) -> None:
+    """Add a track's tokens; new vocabulary goes to `new_tokens` for the caller to merge, if given."""
+    self._tokens[track_id] = tokens
+    self._paths[track_id] = path
+    self._ids[path] = track_id
+    for token in tokens:
+      postings = self._postings.get(token)
+      if postings is None:
+        postings = self._postings[token] = set()
+        if new_tokens is None:
+          bisect.insort(self._vocabulary, token)
+        else:
+          new_tokens.append(token)
+        for trigram in trigrams(token):
+          self._trigrams[trigram].add(token)
+      postings.add(track_id)
+
+  def _unindex(self, track_id: int) -> None:
+    path = self._paths.pop(track_id, None)
+    if self._ids.get(path) == track_id:
+      del self._ids[path]
+    for token in self._tokens.pop(track_id, ()):
+      postings = self._postings[token]
+      postings.discard(track_id)
+      if not postings:
+        del self._postings[token]
+        del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+        for trigram in trigrams(token):
+          self._trigrams[trigram].discard(token)
+          if not self._trigrams[trigram]:
+            del self._trigrams[trigram]
+
+  def _matching_tokens(self, term: str) -> set[str]:
+    start = bisect.bisect_left(self._vocabulary, term)
+    end = bisect.bisect_left(self._vocabulary, term + "\uffff", start)
+    matches = set(self._vocabulary[start:end])
+    if len(term) >= 3:
+      candidates: Optional[set[str]] = None
+      for trigram in trigrams(term):
+        tokens = self._trigrams.get(trigram, set())
+        candidates = tokens.copy() if candidates is None else candidates & tokens
+        if not candidates:
+          break
+      matches.update(token for token in candidates or () if term in token)
+    return matches
+
+  def search(self, query: str) -> Optional[set[int]]:
+    """IDs of the tracks matching every term of the query, or None for an empty query."""
+    terms = tokenize(query)
+    if not terms:
+      return None
+    result: Optional[set[int]] = None
+    with self._lock:
+      for term in sorted(terms, key=len, reverse=True):
+        track_ids: set[int] = set()
+        for token in self._matching_tokens(term):
+          track_ids |= self._postings[token]
+        result = track_ids if result is None else result & track_ids
+        if not result:
+          return set()
+    return result
@@ -0,0 +1,93 @@
+import random
+from typing import Callable, Optional
+
+from playlist import Playlist
+
+SPREAD_CANDIDATES: int = 8   # unplayed tracks considered per draw
+SPREAD_DISTANCE: int = 5     # an artist heard this many tracks ago or earlier is fine again
+
+class ShuffleOrder:
+  """A shuffled play order over a playlist's track IDs, drawn one track at a time.
+
+  This is a Fisher-Yates shuffle of the ID range carried out lazily: the
+  first `played` positions hold the tracks played in this cycle, the rest
+  are the unplayed pool, and only positions disturbed by a swap are stored.
+  Turning shuffle on is O(1), each draw is O(SPREAD_CANDIDATES), and memory
+  grows with the number of tracks played rather than the playlist size.
+  The playlist itself is never reordered.
+
+  Tracks added later join the pool because their IDs extend the range;
+  removed ones are retired when drawn. No track repeats until the pool is
+  empty. Each draw looks at a few random candidates and prefers one whose
+  artist (from cached tags) has not been heard in the last SPREAD_DISTANCE
+  tracks, falling back to the one heard longest ago.
+  """
+
+  def __init__(self, playlist: Playlist, artist_of: Callable[[int], Optional[str]], seed: Optional[int] = None) -> None:
+    self.playlist = playlist
+    self.artist_of = artist_of
+    self._random = random.Random(seed)
+    self.reset()
+
+  def reset(self) -> None:
+    """Start a new cycle in which every track is unplayed."""
+    self.played: int = 0
+    self._at: dict[int, int] = {}        # position -> track ID, where it differs from the position
+    self._position: dict[int, int] = {}  # track ID -> position, where it differs from the ID
+    self._artist_heard: dict[str, int] = {}
+    self._upcoming: Optional[int] = None
+
+  def _swap(self, a: int, b: int) -> None:
+    first, second = self._at.get(a, a), self._at.get(b, b)
+    self._at[a], self._at[b] = second, first
+    self._position[second], self._position[first] = a, b
+
+  def _retire(self, position: int) -> int:
+    """Move the track at a pool position into the played prefix."""
+    self._swap(self.played, position)
+    self.played += 1
+    return self._at[self.played - 1]
+
+  def _distance(self, track_id: int) -> int:
+    artist = self.artist_of(track_id)
+    if artist is None or artist not in self._artist_heard:
+      return SPREAD_DISTANCE
+    return self.played - self._artist_heard[artist]
+
+  def _draw(self) -> Optional[int]:
+    best: Optional[int] = None
+    best_distance = -1
+    for _ in range(SPREAD_CANDIDATES):
+      bound = self.playlist.id_bound
+      while self.played < bound:
+        position = self._random.randrange(self.played, bound)
+        track_id = self._at.get(position, position)
+        if self.playlist.contains_id(track_id):
+          break
+        self._retire(position)
+      else:
+        break
+      distance = self._distance(track_id)
+      if distance > best_distance:
+        best, best_distance = track_id, distance
+      if distance >= SPREAD_DISTANCE:
+        break
+    return best
+
+  def peek(self) -> Optional[int]:
+    """The track that plays next in this cycle, drawn on first use; None once every track has played."""
+    if self._upcoming is None or not self.playlist.contains_id(self._upcoming):
+      self._upcoming = self._draw()
+    return self._upcoming
+
+  def mark_played(self, track_id: int) -> None:
+    """Record that a track started playing, however it was chosen."""
+    if track_id == self._upcoming:
+      self._upcoming = None
+    position = self._position.get(track_id, track_id)
+    if position < self.played or position >= self.playlist.id_bound:
+      return
+    self._retire(position)
+    artist = self.artist_of(track_id)
+    if artist is not None:
+      self._artist_heard[artist] = self.played
@@ -0,0 +1,142 @@
+import functools
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, fields
+from typing import Any, Callable, Optional, TypeVar
+
+from tkinter import Misc, TclError
+
+WAKE_EVENT: str = "<<PlayerCommands>>"
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+@dataclass(frozen=True, slots=True)
+class PlayerState:
+  """An immutable snapshot of what the player shows, safe to read from any thread."""
+  is_playing: bool = False
+  is_paused: bool = False
+  current_track_id: Optional[int] = None
+  current_track_index: Optional[int] = None
+  playlist_name: Optional[str] = None
+  playlist_length: int = 0
+  version: int = 0
+  queue_version: int = 0
+  metadata_version: int = 0
+  shuffle: bool = False
+  repeat: bool = False
+  volume: float = 0.5
+  crossfade: float = 0.0
+  normalize: bool = True
+
+  def changes_from(self, other: "PlayerState") -> frozenset[str]:
+    """Names of the fields that differ from another snapshot."""
+    return frozenset(field.name for field in fields(self) if getattr(self, field.name) != getattr(other, field.name))
+
+class CommandQueue:
+  """Runs the player's commands on the one thread that owns its state.
+
+  The owner is the thread that created the queue (the Tk thread in the
+  app). Commands called there run at once; commands called from any other
+  thread are queued, run by the owner in order, and answered through a
+  Future. When the outermost command returns, `on_settled` runs so a new
+  state snapshot can be published once per command rather than once per
+  nested call. Attached to a Tk root, the owner is woken by a virtual event
+  when the queue goes from empty to non-empty, so nothing polls while idle.
+  """
+
+  def __init__(self, on_settled: Callable[[], None] = lambda: None) -> None:
+    self.on_settled = on_settled
+    self.owner: int = threading.get_ident()
+    self._queue: queue.SimpleQueue[tuple[Future, Callable[..., Any], tuple, dict]] = queue.SimpleQueue()
+    self._depth: int = 0
+    self._root: Optional[Misc] = None
+    self._armed: bool = False  # a wake event is on its way to the owner
+    self._wake_lock = threading.Lock()
+
+  def owned(self) -> bool:
+    """True on the thread that may change player state."""
+    return threading.get_ident() == self.owner
+
+  def submit(self, function: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    """Queue a call for the owner thread from any thread."""
+    future: Future = Future()
+    self._queue.put((future, function, args, kwargs))
+    self._wake()
+    return future
+
+  def execute(self, function: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a command now on the owner thread, or queue it and return a Future from anywhere else."""
+    if not self.owned():
+      return self.submit(function, *args, **kwargs)
+    self._depth += 1
+    try:
+      return function(*args, **kwargs)
+    finally:
+      self._depth -= 1
+      if not self._depth:
+        self.on_settled()
+
+  def run_pending(self, timeout: float = 0.0) -> int:
+    """Run queued commands on the owner thread; with a timeout, wait that long for the first. Returns the number run."""
+    if not self.owned():
+      raise RuntimeError("Queued commands must run on the thread that owns the player")
+    processed = 0
+    while True:
+      try:
+        future, function, args, kwargs = self._queue.get(block=timeout > 0 and not processed, timeout=timeout or None)
+      except queue.Empty:
+        return processed
+      processed += 1
+      if not future.set_running_or_notify_cancel():
+        continue
+      try:
+        future.set_result(self.execute(function, *args, **kwargs))
+      except BaseException as e:
+        logging.error(f"Command {getattr(function, '__qualname__', function)} failed: {e}", exc_info=True)
+        future.set_exception(e)
+
+  def attach(self, root: Misc) -> None:
+    """Run queued commands from the Tk main loop, woken by WAKE_EVENT; the calling thread becomes the owner."""
+    self.owner = threading.get_ident()
+    self._root = root
+    root.bind(WAKE_EVENT, self._drain)
+    root.after_idle(self._drain)  # commands queued before attaching
+
+  def detach(self) -> None:
+    if self._root is not None:
+      self._root.unbind(WAKE_EVENT)
+      self._root = None
+
+  def _wake(self) -> None:
+    """Post one wake event to the owner's main loop unless one is already pending."""
+    root = self._root
+    if root is None:
+      return
+    with self._wake_lock:
+      if self._armed:
+        return
+      self._armed = True
+    try:
+      root.event_generate(WAKE_EVENT, when="tail")
+    except (RuntimeError, TclError) as e:  # the main loop is not running (yet, or any more)
+      with self._wake_lock:
+        self._armed = False
+      logging.debug(f"Cannot wake the command queue: {e}")
+
+  def _drain(self, event: object = None) -> None:
+    with self._wake_lock:
+      self._armed = False
+    self.run_pending()
+
+def command(method: F) -> F:
+  """Mark a method of an object with a `commands` CommandQueue as a state-changing command.
+
+  On the owner thread the method runs directly; from any other thread it is
+  queued and the call returns a Future of its result.
+  """
+  @functools.wraps(method)
+  def run(self, *args, **kwargs):
+    return self.commands.execute(method, self, *args, **kwargs)
+  return run
@@ -0,0 +1,414 @@
+import ctypes
+import logging
+import marshal
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, Optional
+
+from formats import is_audio_file
+from persistence import atomic_write_marshal
+
+WATCH_FILE: str = "watch.snapshot"
+WATCH_SNAPSHOT_VERSION: int = 2
+POLL_INTERVAL: float = 5.0
+SETTLE_SECONDS: float = 0.5   # gather a burst of inotify events before rescanning
+SAVE_INTERVAL: float = 30.0   # persist the snapshot at most this often while running
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+
+# A directory's entry: (mtime_ns, {audio file name: (size, mtime_ns)}, [subdirectory names])
+DirectoryEntry = tuple[int, dict[str, tuple[int, int]], list[str]]
+
+@dataclass
+class LibraryDelta:
+  """Files that appeared, disappeared or moved in watched folders since the last delta."""
+  added: list[str] = field(default_factory=list)
+  removed: list[str] = field(default_factory=list)
+  renamed: list[tuple[str, str]] = field(default_factory=list)
+
+  def __bool__(self) -> bool:
+    return bool(self.added or self.removed or self.renamed)
+
+def scan_directory(path: str) -> DirectoryEntry:
+  """List one directory: its mtime, audio files with (size, mtime) and subdirectories."""
+  files: dict[str, tuple[int, int]] = {}
+  subdirectories: list[str] = []
+  mtime_ns = os.stat(path).st_mtime_ns
+  with os.scandir(path) as it:
+    for entry in it:
+      try:
+        if entry.is_dir(follow_symlinks=False):
+          subdirectories.append(entry.name)
+        elif entry.is_file() and is_audio_file(entry.path, sniff=True):
+          stat = entry.stat()
+          files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+      except OSError as e:
+        logging.error(f"Cannot read '{entry.path}': {e}")
+  return mtime_ns, files, sorted(subdirectories)
+
+class DirectorySnapshot:
+  """Last known contents of every directory under the watched folders.
+
+  Syncing compares directories against it. A directory whose mtime is
+  unchanged has had no entries added, removed or renamed, so it is not
+  listed again; only its subdirectories are visited. Files whose content
+  changed in place keep their path and are left to the metadata cache,
+  which re-probes on (mtime, size) change.
+  """
+
+  def __init__(self, directories: Optional[dict[str, DirectoryEntry]] = None) -> None:
+    self.directories: dict[str, DirectoryEntry] = directories or {}
+
+  def sync(self, roots: Iterable[str], force: bool = False, descend_known: bool = True) -> tuple[LibraryDelta, list[str], list[str]]:
+    """Bring the snapshot up to date under `roots`; return (delta, new directories, vanished directories).
+
+    With `force`, roots are listed even if their mtime is unchanged. With
+    `descend_known` False, only subdirectories not in the snapshot yet are
+    walked, which is what an inotify event for a single directory needs.
+    """
+    added: list[tuple[str, int, int]] = []
+    removed: list[tuple[str, int, int]] = []
+    created: list[str] = []
+    vanished: list[str] = []
+    stack = [(root, force) for root in roots]
+    while stack:
+      directory, forced = stack.pop()
+      old = self.directories.get(directory)
+      try:
+        mtime_ns = os.stat(directory).st_mtime_ns
+        if old is not None and old[0] == mtime_ns and not forced:
+          entry = old
+        else:
+          entry = scan_directory(directory)
+      except OSError:
+        if old is not None:
+          vanished.extend(self._drop(directory, removed))
+        continue
+      if old is None:
+        created.append(directory)
+      if entry is not old:
+        old_files = old[1] if old is not None else {}
+        for name, (size, mtime) in entry[1].items():
+          if name not in old_files:
+            added.append((os.path.join(directory, name), size, mtime))
+        for name, (size, mtime) in old_files.items():
+          if name not in entry[1]:
+            removed.append((os.path.join(directory, name), size, mtime))
+        for name in set(old[2] if old is not None else ()) - set(entry[2]):
+          vanished.extend(self._drop(os.path.join(directory, name), removed))
+        self.directories[directory] = entry
+      for name in entry[2]:
+        child = os.path.join(directory, name)
+        if descend_known or child not in self.directories:
+          stack.append((child, False))
+    return self._pair_renames(added, removed), created, vanished
+
+  def _drop(self, directory: str, removed: list[tuple[str, int, int]]) -> list[str]:
+    """Forget a directory subtree, recording its files as removed."""
+    prefix = directory + os.sep
+    dropped = [path for path in self.directories if path == directory or path.startswith(prefix)]
+    for path in dropped:
+      for name, (size, mtime) in self.directories.pop(path)[1].items():
+        removed.append((os.path.join(path, name), size, mtime))
+    return dropped
+
+  def forget(self, root: str) -> None:
+    self._drop(root, [])
+
+  @staticmethod
+  def _pair_renames(added: list[tuple[str, int, int]], removed: list[tuple[str, int, int]]) -> LibraryDelta:
+    """Match removed and added files with the same (size, mtime) as renames, when the match is unique."""
+    def by_key(files: list[tuple[str, int, int]]) -> dict[tuple[int, int], list[str]]:
+      keys: dict[tuple[int, int], list[str]] = {}
+      for path, size, mtime in files:
+        keys.setdefault((size, mtime), []).append(path)
+      return keys
+    added_keys, removed_keys = by_key(added), by_key(removed)
+    delta = LibraryDelta()
+    renamed_from: set[str] = set()
+    renamed_to: set[str] = set()
+    for key, old_paths in removed_keys.items():
+      new_paths = added_keys.get(key, [])
+      if len(old_paths) == 1 and len(new_paths) == 1:
+        delta.renamed.append((old_paths[0], new_paths[0]))
+        renamed_from.add(old_paths[0])
+        renamed_to.add(new_paths[0])
+    delta.added = sorted(path for path, _, _ in added if path not in renamed_to)
+    delta.removed = sorted(path for path, _, _ in removed if path not in renamed_from)
+    return delta
+
+class Inotify:
+  """Minimal Linux inotify binding through ctypes, reporting which watched directories changed."""
+
+  def __init__(self) -> None:
+    if not sys.platform.startswith("linux"):
+      raise OSError("inotify is only available on Linux")
+    self._libc = ctypes.CDLL(None, use_errno=True)  # already loaded; find_library runs ldconfig, which can hang beside forking process pools
+    self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if self._fd < 0:
+      raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    self._paths: dict[int, str] = {}
+    self._descriptors: dict[str, int] = {}
+
+  def add(self, directory: str) -> None:
+    descriptor = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+    if descriptor < 0:
+      error = ctypes.get_errno()
+      raise OSError(error, f"Cannot watch '{directory}': {os.strerror(error)}")
+    self._paths[descriptor] = directory
+    self._descriptors[directory] = descriptor
+
+  def remove(self, directory: str) -> None:
+    descriptor = self._descriptors.pop(directory, None)
+    if descriptor is not None:
+      self._paths.pop(descriptor, None)
+      self._libc.inotify_rm_watch(self._fd, descriptor)
+
+  def read(self, timeout: Optional[float]) -> Optional[set[str]]:
+    """Directories with events within `timeout` seconds; None if the kernel queue overflowed."""
+    changed: set[str] = set()
+    readable, _, _ = select.select([self._fd], [], [], timeout)
+    if not readable:
+      return changed
+    while True:
+      try:
+        data = os.read(self._fd, 64 * 1024)
+      except BlockingIOError:
+        return changed
+      offset = 0
+      while offset < len(data):
+        descriptor, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+        offset += EVENT_HEADER.size + length
+        if mask & IN_Q_OVERFLOW:
+          return None
+        directory = self._paths.get(descriptor)
+        if directory is None:
+          continue
+        if mask & IN_IGNORED:
+          self._paths.pop(descriptor, None)
+          self._descriptors.pop(directory, None)
+        changed.add(directory)
+
+  def fileno(self) -> int:
+    return self._fd
+
+  def close(self) -> None:
+    os.close(self._fd)
+
+class FolderWatcher:
+  """Keeps watched folders in sync and queues the changes as LibraryDelta batches.
+
+  On start the persisted snapshot is compared with the disk, so changes
+  made while the player was closed are picked up without rescanning
+  unchanged directories. After that, inotify reports which directories to
+  re-list; where inotify is unavailable or runs out of watches, folders
+  are polled every `poll_interval` seconds using the same mtime diff.
+  Deltas are drained by the Tk thread, like scan batches; `on_change` is
+  called from the watch thread whenever one is queued. Each folder can be
+  watched on behalf of an owner, the playlist its new files belong in.
+  """
+
+  def __init__(self, snapshot_path: str = WATCH_FILE, poll_interval: float = POLL_INTERVAL, use_inotify: bool = True, on_change: Optional[Callable[[], None]] = None) -> None:
+    self.snapshot_path = snapshot_path
+    self.poll_interval = poll_interval
+    self.use_inotify = use_inotify
+    self.on_change = on_change
+    self.folders: list[str] = []
+    self.owners: dict[str, str] = {}
+    self.snapshot = DirectorySnapshot()
+    self.deltas: queue.Queue[LibraryDelta] = queue.Queue()
+    self._requests: queue.Queue[tuple[str, str, Optional[str]]] = queue.Queue()
+    self._inotify: Optional[Inotify] = None
+    self._wake_r, self._wake_w = os.pipe()
+    self._stopped = threading.Event()
+    self._thread: Optional[threading.Thread] = None
+    self._dirty = False
+    self._saved_at: float = 0.0
+    self._load()
+
+  def _load(self) -> None:
+    try:
+      with open(self.snapshot_path, "rb") as file:
+        version, folders, directories, *rest = marshal.load(file)
+    except FileNotFoundError:
+      return
+    except (OSError, EOFError, ValueError, TypeError) as e:
+      logging.warning(f"Ignoring unreadable watch snapshot: {e}")
+      return
+    if version in (1, WATCH_SNAPSHOT_VERSION):  # version 1 recorded no owners
+      self.folders = list(folders)
+      self.owners = dict(rest[0]) if rest else {}
+      self.snapshot = DirectorySnapshot(directories)
+
+  def save(self) -> None:
+    try:
+      atomic_write_marshal(self.snapshot_path, (WATCH_SNAPSHOT_VERSION, self.folders, self.snapshot.directories, self.owners))
+      self._dirty = False
+      self._saved_at = time.monotonic()
+    except OSError as e:
+      logging.error(f"Error saving watch snapshot: {e}")
+
+  def start(self) -> None:
+    """Start watching in the background; does nothing until a folder is watched."""
+    if self._thread is None and (self.folders or not self._requests.empty()):
+      self._thread = threading.Thread(target=self._run, name="folder-watch", daemon=True)
+      self._thread.start()
+
+  def watch(self, folder: str, owner: Optional[str] = None) -> None:
+    """Add a folder whose new files belong to `owner`. Its current contents become the baseline and are not reported."""
+    self._requests.put(("watch", os.path.abspath(folder), owner))
+    self._wake()
+    self.start()
+
+  def unwatch(self, folder: str) -> None:
+    self._requests.put(("unwatch", os.path.abspath(folder), None))
+    self._wake()
+
+  def owner_of(self, path: str) -> Optional[str]:
+    """Owner recorded for the watched folder containing `path`, if any."""
+    for folder, owner in list(self.owners.items()):
+      if path.startswith(folder + os.sep):
+        return owner
+    return None
+
+  def drain(self) -> Iterator[LibraryDelta]:
+    """Yield every delta queued since the last drain without blocking."""
+    while True:
+      try:
+        yield self.deltas.get_nowait()
+      except queue.Empty:
+        return
+
+  def close(self) -> None:
+    self._stopped.set()
+    self._wake()
+    if self._thread is not None:
+      self._thread.join(timeout=2)
+    if self._dirty:
+      self.save()
+
+  def _wake(self) -> None:
+    try:
+      os.write(self._wake_w, b"x")
+    except OSError:
+      pass
+
+  def _run(self) -> None:
+    try:
+      self._start_inotify()
+      self._emit(self._sync(self.folders))
+      while not self._stopped.is_set():
+        self._handle_requests()
+        if self._inotify is not None:
+          changed = self._wait_inotify()
+          self._emit(self._sync(self.folders) if changed is None else self._sync(changed, force=True, descend_known=False))
+        else:
+          readable, _, _ = select.select([self._wake_r], [], [], self.poll_interval)
+          if readable:
+            os.read(self._wake_r, 1024)
+          else:
+            self._emit(self._sync(self.folders))
+    except Exception as e:
+      logging.error(f"Folder watcher stopped: {e}", exc_info=True)
+    finally:
+      if self._inotify is not None:
+        self._inotify.close()
+        self._inotify = None
+
+  def _start_inotify(self) -> None:
+    if not self.use_inotify:
+      return
+    try:
+      self._inotify = Inotify()
+      for directory in self.snapshot.directories:
+        self._inotify.add(directory)
+      logging.info("Watching folders with inotify.")
+    except OSError as e:
+      self._fall_back(e)
+
+  def _fall_back(self, error: OSError) -> None:
+    logging.warning(f"inotify unavailable ({error}); polling watched folders every {self.poll_interval:.0f}s.")
+    if self._inotify is not None:
+      self._inotify.close()
+      self._inotify = None
+
+  def _wait_inotify(self) -> Optional[set[str]]:
+    """Block for events, then keep collecting until the burst settles."""
+    readable, _, _ = select.select([self._inotify.fileno(), self._wake_r], [], [])
+    if self._wake_r in readable:
+      os.read(self._wake_r, 1024)
+      return set()
+    changed = self._inotify.read(0)
+    while changed is not None and not self._stopped.is_set():
+      more = self._inotify.read(SETTLE_SECONDS)
+      if more is None:
+        return None
+      if not more:
+        break
+      changed |= more
+    return changed
+
+  def _handle_requests(self) -> None:
+    while True:
+      try:
+        action, folder, owner = self._requests.get_nowait()
+      except queue.Empty:
+        return
+      if action == "watch" and not any(folder == root or folder.startswith(root + os.sep) for root in self.folders):
+        self.folders.append(folder)
+        if owner is not None:
+          self.owners[folder] = owner
+        self._sync([folder])  # baseline only; the caller scans the folder itself
+        logging.info(f"Watching '{folder}'.")
+      elif action == "unwatch" and folder in self.folders:
+        self.folders.remove(folder)
+        self.owners.pop(folder, None)
+        for directory in [d for d in self.snapshot.directories if d == folder or d.startswith(folder + os.sep)]:
+          if self._inotify is not None:
+            self._inotify.remove(directory)
+        self.snapshot.forget(folder)
+        logging.info(f"Stopped watching '{folder}'.")
+      else:
+        continue
+      self.save()
+
+  def _sync(self, roots: Iterable[str], force: bool = False, descend_known: bool = True) -> LibraryDelta:
+    roots = [root for root in roots if any(root == folder or root.startswith(folder + os.sep) for folder in self.folders)]
+    delta, created, vanished = self.snapshot.sync(roots, force=force, descend_known=descend_known)
+    if self._inotify is not None:
+      for directory in vanished:
+        self._inotify.remove(directory)
+      try:
+        for directory in created:
+          self._inotify.add(directory)
+      except OSError as e:
+        self._fall_back(e)
+    if delta or created or vanished:
+      self._dirty = True
+    return delta
+
+  def _emit(self, delta: LibraryDelta) -> None:
+    if delta:
+      logging.info(f"Library changed: {len(delta.added)} added, {len(delta.removed)} removed, {len(delta.renamed)} renamed.")
+      self.deltas.put(delta)
+      if self.on_change is not None:
+        self.on_change()
+    if self._dirty and time.monotonic() - self._saved_at >= SAVE_INTERVAL:
+      self.save()
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import subprocess
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional
+
+from loudness import ffmpeg_available
+
+if TYPE_CHECKING:
+  import numpy as np
+
+WAVEFORM_DIR: str = "waveforms"
+PEAK_COUNT: int = 1000
+DECODE_RATE: int = 8000        # mono samples per second; plenty for an overview
+FINE_BLOCK: int = 256          # samples per intermediate min/max pair (32 ms)
+CHUNK_BLOCKS: int = 512        # decode about 16 s per read
+FINGERPRINT_BYTES: int = 64 * 1024
+
+def fingerprint(path: str) -> str:
+  """Content key for a file: its size and a hash of its first 64 KiB."""
+  digest = hashlib.sha1()
+  with open(path, "rb") as file:
+    digest.update(str(os.fstat(file.fileno()).st_size).encode())
+    digest.update(file.read(FINGERPRINT_BYTES))
+  return digest.hexdigest()
+
+def compute_peaks(path: str, count: int = PEAK_COUNT) -> Optional[array]:
+  """Decode a track and reduce it to `count` interleaved (min, max) pairs scaled to int8.
+
+  Audio is streamed from ffmpeg in bounded chunks and folded into one
+  min/max pair per FINE_BLOCK samples as it arrives, so memory grows only
+  with that intermediate resolution, never with the decoded PCM.
+  """
+  import numpy as np
+  command = [
+    "ffmpeg", "-v", "error", "-nostdin", "-i", path,
+    "-f", "f32le", "-ac", "1", "-ar", str(DECODE_RATE), "-"
+  ]
+  block_bytes = FINE_BLOCK * 4
+  lows: list[np.ndarray] = []
+  highs: list[np.ndarray] = []
+  carry = b""
+  with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+    while True:
+      data = process.stdout.read(block_bytes * CHUNK_BLOCKS)
+      if not data:
+        break
+      data = carry + data
+      usable = len(data) - len(data) % block_bytes
+      carry = data[usable:]
+      if usable:
+        blocks = np.frombuffer(data[:usable], dtype=np.float32).reshape(-1, FINE_BLOCK)
+        lows.append(blocks.min(axis=1))
+        highs.append(blocks.max(axis=1))
+  if len(carry) >= 4:
+    tail = np.frombuffer(carry[:len(carry) - len(carry) % 4], dtype=np.float32)
+    lows.append(tail.min(keepdims=True))
+    highs.append(tail.max(keepdims=True))
+  if process.returncode != 0 or not lows:
+    return None
+  low = np.concatenate(lows)
+  high = np.concatenate(highs)
+  starts = np.unique(np.linspace(0, len(low), count, endpoint=False).astype(np.int64))
+  pairs = np.empty((len(starts), 2), dtype=np.float32)
+  pairs[:, 0] = np.minimum.reduceat(low, starts)
+  pairs[:, 1] = np.maximum.reduceat(high, starts)
+  return array("b", np.clip(np.round(pairs * 127), -127, 127).astype(np.int8).tobytes())
+
+class WaveformCache:
+  """Peak overviews for tracks, computed once in the background and kept on disk.
+
+  Peaks are stored as raw int8 `array` blobs named by the file's content
+  fingerprint, so a moved or renamed file reuses its overview. `get` is
+  meant to be called from the Tk thread on every position update: it only
+  reads memory and hands any disk access or decoding to a worker.
+  """
+
+  def __init__(self, directory: str = WAVEFORM_DIR, max_workers: int = 1) -> None:
+    self.directory = directory
+    self.version: int = 0
+    self._peaks: dict[str, Optional[array]] = {}
+    self._pending: set[str] = set()
+    self._lock = threading.Lock()
+    self._warned = False
+    self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="waveform")
+
+  def get(self, path: str) -> Optional[array]:
+    """Peaks for a track if known; otherwise None, and they are loaded or computed in the background."""
+    with self._lock:
+      if path in self._peaks:
+        return self._peaks[path]
+      if path in self._pending:
+        return None
+      self._pending.add(path)
+    self._executor.submit(self._load, path)
+    return None
+
+  def _blob_path(self, key: str) -> str:
+    return os.path.join(self.directory, f"{key}.peaks")
+
+  def _load(self, path: str) -> None:
+    peaks: Optional[array] = None
+    try:
+      blob = self._blob_path(fingerprint(path))
+      if os.path.exists(blob):
+        peaks = array("b")
+        with open(blob, "rb") as file:
+          peaks.frombytes(file.read())
+      elif not ffmpeg_available():
+        if not self._warned:
+          logging.warning("ffmpeg not found; waveforms disabled.")
+          self._warned = True
+      else:
+        peaks = compute_peaks(path)
+        if peaks is not None:
+          self._save(blob, peaks)
+    except Exception as e:
+      logging.error(f"Cannot build waveform for '{path}': {e}")
+    with self._lock:
+      self._pending.discard(path)
+      self._peaks[path] = peaks
+      self.version += 1
+
+  def _save(self, blob: str, peaks: array) -> None:
+    os.makedirs(self.directory, exist_ok=True)
+    temporary = f"{blob}.tmp"
+    with open(temporary, "wb") as file:
+      peaks.tofile(file)
+    os.replace(temporary, blob)
+
+  def close(self) -> None:
+    self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,50 @@
+import os
+import time
+
+import pytest
+
+os.environ["PLAYER_AUDIO_BACKEND"] = "null"
+
+from audio import NullBackend  # noqa: E402
+from player import Player  # noqa: E402
+
+SETTLE_SECONDS: float = 30.0
+
+def pytest_addoption(parser):
+  parser.addoption("--playlist-sizes", default="1000", help="comma-separated playlist sizes to benchmark (default: %(default)s)")
+
+def make_player(directory: str, **options) -> Player:
+  """A player on the null backend whose files all live in `directory`."""
+  return Player(
+    PLAYLIST_FILE=os.path.join(directory, "playlist.json"),
+    LIBRARY_FILE=os.path.join(directory, "library.db"),
+    METADATA_FILE=os.path.join(directory, "metadata.db"),
+    HASH_FILE=os.path.join(directory, "hashes.db"),
+    TRANSCODE_DIR=os.path.join(directory, "transcode_cache"),
+    WAVEFORM_DIR=os.path.join(directory, "waveforms"),
+    WATCH_FILE=os.path.join(directory, "watched.snapshot"),
+    audio=NullBackend(),
+    **options
+  )
+
+def settle(player: Player) -> None:
+  """Run queued commands on this (the owner) thread until background duplicate checks are done."""
+  deadline = time.monotonic() + SETTLE_SECONDS
+  while player.dedup.busy:
+    if time.monotonic() > deadline:
+      raise TimeoutError("duplicate check did not finish")
+    player.commands.run_pending(timeout=0.01)
+  player.commands.run_pending()
+
+def write_file(path: str, data: bytes) -> str:
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  with open(path, "wb") as file:
+    file.write(data)
+  return path
+
+@pytest.fixture
+def player(tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  player = make_player(str(tmp_path))
+  yield player
+  player.shutdown()
@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from audio import AUDIO_BACKEND_ENV, NullBackend, PygameBackend, create_backend
+
+SRC_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+def test_importing_the_player_opens_no_audio_device_and_configures_no_logging():
+  code = "import logging, sys; import player; print('pygame' in sys.modules, bool(logging.getLogger().handlers))"
+  output = subprocess.run([sys.executable, "-c", code], cwd=SRC_DIR, capture_output=True, text=True, check=True)
+  assert output.stdout.split() == ["False", "False"]
+
+def test_the_backend_is_chosen_by_name_or_environment(monkeypatch):
+  monkeypatch.setenv(AUDIO_BACKEND_ENV, "null")
+  assert isinstance(create_backend(), NullBackend)
+  backend = create_backend("pygame")
+  assert isinstance(backend, PygameBackend)
+  assert not backend.initialized  # the mixer opens on first use
+  with pytest.raises(ValueError):
+    create_backend("alsa")
+
+def test_null_backend_plays_queued_tracks_when_one_finishes():
+  backend = NullBackend()
+  backend.load("/a.mp3")
+  backend.play()
+  backend.queue("/b.mp3")
+  assert backend.get_busy()
+  backend.finish()
+  assert backend.loaded == "/b.mp3"
+  assert backend.poll_end_events() == 1
+  backend.finish()
+  assert not backend.get_busy()
+  assert backend.get_pos() == -1
@@ -0,0 +1,207 @@
+"""Hot-path timings at several playlist sizes, run with pytest-benchmark.
+
+The regular suite runs each benchmark once, untimed; pass --benchmark-enable
+to time them, and --playlist-sizes for sizes other than 1000 (see the README).
+"""
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from conftest import make_player, settle
+from control import ControlClient, ControlServer
+from dedup import DUPLICATES_KEEP
+from player import Player
+
+SRC_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+INDEX_SECONDS: float = 60.0
+STARTUP_ROUNDS: int = 3
+
+def pytest_generate_tests(metafunc):
+  if "size" in metafunc.fixturenames:
+    sizes = [int(size) for size in metafunc.config.getoption("playlist_sizes").split(",")]
+    metafunc.parametrize("size", sizes)
+
+def track_paths(size: int) -> list[str]:
+  return [f"/music/artist-{i % 100:03d}/album-{i % 7}/track-{i:06d}.mp3" for i in range(size)]
+
+def require_display() -> None:
+  tkinter = pytest.importorskip("tkinter")
+  try:
+    tkinter.Tk().destroy()
+  except tkinter.TclError as e:
+    pytest.skip(f"needs a display: {e}")
+
+@pytest.fixture
+def loaded(tmp_path, monkeypatch, size):
+  """A player whose playlist holds `size` tracks."""
+  monkeypatch.chdir(tmp_path)
+  player = make_player(str(tmp_path))
+  player.add_files(track_paths(size), DUPLICATES_KEEP)
+  yield player
+  player.shutdown()
+
+def test_save_playlist(benchmark, loaded, size):
+  benchmark.pedantic(loaded.save_playlist, setup=lambda: loaded.move_track(0, size - 1), rounds=20)
+
+def test_load_playlist(benchmark, loaded):
+  loaded.save_playlist()
+  benchmark(loaded.load_playlist)
+
+def test_move_track(benchmark, loaded, size):
+  benchmark(loaded.move_track, 0, size - 1)
+
+def test_shuffle_playlist(benchmark, loaded):
+  benchmark(loaded.toggle_shuffle)
+
+def test_shuffle_next(benchmark, loaded, size):
+  order = loaded.shuffle_order
+  benchmark.pedantic(lambda: order.mark_played(order.peek()), rounds=min(100, size))
+
+def test_switch_playlist(benchmark, loaded, size):
+  """Switch between two playlists of the same size that share their tracks."""
+  first = loaded.playlist_name
+  loaded.create_playlist("benchmark")
+  loaded.add_files(track_paths(size), DUPLICATES_KEEP)
+  loaded.save_playlist()
+  loaded.load_playlist()  # start with only the active playlist in memory
+  benchmark(lambda: loaded.switch_playlist("benchmark" if loaded.playlist_name == first else first))
+
+@pytest.mark.parametrize("query", ["000123", "track"], ids=["one-match", "every-track"])
+def test_search(benchmark, loaded, size, query):
+  """Search after the playlist changed, which must not cost a pass over the playlist."""
+  deadline = time.monotonic() + INDEX_SECONDS
+  while len(loaded.search_index) < size:
+    if time.monotonic() > deadline:
+      raise TimeoutError("search index was not built")
+    time.sleep(0.01)
+  loaded.save_playlist()  # write the new tracks now rather than while timing
+
+  def move_then_search() -> None:
+    loaded.move_track(0, size - 1)
+    loaded.search(query)
+  benchmark(move_then_search)
+
+def test_update_playlist_display(benchmark, loaded):
+  require_display()
+  from tkinterdnd2 import TkinterDnD
+  from gui import MusicPlayerGUI
+  root = TkinterDnD.Tk()
+  try:
+    gui = MusicPlayerGUI(root, loaded)
+
+    def repaint() -> None:
+      loaded.version += 1
+      gui.update_playlist_display()
+      root.update_idletasks()
+    benchmark(repaint)
+  finally:
+    root.destroy()
+
+class RemoteCaller:
+  """A control client on its own thread. Calls run the player's commands on this, the owner, thread, as Tk does in the app."""
+
+  def __init__(self, player: Player, address: str) -> None:
+    self.player = player
+    self._requests: queue.Queue = queue.Queue()
+    self._replies: queue.Queue = queue.Queue()
+    self._thread = threading.Thread(target=self._serve, args=(address,), daemon=True)
+    self._thread.start()
+
+  def _serve(self, address: str) -> None:
+    with ControlClient(address, timeout=None) as client:
+      while (request := self._requests.get()) is not None:
+        name, arguments = request
+        self._replies.put(client.call(name, **arguments))
+        self.player.commands.submit(lambda: None)  # wake the owner to collect the reply
+
+  def call(self, name: str, **arguments) -> object:
+    self._requests.put((name, arguments))
+    while self._replies.empty():
+      self.player.commands.run_pending(timeout=1.0)
+    return self._replies.get()
+
+  def close(self) -> None:
+    self._requests.put(None)
+    self._thread.join()
+
+@pytest.fixture
+def remote(loaded, tmp_path):
+  server = ControlServer(loaded, str(tmp_path / "control.sock"))
+  server.start()
+  caller = RemoteCaller(loaded, server.address)
+  yield caller
+  caller.close()
+  server.close()
+
+def test_control_ping(benchmark, remote):
+  benchmark(remote.call, "ping")
+
+def test_control_add(benchmark, remote, size):
+  """Add every track to a new playlist in one request."""
+  remote.player.create_playlist("remote")
+  benchmark.pedantic(remote.call, args=("add",), kwargs={"paths": track_paths(size), "duplicates": DUPLICATES_KEEP}, rounds=1)
+
+def make_library(directory: str, size: int) -> str:
+  """Create `size` empty .mp3 files spread over nested folders."""
+  library = os.path.join(directory, "library")
+  for index in range(size):
+    folder = os.path.join(library, f"artist-{index % 100:03d}", f"album-{index % 7}")
+    os.makedirs(folder, exist_ok=True)
+    open(os.path.join(folder, f"track-{index:06d}.mp3"), "wb").close()
+  return library
+
+def scan(player: Player, library: str) -> None:
+  """Scan a folder into the playlist, checking for duplicates, until everything is added."""
+  job = player.load_folder(library)
+  while not job.done:
+    for batch in job.drain():
+      player.add_files(batch)
+    player.commands.run_pending(timeout=0.001)
+  for batch in job.drain():
+    player.add_files(batch)
+  settle(player)
+
+@pytest.mark.parametrize("again", [False, True], ids=["new", "all-duplicates"])
+def test_load_folder(benchmark, tmp_path, monkeypatch, size, again):
+  monkeypatch.chdir(tmp_path)
+  library = make_library(str(tmp_path), size)
+  player = make_player(str(tmp_path))
+  try:
+    if again:
+      scan(player, library)
+    benchmark.pedantic(scan, args=(player, library), rounds=1)
+    assert len(player.playlist) == size
+  finally:
+    player.shutdown()
+
+def test_time_to_interactive(benchmark, tmp_path):
+  """From launching the app to its first idle main-loop pass, as main.py reports it."""
+  require_display()
+  env = dict(os.environ, PLAYER_AUDIO_BACKEND="null")
+  launched: list[subprocess.Popen] = []
+
+  def launch() -> None:
+    process = subprocess.Popen(
+      [sys.executable, os.path.join(SRC_DIR, "main.py"), "--exit-when-interactive", "--no-control"],
+      cwd=tmp_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    launched.append(process)
+    for line in process.stderr:
+      if "Time to interactive" in line:
+        return
+    raise RuntimeError("the player exited before it became interactive")
+
+  def finish() -> None:
+    """Wait for earlier launches to exit, outside the timed part."""
+    while launched:
+      process = launched.pop()
+      process.communicate(timeout=30)
+  try:
+    benchmark.pedantic(launch, setup=finish, rounds=STARTUP_ROUNDS)
+  finally:
+    finish()
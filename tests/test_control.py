@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+
+from conftest import write_file
+from control import ControlClient, ControlServer, parse_address
+from dedup import DUPLICATES_KEEP
+
+def test_parse_address():
+  assert parse_address("127.0.0.1:7000") == ("127.0.0.1", 7000)
+  assert parse_address("/tmp/player.sock") == ("/tmp/player.sock", None)
+
+def remote(player, tmp_path, session):
+  """Run `session(client)` on a client thread while this thread owns the player, as the Tk thread does."""
+  server = ControlServer(player, str(tmp_path / "control.sock"))
+  server.start()
+  outcome: list = []
+
+  def run() -> None:
+    try:
+      with ControlClient(server.address, timeout=10) as client:
+        outcome.append((True, session(client)))
+    except Exception as e:
+      outcome.append((False, e))
+  client = threading.Thread(target=run, daemon=True)
+  client.start()
+  try:
+    while client.is_alive():
+      player.commands.run_pending(timeout=0.01)
+  finally:
+    server.close()
+  succeeded, value = outcome[0]
+  if not succeeded:
+    raise value
+  return value
+
+def test_commands_and_replies(player, tmp_path):
+  tracks = [write_file(str(tmp_path / f"{name}.mp3"), name.encode() * 100) for name in "abc"]
+
+  def session(client):
+    assert client.call("ping") == "pong"
+    assert client.call("add", paths=tracks, duplicates=DUPLICATES_KEEP) == 3
+    client.call("play", index=1)
+    status = client.call("status")
+    assert (status["playing"], status["index"], status["path"], status["length"]) == (True, 1, tracks[1], 3)
+    client.call("enqueue", path=tracks[0])
+    client.call("next")
+    assert client.call("status")["path"] == tracks[0]
+    client.call("volume", level=0.25)
+    return client.call("status")
+  status = remote(player, tmp_path, session)
+  assert status["volume"] == pytest.approx(0.25)
+  assert status["queued"] == 0
+
+def test_errors_and_batches(player, tmp_path):
+  def session(client):
+    with pytest.raises(RuntimeError, match="Unknown command"):
+      client.call("dance")
+    with pytest.raises(RuntimeError, match="IndexError"):
+      client.call("play", index=5)
+    with pytest.raises(RuntimeError, match="duplicates must be one of"):
+      client.call("add", paths=[], duplicates="sometimes")
+    return client.batch([{"cmd": "ping"}, {"cmd": "enqueue", "path": "notes.txt"}, {"cmd": "playlists"}])
+  replies = remote(player, tmp_path, session)
+  assert replies[0] == {"ok": True, "result": "pong"}
+  assert not replies[1]["ok"]
+  assert replies[2]["ok"] and replies[2]["result"] == player.playlist_names()
+
+def test_subscribed_events_are_pushed(player, tmp_path):
+  track = write_file(str(tmp_path / "a.mp3"), b"a" * 100)
+  player.add_files([track], DUPLICATES_KEEP)
+
+  def session(client):
+    assert client.call("subscribe", events=["track_change"]) == ["track_change"]
+    client.call("play", index=0)
+    return next(client.listen())
+  event = remote(player, tmp_path, session)
+  assert event == {"event": "track_change", "index": 0, "path": track}
+
+def test_malformed_batches_get_an_error_reply(player, tmp_path):
+  def session(client):
+    replies = [client._request({"batch": 5}), client._request({"batch": [1]}), client._request({"batch": [{"cmd": "ping"}, "ping"]})]
+    return replies, client.call("ping")
+  replies, pong = remote(player, tmp_path, session)
+  assert all(not reply["ok"] and "batch must be a list" in reply["error"] for reply in replies)
+  assert pong == "pong"
+
+def test_a_failing_request_does_not_drop_the_connection(player, tmp_path, monkeypatch):
+  handle = ControlServer._handle
+
+  def fail_once(self, connection, request):
+    monkeypatch.setattr(ControlServer, "_handle", handle)
+    raise RuntimeError("handler bug")
+  monkeypatch.setattr(ControlServer, "_handle", fail_once)
+
+  def session(client):
+    return client._request({"cmd": "ping"}), client.call("ping")
+  reply, pong = remote(player, tmp_path, session)
+  assert reply == {"ok": False, "error": "handler bug", "id": 1}
+  assert pong == "pong"
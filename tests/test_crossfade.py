@@ -0,0 +1,66 @@
+import time
+
+import numpy as np
+
+import crossfade
+from audio import NullBackend
+from crossfade import Crossfade, CrossfadeEngine
+from state import CommandQueue
+
+WAIT_SECONDS: float = 10.0
+
+def transition(seconds: float = 0.05) -> Crossfade:
+  return Crossfade(
+    track_id=2, outgoing="/a.mp3", outgoing_duration=1.0, incoming_source="/b.mp3",
+    seconds=seconds, outgoing_volume=1.0, incoming_volume=1.0
+  )
+
+def silence(source, start: float, seconds: float, sample_rate: int, channels: int) -> np.ndarray:
+  return np.zeros((int(seconds * sample_rate), channels), dtype=np.float32)
+
+def wait_for(condition) -> None:
+  deadline = time.monotonic() + WAIT_SECONDS
+  while not condition():
+    assert time.monotonic() < deadline
+    time.sleep(0.005)
+
+def wait_until_finished(engine: CrossfadeEngine) -> Crossfade:
+  deadline = time.monotonic() + WAIT_SECONDS
+  while (finished := engine.collect()[1]) is None:
+    assert time.monotonic() < deadline
+    time.sleep(0.005)
+  return finished
+
+def test_the_overlap_runs_without_waiting_for_the_owner_thread(monkeypatch):
+  monkeypatch.setattr(crossfade, "decode_window", silence)
+  audio = NullBackend()
+  audio.load("/a.mp3")
+  audio.play()
+  commands = CommandQueue()  # owned by this thread, which never runs it until the end
+  engine = CrossfadeEngine(audio, lambda: 1.0, commands, lambda source: source)
+  engine.schedule(transition())
+  assert wait_until_finished(engine).track_id == 2
+  assert audio.loaded == "/b.mp3" and audio.get_busy()
+  assert audio.buffers == []
+  assert commands.run_pending() == 2  # one state update for the start of the overlap, one for its end
+
+def test_a_transition_that_cannot_be_decoded_is_forgotten(monkeypatch):
+  def broken(*args) -> None:
+    raise OSError("ffmpeg not found")
+  monkeypatch.setattr(crossfade, "decode_window", broken)
+  engine = CrossfadeEngine(NullBackend(), lambda: 0.0, CommandQueue(), lambda source: source)
+  engine.schedule(transition())
+  wait_for(lambda: engine.scheduled is None)
+  assert not engine.busy
+
+def test_cancelling_keeps_the_outgoing_track(monkeypatch):
+  monkeypatch.setattr(crossfade, "decode_window", silence)
+  audio = NullBackend()
+  audio.load("/a.mp3")
+  audio.play()
+  engine = CrossfadeEngine(audio, lambda: 0.0, CommandQueue(), lambda source: source)  # far from the fade point
+  engine.schedule(transition())
+  engine.cancel()
+  time.sleep(0.05)
+  assert audio.loaded == "/a.mp3" and audio.get_busy()
+  assert engine.collect() == (False, None)
@@ -0,0 +1,124 @@
+import os
+import threading
+
+import pytest
+
+from conftest import write_file
+from dedup import PARTIAL_BLOCK, DuplicateFinder, ImportCheck
+from metadata import MetadataCache
+
+TRACK_BYTES: int = 12 * PARTIAL_BLOCK
+
+def track(seed: int, size: int = TRACK_BYTES) -> bytes:
+  return bytes((seed + index * 7) % 251 for index in range(size))
+
+@pytest.fixture
+def finder(tmp_path):
+  metadata = MetadataCache(str(tmp_path / "metadata.db"))
+  finder = DuplicateFinder(metadata, str(tmp_path / "hashes.db"), max_workers=1)
+  yield finder
+  finder.close()
+  metadata.close()
+
+def check(finder: DuplicateFinder, paths: list[str], snapshot=None, applied: int = 0) -> ImportCheck:
+  done = threading.Event()
+  reports: list[ImportCheck] = []
+  finder.check(paths, lambda report: (reports.append(report), done.set()), snapshot, applied)
+  assert done.wait(30)
+  return reports[0]
+
+def test_paths_already_present_are_dropped_without_reading_them(finder, tmp_path):
+  present = str(tmp_path / "missing.mp3")
+  report = check(finder, [present], snapshot=[present])
+  assert report.duplicates == [(present, present)]
+  assert report.added == []
+
+def test_different_sizes_are_added_without_hashing(finder, tmp_path):
+  original = write_file(str(tmp_path / "a.mp3"), track(1))
+  other = write_file(str(tmp_path / "b.mp3"), track(1, TRACK_BYTES + 1))
+  report = check(finder, [other], snapshot=[original])
+  assert report.added == [other]
+  assert finder.hashes.peek(other) is None
+
+def test_same_size_with_different_blocks_is_added_without_a_content_hash(finder, tmp_path):
+  original = write_file(str(tmp_path / "a.mp3"), track(1))
+  other = write_file(str(tmp_path / "b.mp3"), track(2))
+  report = check(finder, [other], snapshot=[original])
+  assert report.added == [other]
+  assert finder.hashes.peek(other).partial is not None
+  assert finder.hashes.peek(other).content is None
+
+def test_equal_blocks_with_different_contents_are_added(finder, tmp_path):
+  data = bytearray(track(1))
+  original = write_file(str(tmp_path / "a.mp3"), bytes(data))
+  data[2 * PARTIAL_BLOCK] ^= 0xFF  # between the hashed start and middle blocks
+  other = write_file(str(tmp_path / "b.mp3"), bytes(data))
+  report = check(finder, [other], snapshot=[original])
+  assert report.added == [other]
+  assert finder.hashes.peek(other).content != finder.hashes.peek(original).content
+
+def test_copies_are_reported_as_duplicates(finder, tmp_path):
+  original = write_file(str(tmp_path / "a.mp3"), track(1))
+  copy = write_file(str(tmp_path / "copy" / "a.mp3"), track(1))
+  report = check(finder, [copy], snapshot=[original])
+  assert report.duplicates == [(copy, original)]
+  assert report.added == []
+
+def test_copies_within_a_batch_keep_the_first(finder, tmp_path):
+  first = write_file(str(tmp_path / "a.mp3"), track(3))
+  second = write_file(str(tmp_path / "b.mp3"), track(3))
+  third = write_file(str(tmp_path / "c.mp3"), track(3))
+  report = check(finder, [first, second, third], snapshot=[])
+  assert report.added == [first]
+  assert report.duplicates == [(second, first), (third, first)]
+
+def test_empty_and_missing_files_are_added(finder, tmp_path):
+  empty = write_file(str(tmp_path / "empty.mp3"), b"")
+  other_empty = write_file(str(tmp_path / "empty2.mp3"), b"")
+  missing = str(tmp_path / "missing.mp3")
+  report = check(finder, [empty, other_empty, missing], snapshot=[])
+  assert report.added == [empty, other_empty, missing]
+
+def test_later_checks_see_earlier_imports(finder, tmp_path):
+  original = write_file(str(tmp_path / "a.mp3"), track(4))
+  copy = write_file(str(tmp_path / "b.mp3"), track(4))
+  first = check(finder, [original], snapshot=[])
+  second = check(finder, [copy])
+  assert first.added == [original]
+  assert second.duplicates == [(copy, original)]
+
+def test_a_rebuild_forgets_removed_tracks(finder, tmp_path):
+  original = write_file(str(tmp_path / "a.mp3"), track(5))
+  copy = write_file(str(tmp_path / "b.mp3"), track(5))
+  first = check(finder, [original], snapshot=[])
+  report = check(finder, [copy], snapshot=[], applied=first.sequence)
+  assert report.added == [copy]
+
+def test_hashes_are_reused_across_sessions(finder, tmp_path):
+  original = write_file(str(tmp_path / "a.mp3"), track(6))
+  copy = write_file(str(tmp_path / "b.mp3"), track(6))
+  check(finder, [copy], snapshot=[original])
+  reopened = DuplicateFinder(finder.metadata, str(tmp_path / "hashes.db"), max_workers=1)
+  try:
+    assert reopened.hashes.peek(copy) == finder.hashes.peek(copy)
+    assert reopened.hashes.peek(copy).content is not None
+    assert check(reopened, [copy], snapshot=[original]).duplicates == [(copy, original)]
+    assert reopened._pool is None  # nothing needed hashing again
+  finally:
+    reopened.close()
+
+def test_a_changed_file_is_hashed_again(finder, tmp_path):
+  original = write_file(str(tmp_path / "a.mp3"), track(7))
+  copy = write_file(str(tmp_path / "b.mp3"), track(7))
+  check(finder, [copy], snapshot=[original])
+  write_file(copy, track(8))
+  os.utime(copy, ns=(1, 1))
+  assert check(finder, [copy], snapshot=[original]).added == [copy]
+
+def test_a_failed_check_adds_the_files_unchecked(finder, tmp_path):
+  def broken():
+    raise OSError("snapshot unavailable")
+    yield
+  paths = [str(tmp_path / "a.mp3"), str(tmp_path / "a.mp3"), str(tmp_path / "b.mp3")]
+  report = check(finder, paths, snapshot=broken())
+  assert report.added == [paths[0], paths[2]]
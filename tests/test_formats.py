@@ -0,0 +1,30 @@
+import os
+import time
+
+import formats
+from conftest import write_file
+from formats import TranscodeCache
+
+def fake_transcode(source: str, target: str) -> str:
+  return write_file(target, b"x" * 1000)
+
+def transcode_all(cache: TranscodeCache, paths: list[str]) -> None:
+  for path in paths:
+    cache.request(path)
+    deadline = time.monotonic() + 10
+    while cache.cached(path) is None or cache._futures:
+      assert time.monotonic() < deadline
+      time.sleep(0.005)
+
+def test_finished_transcodes_evict_the_least_recently_played(tmp_path, monkeypatch):
+  monkeypatch.setattr(formats, "transcode", fake_transcode)
+  monkeypatch.setattr(formats.shutil, "which", lambda name: f"/usr/bin/{name}")
+  sources = [write_file(str(tmp_path / f"{name}.wma"), name.encode()) for name in "abc"]
+  cache = TranscodeCache(str(tmp_path / "transcode_cache"), budget_bytes=2500)
+  transcode_all(cache, sources[:2])
+  for index, source in enumerate(sources[:2]):
+    os.utime(cache.target_for(source), ns=(index, index))
+  assert cache.fetch(sources[0]) is not None  # played again, so now the most recent
+  transcode_all(cache, sources[2:])
+  assert [cache.cached(source) is not None for source in sources] == [True, False, True]
+  cache.close()
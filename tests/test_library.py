@@ -0,0 +1,108 @@
+import json
+import os
+import sqlite3
+
+from library import DEFAULT_PLAYLIST, LibraryStore
+
+def write_legacy(directory: str, paths: list[str], journal: list[dict] = ()) -> str:
+  legacy = os.path.join(directory, "playlist.json")
+  with open(legacy, "w") as file:
+    json.dump({"music_files": paths}, file)
+  if journal:
+    with open(f"{legacy}.journal", "w") as file:
+      file.writelines(json.dumps(op) + "\n" for op in journal)
+  return legacy
+
+def test_legacy_playlist_is_migrated_with_its_journal(tmp_path):
+  legacy = write_legacy(str(tmp_path), ["/a.mp3", "/b.mp3", "/c.mp3"], [
+    {"op": "move", "old": 0, "new": 2},
+    {"op": "add", "paths": ["/d.mp3"]},
+    {"op": "remove", "index": 0},
+  ])
+  store = LibraryStore(str(tmp_path / "library.db"), legacy_path=legacy)
+  playlist = store.load()
+  assert store.names == [DEFAULT_PLAYLIST]
+  assert list(playlist) == ["/c.mp3", "/a.mp3", "/d.mp3"]
+  store.close()
+  reopened = LibraryStore(str(tmp_path / "library.db"), legacy_path=legacy)
+  assert list(reopened.load()) == ["/c.mp3", "/a.mp3", "/d.mp3"]
+  reopened.close()
+
+def test_migration_runs_once(tmp_path):
+  legacy = write_legacy(str(tmp_path), ["/a.mp3"])
+  store = LibraryStore(str(tmp_path / "library.db"), legacy_path=legacy)
+  store.apply(store.load(), {"op": "remove", "index": 0})
+  store.close()
+  write_legacy(str(tmp_path), ["/a.mp3", "/b.mp3"])
+  reopened = LibraryStore(str(tmp_path / "library.db"), legacy_path=legacy)
+  assert list(reopened.load()) == []
+  reopened.close()
+
+def test_bad_journal_entries_stop_the_replay(tmp_path):
+  legacy = write_legacy(str(tmp_path), ["/a.mp3", "/b.mp3"], [
+    {"op": "remove", "index": 0},
+    {"op": "remove", "index": 9},
+    {"op": "add", "paths": ["/c.mp3"]},
+  ])
+  store = LibraryStore(str(tmp_path / "library.db"), legacy_path=legacy)
+  assert list(store.load()) == ["/b.mp3"]
+  store.close()
+
+def test_without_a_legacy_file_the_library_starts_empty(tmp_path):
+  store = LibraryStore(str(tmp_path / "library.db"), legacy_path=str(tmp_path / "missing.json"))
+  assert list(store.load()) == []
+  assert store.names == [DEFAULT_PLAYLIST]
+  store.close()
+
+def test_playlists_share_renamed_tracks(tmp_path):
+  store = LibraryStore(str(tmp_path / "library.db"))
+  library = store.load()
+  store.apply(library, {"op": "add", "paths": ["/a.mp3", "/b.mp3"]})
+  store.create("mix")
+  mix = store.open("mix")
+  store.apply(mix, {"op": "add", "paths": ["/b.mp3"]})
+  store.apply(library, {"op": "rename", "old": "/b.mp3", "new": "/renamed.mp3"})
+  store.close()
+  reopened = LibraryStore(str(tmp_path / "library.db"))
+  reopened.load()
+  assert list(reopened.open(DEFAULT_PLAYLIST)) == ["/a.mp3", "/renamed.mp3"]
+  assert list(reopened.open("mix")) == ["/renamed.mp3"]
+  reopened.close()
+
+def test_a_failed_write_is_retried(tmp_path, monkeypatch):
+  store = LibraryStore(str(tmp_path / "library.db"), debounce=60)
+  library = store.load()
+  store.apply(library, {"op": "add", "paths": ["/a.mp3", "/b.mp3", "/c.mp3"]})
+  store.flush()
+  store.apply(library, {"op": "add", "paths": ["/d.mp3"]})
+  store.apply(library, {"op": "rename", "old": "/a.mp3", "new": "/renamed.mp3"})
+  store.apply(library, {"op": "discard", "paths": ["/b.mp3"]})
+  store.apply(library, {"op": "move", "old": 0, "new": 2})
+  connect = store._connect
+
+  def broken():
+    monkeypatch.setattr(store, "_connect", connect)
+    raise sqlite3.OperationalError("database is locked")
+  monkeypatch.setattr(store, "_connect", broken)
+  store.flush()
+  assert store._timer is not None  # the retry is scheduled
+  store.close()
+  reopened = LibraryStore(str(tmp_path / "library.db"))
+  assert list(reopened.load()) == ["/c.mp3", "/d.mp3", "/renamed.mp3"]
+  assert reopened.tracks.id_of("/b.mp3") is None
+  reopened.close()
+
+def test_renames_and_adds_by_name_reach_playlists_that_are_not_active(tmp_path):
+  store = LibraryStore(str(tmp_path / "library.db"))
+  library = store.load()
+  store.apply(library, {"op": "add", "paths": ["/a.mp3", "/b.mp3"]})
+  store.create("mix")
+  store.apply_to("mix", {"op": "add", "paths": ["/a.mp3", "/c.mp3"]})
+  assert store.active == DEFAULT_PLAYLIST
+  store.apply(library, {"op": "rename", "old": "/a.mp3", "new": "/b.mp3"})  # moved over an existing track
+  store.close()
+  reopened = LibraryStore(str(tmp_path / "library.db"))
+  reopened.load()
+  assert list(reopened.open(DEFAULT_PLAYLIST)) == ["/b.mp3", "/b.mp3"]
+  assert list(reopened.open("mix")) == ["/b.mp3", "/c.mp3"]
+  reopened.close()
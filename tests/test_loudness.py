@@ -0,0 +1,50 @@
+import io
+import struct
+
+import numpy as np
+import pytest
+
+from loudness import K_WEIGHTING, SAMPLE_RATE, SUB_BLOCK, _Biquad, measure_loudness
+
+def direct_form(samples: np.ndarray, b: tuple[float, ...], a: tuple[float, ...]) -> np.ndarray:
+  """A biquad one sample at a time, as BS.1770 describes it."""
+  output = np.zeros_like(samples)
+  x1 = x2 = y1 = y2 = np.zeros(samples.shape[1])
+  for n, x in enumerate(samples):
+    y = b[0] * x + b[1] * x1 + b[2] * x2 - a[1] * y1 - a[2] * y2
+    output[n] = y
+    x1, x2, y1, y2 = x, x1, y, y1
+  return output
+
+def wav_stream(samples: np.ndarray) -> io.BytesIO:
+  """A 32-bit float WAV as ffmpeg streams it, with an unknown data size."""
+  channels = samples.shape[1]
+  fmt = struct.pack("<HHIIHH", 3, channels, SAMPLE_RATE, SAMPLE_RATE * channels * 4, channels * 4, 32)
+  header = b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+  header += b"LIST" + struct.pack("<I", 4) + b"INFO" + b"data" + struct.pack("<I", 0xFFFFFFFF)
+  return io.BytesIO(header + samples.astype("<f4").tobytes())
+
+def test_k_weighting_matches_the_direct_form_filter_across_calls():
+  samples = np.random.default_rng(0).standard_normal((7 * SUB_BLOCK, 2))
+  expected = samples
+  for b, a in K_WEIGHTING:
+    expected = direct_form(expected, b, a)
+  stages = [_Biquad(b, a, 2) for b, a in K_WEIGHTING]
+  filtered = []
+  for part in (samples[:3 * SUB_BLOCK], samples[3 * SUB_BLOCK:]):
+    blocks = part.reshape(-1, SUB_BLOCK, 2)
+    for stage in stages:
+      blocks = stage(blocks)
+    filtered.append(blocks.reshape(-1, 2))
+  assert np.allclose(np.concatenate(filtered), expected, atol=1e-8)
+
+@pytest.mark.parametrize("channels, expected", [(1, -3.01), (2, 0.0)])
+def test_a_full_scale_1khz_sine_reads_as_bs1770_specifies(channels, expected):
+  """A 0 dBFS 997 Hz sine measures -3.01 LUFS per channel; mono is not counted twice."""
+  sine = np.sin(2 * np.pi * 997 * np.arange(5 * SAMPLE_RATE) / SAMPLE_RATE)
+  loudness, peak = measure_loudness(wav_stream(np.repeat(sine[:, None], channels, axis=1)))
+  assert loudness == pytest.approx(expected, abs=0.05)
+  assert peak == pytest.approx(1.0, abs=1e-3)
+
+def test_a_stream_that_is_not_wav_is_not_measured():
+  assert measure_loudness(io.BytesIO(b"not a wav file")) is None
@@ -0,0 +1,157 @@
+import time
+
+from conftest import settle, write_file
+from dedup import DUPLICATES_KEEP, DUPLICATES_MERGE
+from instrumentation import metrics
+from metadata import TrackMetadata
+
+def queued_paths(player) -> list[str]:
+  return [player.playlist.path_of(track_id) for track_id in player.play_next]
+
+def test_duplicates_are_skipped_on_import(player, tmp_path):
+  original = write_file(str(tmp_path / "a.mp3"), b"same audio" * 100)
+  copy = write_file(str(tmp_path / "copy" / "a.mp3"), b"same audio" * 100)
+  other = write_file(str(tmp_path / "b.mp3"), b"other audio" * 100)
+  assert player.add_files([original, copy, other, str(tmp_path / "notes.txt")]) == 3
+  settle(player)
+  assert list(player.playlist) == [original, other]
+  player.add_files([original, copy])
+  settle(player)
+  assert list(player.playlist) == [original, other]
+
+def test_keep_adds_duplicates_at_once(player, tmp_path):
+  original = write_file(str(tmp_path / "a.mp3"), b"same audio" * 100)
+  player.add_files([original, original], DUPLICATES_KEEP)
+  assert list(player.playlist) == [original, original]
+
+def test_merge_moves_entries_to_the_better_tagged_copy(player, tmp_path):
+  original = write_file(str(tmp_path / "a.mp3"), b"same audio" * 100)
+  copy = write_file(str(tmp_path / "tagged" / "a.mp3"), b"same audio" * 100)
+  player.add_files([original], DUPLICATES_KEEP)
+  player.metadata.put(TrackMetadata(copy, 0, 1000, title="Song", artist="Artist"))
+  player.add_files([copy], DUPLICATES_MERGE)
+  settle(player)
+  assert list(player.playlist) == [copy]
+
+def test_enqueue_by_path_queues_a_new_file_once_it_is_added(player, tmp_path):
+  existing = write_file(str(tmp_path / "a.mp3"), b"first" * 100)
+  new = write_file(str(tmp_path / "b.mp3"), b"second" * 100)
+  player.add_files([existing], DUPLICATES_KEEP)
+  assert player.queue_file(new)
+  settle(player)
+  assert list(player.playlist) == [existing, new]
+  assert queued_paths(player) == [new]
+
+def test_enqueue_by_path_queues_the_original_of_a_duplicate(player, tmp_path):
+  original = write_file(str(tmp_path / "a.mp3"), b"same audio" * 100)
+  copy = write_file(str(tmp_path / "copy" / "a.mp3"), b"same audio" * 100)
+  player.add_files([original], DUPLICATES_KEEP)
+  assert player.queue_file(copy)
+  settle(player)
+  assert list(player.playlist) == [original]
+  assert queued_paths(player) == [original]
+
+def test_enqueue_by_path_of_a_track_in_the_playlist(player, tmp_path):
+  tracks = [write_file(str(tmp_path / f"{name}.mp3"), name.encode() * 100) for name in "abc"]
+  player.add_files(tracks, DUPLICATES_KEEP)
+  assert player.queue_file(tracks[2])
+  assert player.queue_file(tracks[1])
+  assert queued_paths(player) == [tracks[2], tracks[1]]
+  assert player.queue_position(1) == 2
+
+def test_enqueue_rejects_files_that_are_not_audio(player, tmp_path):
+  assert not player.queue_file(str(tmp_path / "notes.txt"))
+  settle(player)
+  assert list(player.play_next) == []
+
+def test_queued_tracks_play_next(player, tmp_path):
+  tracks = [write_file(str(tmp_path / f"{name}.mp3"), name.encode() * 100) for name in "abcd"]
+  player.add_files(tracks, DUPLICATES_KEEP)
+  player.play_music(0)
+  player.queue_next(3)
+  player.skip()
+  assert player.current_track_path == tracks[3]
+  player.skip()
+  assert player.current_track_path == tracks[1]
+
+def test_the_current_track_follows_moves(player, tmp_path):
+  tracks = [write_file(str(tmp_path / f"{name}.mp3"), name.encode() * 100) for name in "abc"]
+  player.add_files(tracks, DUPLICATES_KEEP)
+  player.play_music(1)
+  player.move_track(1, 0)
+  assert player.current_track_index == 0
+  player.remove_track(2)
+  assert player.current_track_path == tracks[1]
+
+def test_search_results_follow_playlist_changes(player, tmp_path):
+  tracks = [write_file(str(tmp_path / f"{name}.mp3"), name.encode() * 100) for name in ("apple", "banana", "apricot")]
+  player.add_files(tracks + [tracks[0]], DUPLICATES_KEEP)
+  settle(player)
+  assert player.search("ap") == [0, 2, 3]
+  player.move_track(0, 1)
+  assert player.search("ap") == [1, 2, 3]
+  player.remove_track(3)
+  assert player.search("apple") == [1]
+  player.update_and_save_playlist({"op": "rename", "old": tracks[2], "new": str(tmp_path / "cherry.mp3")})
+  assert player.search("ap") == [1]
+  assert player.search("cherry") == [2]
+  assert player.search("") is None
+
+def test_the_playlist_survives_a_restart(tmp_path, monkeypatch):
+  from conftest import make_player
+  monkeypatch.chdir(tmp_path)
+  tracks = [write_file(str(tmp_path / f"{name}.mp3"), name.encode() * 100) for name in "abc"]
+  player = make_player(str(tmp_path))
+  player.add_files(tracks, DUPLICATES_KEEP)
+  player.move_track(2, 0)
+  player.shutdown()
+  restarted = make_player(str(tmp_path))
+  try:
+    assert list(restarted.playlist) == [tracks[2], tracks[0], tracks[1]]
+  finally:
+    restarted.shutdown()
+
+def test_a_gapless_switch_records_how_late_the_queued_track_started(player, tmp_path):
+  tracks = [write_file(str(tmp_path / f"{name}.mp3"), name.encode() * 100) for name in "ab"]
+  player.add_files(tracks, DUPLICATES_KEEP)
+  player.metadata.put(TrackMetadata(tracks[0], 0, 100, duration=0.05))
+  player.play_music(0)
+  deadline = time.monotonic() + 10
+  while player.audio.queued is None and time.monotonic() < deadline:
+    time.sleep(0.01)
+    player.pump_events()  # arms the queue once the next track is read ahead
+  time.sleep(0.25)  # the first track should have run out at least 200 ms ago
+  player.audio.finish()
+  player.pump_events()
+  assert player.current_track_path == tracks[1]
+  assert 190 <= player.gap_stats()["last"] < 5000
+
+def test_watched_folders_add_new_files_to_their_own_playlist(player, tmp_path):
+  from watch import LibraryDelta
+  folder = tmp_path / "watched"
+  kept = write_file(str(folder / "kept.mp3"), b"kept" * 100)
+  player.add_files([kept], DUPLICATES_KEEP)
+  player.load_folder(str(folder), watch=True)
+  deadline = time.monotonic() + 10
+  while player.watcher.owner_of(kept) is None and time.monotonic() < deadline:
+    time.sleep(0.01)
+  first = player.playlist_name
+  player.create_playlist("other")
+  player.switch_playlist("other")
+  new = write_file(str(folder / "new.mp3"), b"new" * 100)
+  player.watcher.deltas.put(LibraryDelta(added=[new], removed=[kept]))
+  assert player.apply_library_changes()
+  assert list(player.playlist) == []
+  player.switch_playlist(first)
+  assert list(player.playlist) == [new]
+
+def test_a_folder_scan_is_timed_when_it_finishes(player, tmp_path):
+  write_file(str(tmp_path / "library" / "a.mp3"), b"a" * 100)
+  before = metrics.histograms["scanner.scan"].count if "scanner.scan" in metrics.histograms else 0
+  job = player.load_folder(str(tmp_path / "library"))
+  deadline = time.monotonic() + 10
+  while not job.done:
+    assert time.monotonic() < deadline
+    list(job.drain())
+    time.sleep(0.01)
+  assert metrics.histograms["scanner.scan"].count == before + 1
@@ -0,0 +1,125 @@
+import random
+from array import array
+
+import pytest
+
+from playlist import BLOCK_SIZE, Playlist, TrackTable
+
+def paths(count: int) -> list[str]:
+  return [f"/music/track-{index:05d}.mp3" for index in range(count)]
+
+def test_reads_like_a_list_of_paths():
+  playlist = Playlist(paths(3))
+  assert len(playlist) == 3
+  assert list(playlist) == paths(3)
+  assert playlist[-1] == paths(3)[2]
+  with pytest.raises(IndexError):
+    playlist[3]
+
+def test_move_keeps_ids():
+  playlist = Playlist(paths(5))
+  ids = playlist.ids()
+  playlist.move(0, 4)
+  assert list(playlist) == paths(5)[1:] + paths(5)[:1]
+  assert playlist.index_of(ids[0]) == 4
+  assert playlist.id_at(4) == ids[0]
+  assert all(playlist.path_of(track_id) == path for track_id, path in zip(ids, paths(5)))
+
+def test_remove_keeps_the_other_ids():
+  playlist = Playlist(paths(5))
+  ids = playlist.ids()
+  assert playlist.pop(1) == paths(5)[1]
+  assert playlist.index_of(ids[1]) is None
+  assert not playlist.contains_id(ids[1])
+  assert [playlist.index_of(track_id) for track_id in ids[2:]] == [1, 2, 3]
+
+def test_ids_are_never_reused():
+  playlist = Playlist(paths(3))
+  removed = playlist.id_at(2)
+  playlist.pop(2)
+  added = playlist.append("/music/new.mp3")
+  assert added != removed
+  assert playlist.index_of(removed) is None
+
+def test_random_edits_match_a_list_across_blocks():
+  generator = random.Random(7)
+  expected = paths(3 * BLOCK_SIZE)
+  playlist = Playlist(expected)
+  entries = dict(zip(playlist.ids(), expected))
+  for step in range(2000):
+    kind = generator.random()
+    if kind < 0.4:
+      old, new = generator.randrange(len(expected)), generator.randrange(len(expected))
+      expected.insert(new, expected.pop(old))
+      playlist.move(old, new)
+    elif kind < 0.7:
+      index = generator.randrange(len(expected))
+      del expected[index]
+      playlist.pop(index)
+    else:
+      index = generator.randrange(len(expected) + 1)
+      path = f"/music/added-{step}.mp3"
+      expected.insert(index, path)
+      entries[playlist.insert(index, path)] = path
+  assert list(playlist) == expected
+  for index, track_id in enumerate(playlist.ids()):
+    assert playlist.index_of(track_id) == index
+    assert playlist.path_of(track_id) == entries[track_id]
+
+def test_duplicates_share_a_track():
+  playlist = Playlist(["/a.mp3", "/b.mp3", "/a.mp3"])
+  assert len(playlist.tracks) == 2
+  assert playlist.find("/a.mp3") == 0
+  assert playlist.discard(["/a.mp3"]) == 2
+  assert list(playlist) == ["/b.mp3"]
+
+def test_rename_keeps_positions_and_ids():
+  playlist = Playlist(["/a.mp3", "/b.mp3", "/a.mp3"])
+  ids = playlist.ids()
+  assert playlist.rename("/a.mp3", "/c.mp3") == 2
+  assert list(playlist) == ["/c.mp3", "/b.mp3", "/c.mp3"]
+  assert playlist.ids() == ids
+
+def test_copy_is_independent():
+  playlist = Playlist(paths(4))
+  copy = playlist.copy()
+  playlist.move(0, 3)
+  playlist.pop(0)
+  assert list(copy) == paths(4)
+
+@pytest.mark.parametrize("loaded", [False, True], ids=["built", "from-track-ids"])
+def test_a_copy_finds_tracks_by_id(loaded):
+  count = 2 * BLOCK_SIZE + 10
+  if loaded:
+    playlist = Playlist.from_track_ids(array("q", range(1, count + 1)), TrackTable(enumerate(paths(count), 1)))
+  else:
+    playlist = Playlist(paths(count))
+  moved = playlist.id_at(BLOCK_SIZE + 5)
+  playlist.move(BLOCK_SIZE + 5, 0)
+  copy = playlist.copy()
+  assert copy.index_of(moved) == 0
+  assert copy.index_of(playlist.id_at(count - 1)) == count - 1
+  assert copy.contains_id(playlist.id_at(BLOCK_SIZE))
+  copy.move(0, count - 1)
+  assert copy.index_of(moved) == count - 1
+  assert playlist.index_of(moved) == 0
+
+def test_from_track_ids_then_edit():
+  tracks = TrackTable(enumerate(paths(BLOCK_SIZE + 10), 1))
+  playlist = Playlist.from_track_ids(array("q", range(1, BLOCK_SIZE + 11)), tracks)
+  assert list(playlist) == paths(BLOCK_SIZE + 10)
+  moved = playlist.id_at(BLOCK_SIZE + 5)
+  playlist.move(BLOCK_SIZE + 5, 0)
+  assert playlist.index_of(moved) == 0
+  assert playlist[0] == paths(BLOCK_SIZE + 10)[BLOCK_SIZE + 5]
+  assert list(playlist.track_ids())[0] == BLOCK_SIZE + 6
+
+def test_positions_of_follows_moves_and_removals():
+  playlist = Playlist(paths(3 * BLOCK_SIZE) + paths(1))
+  tracks = playlist.tracks
+  first, last = tracks.id_of(paths(1)[0]), tracks.id_of(paths(3 * BLOCK_SIZE)[-1])
+  assert playlist.positions_of({first, last}) == [0, 3 * BLOCK_SIZE - 1, 3 * BLOCK_SIZE]
+  playlist.move(3 * BLOCK_SIZE - 1, 1)
+  playlist.pop(0)
+  assert playlist.positions_of({first, last}) == [0, 3 * BLOCK_SIZE - 1]
+  assert playlist.positions_of(set()) == []
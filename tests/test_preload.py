@@ -0,0 +1,29 @@
+from conftest import write_file
+from preload import BufferedTrack, TrackCache, TrackReader
+
+def test_a_reader_reads_bytes_not_read_ahead_yet_from_the_file(tmp_path):
+  data = bytes(range(256)) * 8
+  path = str(tmp_path / "a.mp3")
+  write_file(path, data)
+  track = BufferedTrack(path, len(data))
+  track.buffer[:100] = data[:100]
+  track.filled = 100  # the read-ahead has only the first 100 bytes and never finishes
+  released = []
+  reader = TrackReader(track, released.append)
+  assert reader.read(300) == data[:300]
+  reader.seek(1000)
+  assert reader.read(24) == data[1000:1024]
+  reader.close()
+  assert released == [track]
+
+def test_an_evicted_track_counts_against_the_budget_until_its_reader_closes(tmp_path):
+  playing, upcoming = (write_file(str(tmp_path / name), b"x" * 1000) for name in ("a.mp3", "b.mp3"))
+  cache = TrackCache(budget_bytes=1500)
+  reader = cache.open(playing)
+  cache.prefetch(upcoming)  # evicts the track that is still playing
+  assert cache.stats()["tracks"] == 1
+  assert cache.stats()["cached_bytes"] == 2000
+  assert reader.read() == b"x" * 1000
+  reader.close()
+  assert cache.stats()["cached_bytes"] == 1000
+  cache.close()
@@ -0,0 +1,51 @@
+from metadata import TrackMetadata
+from search import SearchIndex, tokenize
+
+def test_tokenize_lowercases_words():
+  assert tokenize("Hello, World-2!") == ["hello", "world", "2"]
+
+def test_prefix_and_substring_queries():
+  index = SearchIndex()
+  index.add_many([(1, "/m/Daft Punk - One More Time.mp3", None), (2, "/m/Moonlight Sonata.flac", None)])
+  assert index.search("one") == {1}
+  assert index.search("ONLIG") == {2}
+  assert index.search("mo") == {1, 2}
+  assert index.search("daft sonata") == set()
+  assert index.search(" ") is None
+
+def test_tags_are_searchable_and_updated():
+  index = SearchIndex()
+  index.add(1, "/m/01.mp3", TrackMetadata("/m/01.mp3", 0, 1, title="Intro", artist="Boards of Canada"))
+  assert index.search("canada") == {1}
+  index.update(TrackMetadata("/m/01.mp3", 0, 1, title="Intro", artist="Aphex Twin"))
+  assert index.search("canada") == set()
+  assert index.search("aphex intro") == {1}
+
+def test_duplicates_are_reference_counted():
+  index = SearchIndex()
+  index.add(1, "/m/song.mp3")
+  index.add(1, "/m/song.mp3")
+  index.remove(1)
+  assert index.search("song") == {1}
+  index.remove(1)
+  assert index.search("song") == set()
+  assert len(index) == 0
+
+def test_removing_the_last_track_drops_its_vocabulary():
+  index = SearchIndex()
+  index.add(1, "/m/unique.mp3")
+  index.add(2, "/m/other.mp3")
+  index.remove(1)
+  assert index.search("niq") == set()
+  assert index.search("uni") == set()
+  assert index.search("other") == {2}
+
+def test_a_renamed_track_is_found_by_its_new_path():
+  index = SearchIndex()
+  index.add(1, "/m/old.mp3")
+  index.remove(1)
+  index.add(1, "/m/new.mp3")
+  assert index.search("old") == set()
+  assert index.search("new") == {1}
+  index.update(TrackMetadata("/m/new.mp3", 0, 1, title="Tagged"))
+  assert index.search("tagged") == {1}
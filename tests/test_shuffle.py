@@ -0,0 +1,72 @@
+from typing import Optional
+
+from playlist import Playlist
+from shuffle import SPREAD_DISTANCE, ShuffleOrder
+
+def no_artist(track_id: int) -> Optional[str]:
+  return None
+
+def draw_cycle(order: ShuffleOrder) -> list[int]:
+  drawn: list[int] = []
+  while (track_id := order.peek()) is not None:
+    order.mark_played(track_id)
+    drawn.append(track_id)
+  return drawn
+
+def test_a_cycle_plays_every_track_once():
+  playlist = Playlist(f"/t{index}.mp3" for index in range(200))
+  drawn = draw_cycle(ShuffleOrder(playlist, no_artist, seed=1))
+  assert sorted(drawn) == sorted(playlist.ids())
+  assert drawn != playlist.ids()
+
+def test_the_playlist_is_not_reordered():
+  paths = [f"/t{index}.mp3" for index in range(50)]
+  playlist = Playlist(paths)
+  draw_cycle(ShuffleOrder(playlist, no_artist, seed=2))
+  assert list(playlist) == paths
+
+def test_peek_is_stable_until_played():
+  playlist = Playlist(f"/t{index}.mp3" for index in range(20))
+  order = ShuffleOrder(playlist, no_artist, seed=3)
+  upcoming = order.peek()
+  assert order.peek() == upcoming
+
+def test_tracks_chosen_by_hand_are_not_repeated():
+  playlist = Playlist(f"/t{index}.mp3" for index in range(30))
+  order = ShuffleOrder(playlist, no_artist, seed=4)
+  chosen = playlist.id_at(7)
+  order.mark_played(chosen)
+  drawn = draw_cycle(order)
+  assert chosen not in drawn
+  assert sorted(drawn + [chosen]) == sorted(playlist.ids())
+
+def test_added_tracks_join_and_removed_ones_are_skipped():
+  playlist = Playlist(f"/t{index}.mp3" for index in range(30))
+  order = ShuffleOrder(playlist, no_artist, seed=5)
+  first: list[int] = []
+  for _ in range(10):
+    first.append(order.peek())
+    order.mark_played(first[-1])
+  removed = next(track_id for track_id in playlist.ids() if track_id not in first)
+  playlist.pop(playlist.index_of(removed))
+  added = playlist.append("/new.mp3")
+  rest = draw_cycle(order)
+  assert removed not in rest
+  assert added in rest
+  assert sorted(first + rest) == sorted(playlist.ids())
+
+def test_reset_starts_a_new_cycle():
+  playlist = Playlist(f"/t{index}.mp3" for index in range(10))
+  order = ShuffleOrder(playlist, no_artist, seed=6)
+  draw_cycle(order)
+  assert order.peek() is None
+  order.reset()
+  assert sorted(draw_cycle(order)) == sorted(playlist.ids())
+
+def test_artists_are_spread_out():
+  artists = [f"artist-{index % 10}" for index in range(100)]
+  playlist = Playlist(f"/t{index}.mp3" for index in range(100))
+  order = ShuffleOrder(playlist, lambda track_id: artists[playlist.index_of(track_id)], seed=7)
+  heard = [artists[playlist.index_of(track_id)] for track_id in draw_cycle(order)[:50]]  # late in a cycle few artists are left
+  repeats = sum(artist in heard[max(0, position - SPREAD_DISTANCE + 1):position] for position, artist in enumerate(heard))
+  assert repeats <= 5
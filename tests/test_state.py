@@ -0,0 +1,113 @@
+import threading
+
+import pytest
+
+from state import WAKE_EVENT, CommandQueue, PlayerState, command
+
+class FakeRoot:
+  """Records what CommandQueue asks of a Tk root."""
+
+  def __init__(self) -> None:
+    self.bindings: dict = {}
+    self.idle: list = []
+    self.events: list[str] = []
+
+  def bind(self, sequence, handler):
+    self.bindings[sequence] = handler
+
+  def unbind(self, sequence):
+    del self.bindings[sequence]
+
+  def after_idle(self, callback):
+    self.idle.append(callback)
+
+  def event_generate(self, sequence, when):
+    self.events.append(sequence)
+
+class Counter:
+  def __init__(self) -> None:
+    self.settled = 0
+    self.commands = CommandQueue(self._settle)
+    self.value = 0
+
+  def _settle(self) -> None:
+    self.settled += 1
+
+  @command
+  def add(self, amount: int) -> int:
+    self.value += amount
+    return self.value
+
+  @command
+  def add_twice(self, amount: int) -> int:
+    self.add(amount)
+    return self.add(amount)
+
+def in_thread(function):
+  """Call a function on another thread and return its result, or raise its exception here."""
+  outcome: list = []
+
+  def run() -> None:
+    try:
+      outcome.append((True, function()))
+    except Exception as e:
+      outcome.append((False, e))
+  thread = threading.Thread(target=run)
+  thread.start()
+  thread.join()
+  succeeded, value = outcome[0]
+  if not succeeded:
+    raise value
+  return value
+
+def test_commands_run_at_once_on_the_owner_and_settle_once():
+  counter = Counter()
+  assert counter.add_twice(2) == 4
+  assert counter.settled == 1
+
+def test_commands_from_other_threads_wait_for_the_owner():
+  counter = Counter()
+  future = in_thread(lambda: counter.add(5))
+  assert counter.value == 0 and not future.done()
+  assert counter.commands.run_pending() == 1
+  assert future.result(timeout=1) == 5
+
+def test_failures_reach_the_caller():
+  queue = CommandQueue()
+  future = in_thread(lambda: queue.submit(lambda: 1 / 0))
+  queue.run_pending()
+  with pytest.raises(ZeroDivisionError):
+    future.result(timeout=1)
+
+def test_only_the_owner_runs_pending_commands():
+  queue = CommandQueue()
+  with pytest.raises(RuntimeError):
+    in_thread(lambda: queue.run_pending())
+
+def test_an_attached_queue_wakes_the_loop_once_per_batch():
+  counter = Counter()
+  root = FakeRoot()
+  counter.commands.attach(root)
+  futures = in_thread(lambda: [counter.add(1) for _ in range(3)])
+  assert root.events == [WAKE_EVENT]
+  root.bindings[WAKE_EVENT](None)
+  assert [future.result(timeout=1) for future in futures] == [1, 2, 3]
+  in_thread(lambda: counter.add(1))
+  assert root.events == [WAKE_EVENT, WAKE_EVENT]
+  counter.commands.detach()
+  assert root.bindings == {}
+
+def test_commands_queued_before_attaching_run_when_idle():
+  counter = Counter()
+  future = in_thread(lambda: counter.add(7))
+  root = FakeRoot()
+  counter.commands.attach(root)
+  for callback in root.idle:
+    callback()
+  assert future.result(timeout=1) == 7
+
+def test_state_changes():
+  before = PlayerState()
+  after = PlayerState(is_playing=True, volume=0.8)
+  assert after.changes_from(before) == {"is_playing", "volume"}
+  assert before.changes_from(before) == frozenset()
@@ -0,0 +1,23 @@
+import marshal
+import os
+
+from watch import FolderWatcher
+
+def test_owners_of_watched_folders_are_persisted(tmp_path):
+  snapshot = str(tmp_path / "watch.snapshot")
+  folder = tmp_path / "music"
+  os.makedirs(folder / "album")
+  watcher = FolderWatcher(snapshot, use_inotify=False)
+  watcher.watch(str(folder), "Library")
+  watcher.close()
+  reopened = FolderWatcher(snapshot, use_inotify=False)
+  assert reopened.owner_of(str(folder / "album" / "track.mp3")) == "Library"
+  assert reopened.owner_of(str(tmp_path / "elsewhere.mp3")) is None
+
+def test_snapshots_without_owners_still_load(tmp_path):
+  snapshot = str(tmp_path / "watch.snapshot")
+  with open(snapshot, "wb") as file:
+    marshal.dump((1, [str(tmp_path)], {}), file)
+  watcher = FolderWatcher(snapshot, use_inotify=False)
+  assert watcher.folders == [str(tmp_path)]
+  assert watcher.owner_of(str(tmp_path / "track.mp3")) is None